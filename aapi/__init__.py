@@ -1,3 +1,14 @@
+from aapi.assertion import (
+    JsonPath,
+    JsonSchema,
+    ResponseAssertion,
+    StatusAssertion,
+    EqualAssertion,
+    SchemaAssertion,
+    LatencyAssertion,
+    CaseAssertion,
+    compile_assertions
+)
 from aapi.parser import (
     RequestType,
     EventScript,
@@ -15,7 +26,101 @@ from aapi.parser import (
     Json2Template,
     Json2Postman
 )
+from aapi.variable import (
+    VariableTemplate,
+    PreparedRequest,
+    CompiledRequest,
+    HmacSignHook,
+    VariableEngine,
+    compile_value,
+    timestamp_hook,
+    load_environments
+)
 from aapi.creator import (
     ApiCreator,
     PostmanCreator
 )
+from aapi.pipeline import (
+    TemplateSource,
+    DirectoryTemplateSource,
+    MemoryTemplateSource,
+    OutputSink,
+    FileSink,
+    StreamSink,
+    BytesSink,
+    CallbackSink,
+    TemplateSink,
+    DirectoryTemplateSink,
+    MemoryTemplateSink,
+    CallbackTemplateSink,
+    as_sink,
+    load_json,
+    open_file,
+    split_compression
+)
+from aapi.store import (
+    ResultSink,
+    SqliteResultStore
+)
+from aapi.runner import (
+    CaseResult,
+    LatencyHistogram,
+    RunSummary,
+    RetryPolicy,
+    CircuitBreaker,
+    CaseRunner,
+    response_shape
+)
+from aapi.index import (
+    TemplateSelector,
+    TemplateIndex,
+    compile_glob
+)
+from aapi.casestore import (
+    CaseTable,
+    CaseStore
+)
+from aapi.history import RunHistory
+from aapi.minimize import (
+    PinnedCases,
+    minimize_results,
+    load_pinned
+)
+from aapi.tracing import (
+    PhaseStats,
+    RequestTracer
+)
+from aapi.distributed import DistributedRunner
+from aapi.mock import HarMockServer
+from aapi.stream import (
+    JsonArrayReader,
+    iter_json_array,
+    iter_har_entries
+)
+from aapi.replay import (
+    ReplayReport,
+    HarReplayer
+)
+from aapi.waterfall import (
+    HarRequest,
+    WaterfallReport,
+    HarAnalyzer,
+    endpoint_key
+)
+from aapi.lint import (
+    TemplateError,
+    TemplateLinter
+)
+from aapi.shadow import (
+    ShadowResponse,
+    ShadowReport,
+    ShadowComparer,
+    diff_json
+)
+from aapi.watch import (
+    TemplateWatcher,
+    PollingWatcher,
+    InotifyWatcher,
+    IncrementalPostmanBuilder,
+    create_watcher
+)
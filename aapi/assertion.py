@@ -0,0 +1,469 @@
+import json
+import re
+from abc import abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+
+if TYPE_CHECKING:
+    from aapi.parser import ResponseCase
+
+STEP_KEY = 'key'
+STEP_INDEX = 'index'
+STEP_WILDCARD = 'wildcard'
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_$][\w$]*$')
+_PATH_TOKEN = re.compile(r"\.([A-Za-z_$][\w$-]*)|\.\*|\[\*\]|\[(-?\d+)\]|\['([^']*)'\]|\[\"([^\"]*)\"\]")
+
+
+class JsonPath(object):
+    """
+    json path 表达式，编译一次后重复使用，
+    只支持 $、.key、['key']、[index]、[*]、.* 语法，单次求值访问的节点数有上限
+    """
+    MAX_NODES = 1024
+
+    def __init__(self, expression: str, max_nodes: int = MAX_NODES):
+        self._expression = expression
+        self._steps = self.compile(expression)
+        self._max_nodes = max_nodes
+
+    @property
+    def expression(self) -> str:
+        return self._expression
+
+    @property
+    def steps(self) -> Tuple[Tuple[str, Any], ...]:
+        """
+        编译后的取值步骤
+        :return:
+        """
+        return self._steps
+
+    @staticmethod
+    def compile(expression: str) -> Tuple[Tuple[str, Any], ...]:
+        """
+        将表达式编译为取值步骤
+        :param expression:
+        :return:
+        """
+        if not expression.startswith('$'):
+            raise ValueError("json path must start with '$': {}".format(expression))
+
+        steps = []
+        position = 1
+        while position < len(expression):
+            match = _PATH_TOKEN.match(expression, position)
+            if match is None:
+                raise ValueError("invalid json path: {expression} at {position}".format(
+                    expression=expression, position=position))
+            key, index, single_key, double_key = match.groups()
+            if key is not None:
+                steps.append((STEP_KEY, key))
+            elif index is not None:
+                steps.append((STEP_INDEX, int(index)))
+            elif single_key is not None or double_key is not None:
+                steps.append((STEP_KEY, single_key if single_key is not None else double_key))
+            else:
+                steps.append((STEP_WILDCARD, None))
+            position = match.end()
+        return tuple(steps)
+
+    def find(self, data: Any) -> List[Any]:
+        """
+        返回所有匹配的值，超过节点上限时截断结果
+        :param data:
+        :return:
+        """
+        return self._find(data, self._steps)
+
+    def mask(self, data: Any, value: Any = None) -> int:
+        """
+        将所有匹配的节点原地替换为 value，用于忽略响应中易变的字段
+        :param data:
+        :param value:
+        :return: 替换的节点数
+        """
+        if not self._steps:
+            return 0
+        step, key = self._steps[-1]
+        count = 0
+        for parent in self._find(data, self._steps[:-1]):
+            if isinstance(parent, dict):
+                keys = [key] if step == STEP_KEY and key in parent else list(parent) if step == STEP_WILDCARD else []
+            elif isinstance(parent, list):
+                keys = [key] if step == STEP_INDEX and -len(parent) <= key < len(parent) else \
+                    list(range(len(parent))) if step == STEP_WILDCARD else []
+            else:
+                keys = []
+            for k in keys:
+                parent[k] = value
+            count += len(keys)
+        return count
+
+    def _find(self, data: Any, steps: Tuple[Tuple[str, Any], ...]) -> List[Any]:
+        nodes = [data]
+        visited = 0
+        for step, value in steps:
+            matched = []
+            for node in nodes:
+                if step == STEP_KEY:
+                    if isinstance(node, dict) and value in node:
+                        matched.append(node[value])
+                elif step == STEP_INDEX:
+                    if isinstance(node, list) and -len(node) <= value < len(node):
+                        matched.append(node[value])
+                elif isinstance(node, dict):
+                    matched.extend(node.values())
+                elif isinstance(node, list):
+                    matched.extend(node)
+                visited += 1
+                if visited >= self._max_nodes:
+                    break
+            nodes = matched[:self._max_nodes]
+            if not nodes or visited >= self._max_nodes:
+                break
+        return nodes
+
+    def javascript(self, variable: str) -> Optional[str]:
+        """
+        转换为 javascript 取值表达式，包含通配符时无法转换，返回 None
+        :param variable:
+        :return:
+        """
+        accessor = variable
+        for step, value in self._steps:
+            if step == STEP_WILDCARD:
+                return None
+            if step == STEP_KEY and _IDENTIFIER.match(value):
+                accessor += '.{}'.format(value)
+            else:
+                accessor += '[{}]'.format(json.dumps(value))
+        return accessor
+
+
+SCHEMA_TYPES = {
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+    'string': lambda v: isinstance(v, str),
+    'integer': lambda v: isinstance(v, int) and not isinstance(v, bool),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'boolean': lambda v: isinstance(v, bool),
+    'null': lambda v: v is None,
+}
+
+
+class JsonSchema(object):
+    """
+    json schema 的子集，编译为校验函数后重复使用，
+    支持 type、enum、required、properties、additionalProperties、items、
+    minimum、maximum、minLength、maxLength、minItems、maxItems
+    """
+    MAX_ERRORS = 32
+
+    def __init__(self, schema: Dict, max_errors: int = MAX_ERRORS):
+        self._schema = schema
+        self._max_errors = max_errors
+        self._validator = self.compile(schema, '$')
+
+    @property
+    def schema(self) -> Dict:
+        return self._schema
+
+    def compile(self, schema: Dict, location: str) -> Callable[[Any, str, List[str]], None]:
+        """
+        将 schema 编译为校验函数，校验函数签名为 (value, path, errors)
+        :param schema:
+        :param location: schema 自身的位置，用于定位 schema 的书写错误
+        :return:
+        """
+        if not isinstance(schema, dict):
+            raise ValueError("schema must be object at {}".format(location))
+
+        checks = []
+        schema_type = schema.get('type')
+        if schema_type is not None:
+            type_names = schema_type if isinstance(schema_type, list) else [schema_type]
+            for type_name in type_names:
+                if type_name not in SCHEMA_TYPES:
+                    raise ValueError("unknown schema type {type} at {location}".format(
+                        type=type_name, location=location))
+            type_checks = [SCHEMA_TYPES[t] for t in type_names]
+
+            def check_type(value, path, errors):
+                if not any(c(value) for c in type_checks):
+                    errors.append('{path}: expect type {type}'.format(path=path, type='/'.join(type_names)))
+                    return False
+                return True
+
+            checks.append(check_type)
+
+        if 'enum' in schema:
+            enum = schema['enum']
+
+            def check_enum(value, path, errors):
+                if value not in enum:
+                    errors.append('{path}: {value!r} not in enum'.format(path=path, value=value))
+                return True
+
+            checks.append(check_enum)
+
+        for keyword, compare, sized in [('minimum', lambda v, b: v >= b, False),
+                                        ('maximum', lambda v, b: v <= b, False),
+                                        ('minLength', lambda v, b: len(v) >= b, True),
+                                        ('maxLength', lambda v, b: len(v) <= b, True),
+                                        ('minItems', lambda v, b: len(v) >= b, True),
+                                        ('maxItems', lambda v, b: len(v) <= b, True)]:
+            if keyword not in schema:
+                continue
+            checks.append(self._compile_bound(keyword, schema[keyword], compare, sized))
+
+        required = schema.get('required', [])
+        properties = {k: self.compile(v, '{}.properties.{}'.format(location, k))
+                      for k, v in schema.get('properties', {}).items()}
+        additional = schema.get('additionalProperties', True)
+        if required or properties or additional is not True:
+            def check_object(value, path, errors):
+                if not isinstance(value, dict):
+                    return True
+                for key in required:
+                    if key not in value:
+                        errors.append('{path}: missing required {key}'.format(path=path, key=key))
+                for key, item in value.items():
+                    validator = properties.get(key)
+                    if validator is not None:
+                        validator(item, '{}.{}'.format(path, key), errors)
+                    elif additional is False:
+                        errors.append('{path}: unexpected property {key}'.format(path=path, key=key))
+                    if len(errors) >= self._max_errors:
+                        break
+                return True
+
+            checks.append(check_object)
+
+        if 'items' in schema:
+            items = self.compile(schema['items'], '{}.items'.format(location))
+
+            def check_array(value, path, errors):
+                if not isinstance(value, list):
+                    return True
+                for index, item in enumerate(value):
+                    items(item, '{}[{}]'.format(path, index), errors)
+                    if len(errors) >= self._max_errors:
+                        break
+                return True
+
+            checks.append(check_array)
+
+        def validate(value, path, errors):
+            for check in checks:
+                if len(errors) >= self._max_errors or not check(value, path, errors):
+                    break
+
+        return validate
+
+    @staticmethod
+    def _compile_bound(keyword: str, bound: Any, compare: Callable, sized: bool):
+        def check_bound(value, path, errors):
+            if sized and not isinstance(value, (str, list)):
+                return True
+            if not sized and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+                return True
+            if not compare(value, bound):
+                errors.append('{path}: {keyword} {bound}'.format(path=path, keyword=keyword, bound=bound))
+            return True
+
+        return check_bound
+
+    def validate(self, data: Any, path: str = '$') -> List[str]:
+        """
+        校验数据，返回错误列表，错误数量有上限
+        :param data:
+        :param path:
+        :return:
+        """
+        errors = []
+        self._validator(data, path, errors)
+        return errors[:self._max_errors]
+
+
+class ResponseAssertion(object):
+    """
+    响应断言抽象类
+    """
+
+    @abstractmethod
+    def check(self, response: 'ResponseCase') -> Optional[str]:
+        """
+        执行断言
+        :param response:
+        :return: 断言通过返回 None，否则返回失败原因
+        """
+        pass
+
+    @abstractmethod
+    def scripts(self) -> List[str]:
+        """
+        转换为 postman 的 pm.test 脚本
+        :return:
+        """
+        pass
+
+
+class StatusAssertion(ResponseAssertion):
+    """
+    响应状态码断言
+    """
+
+    def __init__(self, expect: Any):
+        self._expect = expect if isinstance(expect, list) else [expect]
+
+    def check(self, response: 'ResponseCase') -> Optional[str]:
+        if response.status in self._expect:
+            return None
+        return 'status {status} not in {expect}'.format(status=response.status, expect=self._expect)
+
+    def scripts(self) -> List[str]:
+        return [
+            "pm.test(\"返回状态码为 {}\", function () {{".format('/'.join(str(s) for s in self._expect)),
+            "    pm.expect(pm.response.code).to.be.oneOf({});".format(json.dumps(self._expect)),
+            "});"
+        ]
+
+
+class EqualAssertion(ResponseAssertion):
+    """
+    json path 取值相等断言，所有匹配值都需要与期望值相等
+    """
+
+    def __init__(self, path: str, expect: Any):
+        self._path = JsonPath(path)
+        self._expect = expect
+
+    def check(self, response: 'ResponseCase') -> Optional[str]:
+        values = self._path.find(response.json())
+        if not values:
+            return '{path} not found'.format(path=self._path.expression)
+        for value in values:
+            if value != self._expect:
+                return '{path} {value!r} != {expect!r}'.format(
+                    path=self._path.expression, value=value, expect=self._expect)
+        return None
+
+    def scripts(self) -> List[str]:
+        accessor = self._path.javascript('jsonData')
+        if accessor is None:
+            return []
+        return [
+            "pm.test(\"返回 {path} 为 {expect}\", function () {{".format(
+                path=self._path.expression, expect=json.dumps(self._expect, ensure_ascii=False).replace('"', '\\"')),
+            "    var jsonData = pm.response.json();",
+            "    pm.expect({accessor}).to.eql({expect});".format(
+                accessor=accessor, expect=json.dumps(self._expect, ensure_ascii=False)),
+            "});"
+        ]
+
+
+class SchemaAssertion(ResponseAssertion):
+    """
+    响应体 json schema 断言
+    """
+
+    def __init__(self, schema: Dict):
+        self._schema = JsonSchema(schema)
+
+    def check(self, response: 'ResponseCase') -> Optional[str]:
+        errors = self._schema.validate(response.json())
+        if not errors:
+            return None
+        return '; '.join(errors)
+
+    def scripts(self) -> List[str]:
+        return [
+            "pm.test(\"返回结构符合 schema\", function () {",
+            "    pm.response.to.have.jsonSchema({});".format(json.dumps(self._schema.schema, ensure_ascii=False)),
+            "});"
+        ]
+
+
+class LatencyAssertion(ResponseAssertion):
+    """
+    响应耗时断言，单位毫秒
+    """
+
+    def __init__(self, limit: float):
+        self._limit = limit
+
+    def check(self, response: 'ResponseCase') -> Optional[str]:
+        if response.latency <= self._limit:
+            return None
+        return 'latency {latency:.1f}ms > {limit}ms'.format(latency=response.latency, limit=self._limit)
+
+    def scripts(self) -> List[str]:
+        return [
+            "pm.test(\"响应时间小于 {}ms\", function () {{".format(self._limit),
+            "    pm.expect(pm.response.responseTime).to.be.at.most({});".format(self._limit),
+            "});"
+        ]
+
+
+class CaseAssertion(object):
+    """
+    单个用例的断言集合，同一模板同一类型（true/false）的用例共享同一个对象
+    """
+
+    def __init__(self, assertions: List[ResponseAssertion]):
+        self._assertions = assertions
+
+    @property
+    def assertions(self) -> List[ResponseAssertion]:
+        return self._assertions
+
+    def check(self, response: 'ResponseCase') -> List[str]:
+        """
+        执行全部断言
+        :param response:
+        :return: 失败原因列表，全部通过时为空列表
+        """
+        failures = []
+        for assertion in self._assertions:
+            failure = assertion.check(response)
+            if failure is not None:
+                failures.append(failure)
+        return failures
+
+    def scripts(self) -> List[str]:
+        lines = []
+        for assertion in self._assertions:
+            lines.extend(assertion.scripts())
+        return lines
+
+
+def compile_assertions(data: Dict, flag: str) -> CaseAssertion:
+    """
+    编译模板中 assert 标签下对应 true/false 的断言声明，
+    未声明时默认断言返回的 code 为 1（true）或 0（false）
+    :param data: 模板数据
+    :param flag: true/false
+    :return:
+    """
+    declare = (data.get('assert') or {}).get(flag)
+    if declare is None:
+        return CaseAssertion([EqualAssertion('$.code', 1 if flag == 'true' else 0)])
+
+    assertions = []
+    if 'status' in declare:
+        assertions.append(StatusAssertion(declare['status']))
+    for path, expect in declare.get('equal', {}).items():
+        assertions.append(EqualAssertion(path, expect))
+    if 'schema' in declare:
+        assertions.append(SchemaAssertion(declare['schema']))
+    if 'latency' in declare:
+        assertions.append(LatencyAssertion(declare['latency']))
+    return CaseAssertion(assertions)
@@ -0,0 +1,348 @@
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import (
+    Iterator,
+    List,
+    Dict,
+    Optional,
+    Any
+)
+
+from aiohttp import hdrs
+
+from aapi.assertion import (
+    CaseAssertion,
+    compile_assertions
+)
+from aapi.index import TemplateSelector
+from aapi.parser import (
+    ApiParser,
+    RequestCase
+)
+from aapi.pipeline import (
+    TemplateSource,
+    open_file
+)
+from aapi.plan import (
+    FLAGS,
+    GenerationPlan
+)
+
+# 文件头：魔数、头部 json 的长度，之后为 4 字节对齐的下标数组
+STORE_MAGIC = b'AAPICS1\n'
+STORE_HEADER = struct.Struct('<Q')
+INDEX_TYPE = 'i'
+INDEX_SIZE = array.array(INDEX_TYPE).itemsize
+
+
+class CaseTable(object):
+    """
+    单个模板展开后的用例，按列存储。
+    模板数据只保存一份，生成计划中各取值槽的取值列表即该模板的取值表，每个不同的取值只保存一次；
+    每个用例只记录各槽的取值下标，全部用例的下标连续存放在一个整数数组中。
+    用例按 true、false 的顺序排列，访问时才构建 RequestCase
+    """
+
+    def __init__(self, parser: ApiParser, uri: str, template: Dict, true_count: int, count: int,
+                 width: int, indices: Any):
+        """
+        :param parser: 构建用例使用的解析器，提供 host 与取值池的根目录
+        :param uri: 请求路径
+        :param template: 模板数据
+        :param true_count: true 用例的数量
+        :param count: 用例总数
+        :param width: 每个用例的下标个数，即取值槽的数量
+        :param indices: 全部用例的取值下标，array 或者 memoryview
+        """
+        self._parser = parser
+        self._uri = uri
+        self._template = template
+        self._true_count = true_count
+        self._count = count
+        self._width = width
+        self._indices = indices
+        self._plan = None
+        self._assertions = {}
+
+    @property
+    def uri(self) -> str:
+        return self._uri
+
+    @property
+    def template(self) -> Dict:
+        return self._template
+
+    @property
+    def true_count(self) -> int:
+        return self._true_count
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def indices(self) -> Any:
+        return self._indices
+
+    @classmethod
+    def expand(cls, parser: ApiParser, uri: str, group_key: str, template: Dict) -> Optional['CaseTable']:
+        """
+        展开模板，只记录取值下标，与 ApiParser.parse_template 生成的用例一致
+        :param parser:
+        :param uri:
+        :param group_key: 分组标识，作为参数组合的随机种子
+        :param template:
+        :return: 不支持的请求方法返回 None
+        """
+        method = template.get('method')
+        if method is None:
+            raise ValueError("can't found method in case json file with: {}".format(uri))
+        if method.upper() not in [hdrs.METH_GET, hdrs.METH_POST]:
+            return None
+
+        rand = parser.seed_group(group_key)
+        plan = parser.create_plan(template)
+        indices = array.array(INDEX_TYPE)
+        if plan is None:
+            return cls(parser, uri, template, 1, 1, 0, indices)
+
+        counts = {}
+        for flag in FLAGS:
+            combinations = plan.expand_indices(flag, rand)
+            counts[flag] = len(combinations)
+            for combination in combinations:
+                indices.extend(combination)
+        table = cls(parser, uri, template, counts['true'], counts['true'] + counts['false'],
+                    len(plan.slots), indices)
+        table._plan = plan
+        return table
+
+    def _get_plan(self) -> Optional[GenerationPlan]:
+        if self._plan is None and self._width:
+            self._plan = self._parser.create_plan(self._template)
+        return self._plan
+
+    def _get_assertion(self, flag: str) -> CaseAssertion:
+        # 同一模板同类用例共享断言
+        assertion = self._assertions.get(flag)
+        if assertion is None:
+            assertion = self._assertions[flag] = compile_assertions(self._template, flag)
+        return assertion
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> RequestCase:
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError('case index out of range: {}'.format(position))
+
+        flag, index = ('true', position) if position < self._true_count else \
+            ('false', position - self._true_count)
+        plan = self._get_plan()
+        if plan is None:
+            params = {}
+        else:
+            start = position * self._width
+            params = plan.build(flag, tuple(self._indices[start:start + self._width]))
+        return self._parser.create_case(self._uri, self._uri, self._template, flag, index, params,
+                                        self._get_assertion(flag))
+
+    def __iter__(self) -> Iterator[RequestCase]:
+        for position in range(self._count):
+            yield self[position]
+
+
+class CaseStore(object):
+    """
+    按列存储的用例集合，模板只展开一次，可以保存到文件，
+    生成集合文件、分片与执行直接载入，不需要重新展开。
+    文件中的下标数组通过 mmap 按需读取，多个进程载入同一文件时共享页缓存
+    """
+
+    def __init__(self, parser: ApiParser, groups: Dict[str, Any], prerequest: Dict = None):
+        """
+        :param parser:
+        :param groups: 分组标识 -> CaseTable，不支持的请求方法为 None
+        :param prerequest: 前置脚本文件的数据
+        """
+        self._parser = parser
+        self._groups = groups
+        self._prerequest = prerequest
+
+    @property
+    def parser(self) -> ApiParser:
+        return self._parser
+
+    @property
+    def groups(self) -> Dict[str, Any]:
+        """
+        与 ApiParser.create_request_cases 的返回值格式相同，每次返回新的字典
+        :return:
+        """
+        groups = {}
+        if self._prerequest is not None:
+            groups['prerequest'] = self._parser.parse_event_data('prerequest', self._prerequest)
+        groups.update(self._groups)
+        return groups
+
+    @property
+    def group_keys(self) -> List[str]:
+        return list(self._groups)
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self._groups.values() if table is not None)
+
+    def count(self, group_key: str) -> int:
+        table = self._groups[group_key]
+        return len(table) if table is not None else 0
+
+    def filter(self, selector: TemplateSelector) -> 'CaseStore':
+        """
+        只包含满足筛选条件的模板的用例集合
+        :param selector:
+        :return:
+        """
+        return self.select([k for k, table in self._groups.items()
+                            if table is not None and selector.match(table.uri, table.template)])
+
+    def select(self, group_keys: List[str]) -> 'CaseStore':
+        """
+        只包含指定分组的用例集合，用于分片
+        :param group_keys:
+        :return:
+        """
+        return CaseStore(self._parser, {k: self._groups[k] for k in group_keys if k in self._groups},
+                         self._prerequest)
+
+    @classmethod
+    def expand(cls, parser: ApiParser, files: List[str] = None, source: TemplateSource = None) -> 'CaseStore':
+        """
+        展开模板文件夹（或者模板来源）中的全部模板
+        :param parser:
+        :param files: 只展开指定的模板文件，默认为目录下的全部文件
+        :param source: 模板来源，指定时不读取模板文件夹
+        :return:
+        """
+        if source is not None:
+            templates = source.iter_templates()
+        else:
+            templates = ((parser.template_path(f), cls._load_template(f))
+                         for f in (parser.get_all_files() if files is None else files))
+
+        groups = {}
+        prerequest = None
+        for file_path, template in templates:
+            if parser.is_prerequest_name(file_path):
+                prerequest = template
+                continue
+            uri, group_key = parser.template_key(file_path, template)
+            groups[group_key] = CaseTable.expand(parser, uri, group_key, template)
+        return cls(parser, groups, prerequest)
+
+    @staticmethod
+    def _load_template(file_path: str) -> Dict:
+        with open_file(file_path) as f:
+            return json.load(f)
+
+    def save(self, file_path: str):
+        """
+        保存到文件，头部为 json 格式的模板与元数据，之后为各模板的下标数组
+        :param file_path:
+        :return:
+        """
+        entries = []
+        offset = 0
+        for group_key, table in self._groups.items():
+            if table is None:
+                entries.append({'key': group_key, 'count': None})
+                continue
+            entries.append({
+                'key': group_key,
+                'uri': table.uri,
+                'template': table.template,
+                'true': table.true_count,
+                'count': len(table),
+                'width': table.width,
+                'offset': offset,
+            })
+            offset += len(table) * table.width * INDEX_SIZE
+
+        header = json.dumps({
+            'host': self._parser.host,
+            'dir_url': self._parser.dir_url,
+            'seed': self._parser.seed,
+            'byteorder': sys.byteorder,
+            'prerequest': self._prerequest,
+            'groups': entries,
+        }, ensure_ascii=False).encode('utf-8')
+
+        temp_path = '{}.tmp'.format(file_path)
+        with open(temp_path, 'wb') as f:
+            f.write(STORE_MAGIC)
+            f.write(STORE_HEADER.pack(len(header)))
+            f.write(header)
+            f.write(b'\0' * (-f.tell() % INDEX_SIZE))
+            for table in self._groups.values():
+                if table is not None:
+                    f.write(table.indices if isinstance(table.indices, array.array) else table.indices.tobytes())
+        os.replace(temp_path, file_path)
+
+    @staticmethod
+    def _read_header(f: Any, file_path: str) -> Dict[str, Any]:
+        if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+            raise ValueError("not a case store file: {}".format(file_path))
+        length, = STORE_HEADER.unpack(f.read(STORE_HEADER.size))
+        return json.loads(f.read(length).decode('utf-8'))
+
+    @classmethod
+    def read_header(cls, file_path: str) -> Dict[str, Any]:
+        """
+        只读取文件头，包含展开时的 host、模板文件夹 dir_url 与随机种子 seed
+        :param file_path:
+        :return:
+        """
+        with open(file_path, 'rb') as f:
+            return cls._read_header(f, file_path)
+
+    @classmethod
+    def load(cls, file_path: str, host: str = None) -> 'CaseStore':
+        """
+        载入保存的用例集合，下标数组按需读取
+        :param file_path:
+        :param host: 覆盖保存时的 host
+        :return:
+        """
+        with open(file_path, 'rb') as f:
+            header = cls._read_header(f, file_path)
+            start = f.tell() + (-f.tell() % INDEX_SIZE)
+            # 没有下标数组时不能 mmap，映射在关闭文件后仍然有效
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > start else b''
+
+        parser = ApiParser(host=header['host'] if host is None else host, dir_url=header['dir_url'],
+                           seed=header['seed'])
+        swap = header['byteorder'] != sys.byteorder
+        view = memoryview(data)
+        groups = {}
+        for entry in header['groups']:
+            if entry['count'] is None:
+                groups[entry['key']] = None
+                continue
+            # 取值池变化后下标可能越界，需要重新展开
+            if parser.template_key(entry['uri'], entry['template'])[1] != entry['key']:
+                raise ValueError("case store {path} is stale: pool of {uri} changed".format(
+                    path=file_path, uri=entry['uri']))
+            size = entry['count'] * entry['width'] * INDEX_SIZE
+            indices = view[start + entry['offset']:start + entry['offset'] + size].cast(INDEX_TYPE)
+            if swap:
+                indices = array.array(INDEX_TYPE, indices)
+                indices.byteswap()
+            groups[entry['key']] = CaseTable(parser, entry['uri'], entry['template'], entry['true'],
+                                             entry['count'], entry['width'], indices)
+
+        return cls(parser, groups, header['prerequest'])
@@ -3,8 +3,11 @@ import logging
 import os
 from abc import abstractmethod
 from typing import (
+    Iterator,
     Dict,
     List,
+    Optional,
+    Set,
     Any
 )
 
@@ -14,6 +17,13 @@ from aapi import (
     RequestType,
     RequestCase
 )
+from aapi.pipeline import (
+    OutputSink,
+    as_sink,
+    open_file,
+    split_compression
+)
+from aapi.variable import VariableTemplate
 
 
 class ApiCreator(object):
@@ -27,11 +37,21 @@ class ApiCreator(object):
 
 
 class PostmanCreator(ApiCreator):
+    HOIST_HEADERS = 'headers'
+    HOIST_ALL = 'all'
 
-    def __init__(self, name, output_url: str):
+    def __init__(self, name, output_url: str, sink: Any = None, hoist: str = None):
+        """
+        :param name: 集合名称
+        :param output_url: 输出文件或文件夹
+        :param sink: 输出目标，可以是 OutputSink、文件对象或回调函数，指定时不写入 output_url
+        :param hoist: 将分组内所有用例相同的请求头（headers）或请求头与 query（all）提升到分组的前置脚本中
+        """
         super().__init__()
         self._name = name
         self._output_url = output_url
+        self._sink = as_sink(sink) if sink is not None else None
+        self._hoist = hoist
 
     def create_info(self) -> Dict:
         return {
@@ -44,13 +64,7 @@ class PostmanCreator(ApiCreator):
         return [{
             "listen": "test",
             "script": {
-                "exec": [
-                    "pm.test(\"返回处理码为 1\", function () {",
-                    "    var jsonData = pm.response.json();",
-                    "    pm.expect(jsonData.code).to.eql({result});".format(
-                        result="1" if case.expect_result else "0"),
-                    "});"
-                ],
+                "exec": case.assertion.scripts(),
                 "type": "text/javascript"
             }
         }]
@@ -125,7 +139,21 @@ class PostmanCreator(ApiCreator):
                 items.append(item)
             return items
 
-    def create_request(self, request_case: RequestCase) -> Dict:
+    def create_request(self, request_case: RequestCase, skip_headers: Set[str] = None,
+                       skip_query: Set[str] = None) -> Dict:
+        """
+        :param request_case:
+        :param skip_headers: 已经提升到分组前置脚本中的请求头
+        :param skip_query: 已经提升到分组前置脚本中的 query
+        :return:
+        """
+        headers = request_case.headers
+        if skip_headers:
+            headers = {k: v for k, v in headers.items() if k not in skip_headers}
+        query = request_case.query
+        if query is not None and skip_query:
+            query = {k: v for k, v in query.items() if k not in skip_query} or None
+
         request_content = {
             'auth': {
                 'type': 'noauth'
@@ -134,13 +162,13 @@ class PostmanCreator(ApiCreator):
             'header': [{
                 'key': hk,
                 'value': hv
-            } for hk, hv in request_case.headers.items()],
+            } for hk, hv in headers.items()],
             'url': {
                 'raw': '{host}{api}?{query}'.format(
                     host=request_case.host,
                     api=request_case.uri,
-                    query='&'.join(['{k}={v}'.format(k=k, v=v) for k, v in request_case.query.items()])
-                ) if request_case.query is not None else '{host}{api}'.format(
+                    query='&'.join(['{k}={v}'.format(k=k, v=v) for k, v in query.items()])
+                ) if query is not None else '{host}{api}'.format(
                     host=request_case.host,
                     api=request_case.uri
                 ),
@@ -155,11 +183,11 @@ class PostmanCreator(ApiCreator):
                 request_case.body.mode.value: self.create_body(request_case.body)
             }
 
-        if request_case.query is not None:
+        if query is not None:
             request_content['url']['query'] = [{
                 'key': qk,
                 'value': str(qv)
-            } for qk, qv in request_case.query.items()]
+            } for qk, qv in query.items()]
 
         if request_case.params is not None:
             query_values = [{
@@ -177,36 +205,230 @@ class PostmanCreator(ApiCreator):
     def create_response() -> list:
         return []
 
-    def create_apis(self, groups: Dict[str, Any]) -> Any:
-        event_data = groups.get('prerequest')
-        if event_data is None:
-            event = self.create_events()
-        else:
-            event = self.create_events(event_data)
-            del groups['prerequest']
+    @staticmethod
+    def _common_items(values: List[Optional[Dict]]) -> Dict:
+        # 所有用例中键与值都相同的项
+        common = dict(values[0] or {})
+        for value in values[1:]:
+            value = value or {}
+            common = {k: v for k, v in common.items() if k in value and value[k] == v}
+        return common
 
-        json_data = {
-            'info': self.create_info(),
+    @staticmethod
+    def create_hoist_events(headers: Dict, query: Dict) -> List[Dict]:
+        """
+        分组的前置脚本，为分组内的每个请求补充提升的请求头与 query，
+        变量在前置脚本执行后才替换，值中的 {{var}} 照常生效
+        :param headers:
+        :param query:
+        :return:
+        """
+        lines = ['pm.request.headers.upsert({});'.format(json.dumps({'key': k, 'value': v}, ensure_ascii=False))
+                 for k, v in headers.items()]
+        lines.extend(['pm.request.url.query.upsert({});'.format(
+            json.dumps({'key': k, 'value': str(v)}, ensure_ascii=False)) for k, v in query.items()])
+        return [{
+            'listen': 'prerequest',
+            'script': {
+                'type': 'text/javascript',
+                'exec': lines
+            }
+        }]
+
+    def create_group(self, name: str, cases: List[RequestCase]) -> Dict:
+        """
+        构建分组（postman 文件夹）数据
+        :param name: 分组标识，格式为 path@md5
+        :param cases:
+        :return:
+        """
+        headers = query = {}
+        if self._hoist is not None and cases:
+            headers = self._common_items([case.headers for case in cases])
+            if self._hoist == self.HOIST_ALL:
+                query = self._common_items([case.query for case in cases])
+
+        group = {
+            'name': name,
             'item': [{
-                'name': name,
-                'item': [{
-                    'name': case.name,
-                    'event': self.create_case_events(case),
-                    'request': self.create_request(case),
-                    'response': self.create_response()
-                } for case in data]
-            } for name, data in groups.items()],
-            'event': event
+                'name': case.name,
+                'event': self.create_case_events(case),
+                'request': self.create_request(case, set(headers), set(query)),
+                'response': self.create_response()
+            } for case in cases]
         }
+        if headers or query:
+            group['event'] = self.create_hoist_events(headers, query)
+        return group
 
-        # 将结果文件输出到指定路径
+    @property
+    def output_path(self) -> str:
+        """
+        结果文件输出路径
+        :return:
+        """
         output_path = self._output_url
         if os.path.exists(self._output_url) and os.path.isdir(self._output_url):
             output_path = os.path.join(self._output_url, self._name)
         if '.json' not in output_path:
             output_path = '{}.json'.format(output_path)
+        return output_path
+
+    def load_apis(self) -> Optional[Dict]:
+        """
+        载入已经生成过的集合文件，文件不存在或者输出到其他目标时返回 None
+        :return:
+        """
+        if self._sink is not None or not os.path.exists(self.output_path):
+            return None
+        with open_file(self.output_path) as f:
+            return json.load(f)
+
+    def load_group_names(self) -> Set[str]:
+        """
+        已生成的集合文件中的分组标识
+        :return:
+        """
+        json_data = self.load_apis()
+        if json_data is None:
+            return set()
+        return {item['name'] for item in json_data.get('item', [])}
+
+    def _open_output(self) -> OutputSink:
+        sink = self._sink if self._sink is not None else as_sink(self.output_path)
+        logging.info('%s-%s', 'Convert Case', 'output: {}'.format(sink.name))
+        return sink
+
+    def _write_apis(self, json_data: Dict):
+        # 固定缩进与键顺序，保证重新生成后的文件便于 diff
+        with self._open_output() as f:
+            json.dump(json_data, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+    @staticmethod
+    def _indent(text: str, level: int, first: bool = False) -> str:
+        prefix = ' ' * level
+        text = text.replace('\n', '\n' + prefix)
+        return prefix + text if first else text
+
+    def dump_group(self, name: str, cases: List[RequestCase]) -> str:
+        """
+        分组的 json 文本片段，缩进与 _write_apis 输出的文件一致，可以缓存后直接拼接
+        :param name:
+        :param cases:
+        :return:
+        """
+        return self._indent(json.dumps(self.create_group(name, cases), ensure_ascii=False, indent=2), 4, first=True)
 
-        with open(output_path, 'w') as f:
-            logging.info('%s-%s', 'Convert Case', 'output: {}'.format(output_path))
-            json.dump(json_data, f)
+    def write_fragments(self, event: List[Dict], fragments: List[str]):
+        """
+        将已经序列化好的分组片段拼接为集合文件，结果与 _write_apis 的输出相同
+        :param event:
+        :param fragments: dump_group 的返回值
+        :return:
+        """
+        with self._open_output() as f:
+            for text in self._iter_fragments(event, fragments):
+                f.write(text)
+
+    def _iter_fragments(self, event: List[Dict], fragments: List[str]) -> Iterator[str]:
+        dump = lambda data: self._indent(json.dumps(data, ensure_ascii=False, indent=2), 2)
+        yield '{\n  "info": '
+        yield dump(self.create_info())
+        yield ',\n  "item": [\n' if fragments else ',\n  "item": []'
+        if fragments:
+            yield ',\n'.join(fragments)
+            yield '\n  ]'
+        yield ',\n  "event": '
+        yield dump(event)
+        yield '\n}\n'
+
+    def env_output_path(self, env: str) -> str:
+        """
+        环境的输出路径，例如 name.json 对应 name_dev.json
+        :param env:
+        :return:
+        """
+        output_path, compression = split_compression(self.output_path)
+        if output_path.endswith('.json'):
+            output_path = output_path[:-len('.json')]
+        return '{path}_{env}.json{compression}'.format(path=output_path, env=env, compression=compression)
+
+    def create_env_apis(self, groups: Dict[str, Any], environments: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        用例只展开与序列化一次，再按环境替换序列化结果中的 {{var}} 变量，每个环境输出一个集合文件，
+        环境中未定义的变量保留原占位符
+        :param groups: ApiParser.create_request_cases 的返回值
+        :param environments: 环境名称 -> 变量
+        :return: 输出的文件路径
+        """
+        event = self._create_event(groups)
+        fragments = [self.dump_group(name, cases) for name, cases in groups.items()]
+        template = VariableTemplate(''.join(self._iter_fragments(event, fragments)))
+
+        output_paths = []
+        for env, variables in environments.items():
+            # 变量值写入 json 字符串内部，需要转义
+            escaped = {k: json.dumps(v if isinstance(v, str) else json.dumps(v), ensure_ascii=False)[1:-1]
+                       for k, v in variables.items()}
+            output_path = self.env_output_path(env)
+            with as_sink(output_path) as f:
+                logging.info('%s-%s', 'Convert Case', 'output: {}'.format(output_path))
+                f.write(template.render(escaped))
+            output_paths.append(output_path)
+        return output_paths
+
+    def _create_event(self, groups: Dict[str, Any]) -> List[Dict]:
+        event_data = groups.get('prerequest')
+        if event_data is None:
+            return self.create_events()
+        del groups['prerequest']
+        return self.create_events(event_data)
+
+    def create_apis(self, groups: Dict[str, Any]) -> Any:
+        event = self._create_event(groups)
+
+        json_data = {
+            'info': self.create_info(),
+            'item': [self.create_group(name, data) for name, data in groups.items()],
+            'event': event
+        }
+
+        # 将结果文件输出到指定路径
+        self._write_apis(json_data)
+
+    def update_apis(self, groups: Dict[str, Any]) -> Any:
+        """
+        在已有集合文件上增量更新，只替换模板摘要发生变化的分组，
+        值为 None 的分组表示模板未变化，沿用已有内容
+        :param groups:
+        :return:
+        """
+        old_data = self.load_apis()
+        if old_data is None:
+            old_data = {}
+        old_items = {item['name']: item for item in old_data.get('item', [])}
+
+        event = self._create_event(groups)
+        items = []
+        changed = 0
+        for name, data in groups.items():
+            if data is None and name in old_items:
+                items.append(old_items[name])
+                continue
+            if data is None:
+                raise ValueError("group {} not found in collection: {}".format(name, self.output_path))
+            items.append(self.create_group(name, data))
+            changed += 1
+
+        json_data = {
+            'info': self.create_info(),
+            'item': items,
+            'event': event
+        }
+        logging.info('%s-%s', 'Convert Case', 'update: {changed} changed, {removed} removed'.format(
+            changed=changed, removed=len(set(old_items) - set(groups))))
+        if json_data == old_data:
+            return
 
+        self._write_apis(json_data)
@@ -0,0 +1,165 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Callable,
+    List,
+    Dict,
+    Any
+)
+
+import aiohttp
+
+from aapi.casestore import CaseStore
+from aapi.history import RunHistory
+from aapi.index import (
+    TemplateIndex,
+    TemplateSelector
+)
+from aapi.minimize import load_pinned
+from aapi.parser import ApiParser
+from aapi.runner import (
+    RunSummary,
+    RetryPolicy,
+    CircuitBreaker,
+    CaseRunner
+)
+from aapi.store import SqliteResultStore
+from aapi.tracing import RequestTracer
+from aapi.variable import VariableEngine
+
+
+def _run_partition(config: Dict[str, Any], files: List[str], run_id: int = None) -> RunSummary:
+    """
+    工作进程入口，每个进程独立解析分配到的模板文件，使用各自的事件循环与连接池
+    :param config: DistributedRunner 的执行配置
+    :param files: 分配到的模板文件，使用用例集合文件时为分配到的分组标识
+    :param run_id: 结果写入的执行编号
+    :return:
+    """
+    db_path = config['db_path']
+    runner = CaseRunner(engine=VariableEngine.load(config['env_path']),
+                        sink=SqliteResultStore(db_path) if db_path is not None else None,
+                        concurrency=config['concurrency'],
+                        timeout=config['timeout'],
+                        retry=config['retry'],
+                        breaker=config['breaker'],
+                        tracer=RequestTracer() if config['trace'] else None)
+    if config['store_path'] is not None:
+        # 各进程映射同一个用例集合文件，只读取分配到的分组
+        groups = CaseStore.load(config['store_path'], host=config['host']).select(files).groups
+    else:
+        parser = ApiParser(host=config['host'], dir_url=config['dir_url'], seed=config['seed'])
+        groups = CaseStore.expand(parser, files=files).groups
+    if config['pinned_path'] is not None:
+        pinned = load_pinned(config['pinned_path'], config['seed'])
+        if pinned is not None:
+            groups = pinned.apply(groups)
+    if config['history_path'] is not None:
+        groups = RunHistory(config['history_path']).order(groups)
+    return runner.run(groups, run_id=run_id)
+
+
+class DistributedRunner(object):
+    """
+    多进程执行器，按模板分组（path@md5）将用例分配到多个工作进程，
+    同一分组只在一个进程中执行，各进程的汇总合并为一份结果
+    """
+
+    def __init__(self, host: str, dir_url: str, workers: int = None, seed: int = 0, env_path: str = None,
+                 db_path: str = None, concurrency: int = CaseRunner.CONCURRENCY,
+                 timeout: aiohttp.ClientTimeout = CaseRunner.TIMEOUT, retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None, history_path: str = None, trace: bool = False,
+                 pinned_path: str = None, store_path: str = None, selector: TemplateSelector = None,
+                 index_path: str = None):
+        """
+        :param host:
+        :param dir_url: 模板文件夹
+        :param workers: 工作进程数，默认为 cpu 核数
+        :param seed: 参数组合的随机种子
+        :param env_path: 环境文件，钩子需要通过环境文件配置才能在工作进程中生效
+        :param db_path: 执行结果数据库
+        :param concurrency: 每个进程的并发数
+        :param timeout:
+        :param retry:
+        :param breaker:
+        :param history_path: 执行历史文件，每个进程按历史排序分配到的分组，执行结束后更新
+        :param trace: 是否追踪请求各阶段的耗时
+        :param pinned_path: 固定的用例列表文件，只执行列表中的用例
+        :param store_path: 用例集合文件（CaseStore），指定时按分组的用例数分配，不再展开模板
+        :param selector: 只执行满足筛选条件的模板，通过模板索引筛选，不扫描整个模板文件夹
+        :param index_path: 模板索引文件，默认为模板文件夹下的 .aapi_index
+        """
+        self._workers = workers or os.cpu_count() or 1
+        self._dir_url = dir_url
+        self._db_path = db_path
+        self._history_path = history_path
+        self._selector = selector
+        self._index_path = index_path
+        self._config = {
+            'host': host,
+            'dir_url': dir_url,
+            'seed': seed,
+            'env_path': env_path,
+            'db_path': db_path,
+            'concurrency': concurrency,
+            'timeout': timeout,
+            'retry': retry if retry is not None else RetryPolicy(),
+            'breaker': breaker if breaker is not None else CircuitBreaker(),
+            'history_path': history_path,
+            'trace': trace,
+            'pinned_path': pinned_path,
+            'store_path': store_path,
+        }
+
+    @staticmethod
+    def partition(files: List[str], workers: int, weight: Callable[[str], int] = os.path.getsize) -> List[List[str]]:
+        """
+        按文件大小估算用例数量，从大到小依次分配给当前负载最小的进程
+        :param files:
+        :param workers:
+        :param weight: 估算用例数量的函数，默认为文件大小
+        :return:
+        """
+        parts = [[] for _ in range(workers)]
+        loads = [0] * workers
+        for file_path in sorted(files, key=weight, reverse=True):
+            index = loads.index(min(loads))
+            parts[index].append(file_path)
+            loads[index] += weight(file_path)
+        return [sorted(p) for p in parts if p]
+
+    def run(self, label: str = None) -> RunSummary:
+        if self._config['store_path'] is not None:
+            # 用例集合中记录了每个分组的用例数，按实际用例数分配
+            store = CaseStore.load(self._config['store_path'])
+            if self._selector is not None:
+                store = store.filter(self._selector)
+            files = store.group_keys
+            parts = self.partition(files, self._workers, weight=store.count)
+        else:
+            parser = ApiParser(host=self._config['host'], dir_url=self._dir_url)
+            files = parser.get_all_files() if self._selector is None else \
+                TemplateIndex(self._dir_url, self._index_path).select(self._selector)
+            files = [f for f in files if not parser.is_prerequest(f)]
+            parts = self.partition(files, self._workers)
+
+        run_id = None
+        if self._db_path is not None:
+            run_id = SqliteResultStore(self._db_path).create_run(label)
+
+        summary = RunSummary()
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=len(parts) or 1) as pool:
+            futures = [pool.submit(_run_partition, self._config, part, run_id) for part in parts]
+            for future in futures:
+                summary.merge(future.result())
+        summary.elapsed = time.perf_counter() - started
+        if self._history_path is not None:
+            history = RunHistory(self._history_path)
+            history.update(summary)
+            history.save()
+        logging.info('%s-%s', 'Run Case', '{files} templates on {workers} workers'.format(
+            files=len(files), workers=len(parts)))
+        return summary
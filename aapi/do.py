@@ -8,14 +8,48 @@ import types
 import os
 import traceback
 
+import aiohttp
+
 from aapi import (
     ApiParser,
     Har2Template,
     Har2Postman,
-    PostmanCreator
+    Json2Template,
+    Json2Postman,
+    PostmanCreator,
+    FileSink,
+    DirectoryTemplateSink,
+    VariableEngine,
+    SqliteResultStore,
+    RetryPolicy,
+    CircuitBreaker,
+    CaseRunner,
+    DistributedRunner,
+    RunHistory,
+    RequestTracer,
+    HarMockServer,
+    HarReplayer,
+    HarAnalyzer,
+    ShadowComparer,
+    TemplateLinter,
+    PinnedCases,
+    CaseStore,
+    TemplateIndex,
+    TemplateSelector,
+    load_pinned,
+    IncrementalPostmanBuilder,
+    create_watcher,
+    load_environments,
+    split_compression
 )
 
 COMMAND_ARGS_TAG = 'cc_'
+RESULT_DB = 'aapi_results.db'
+HISTORY_FILE = 'aapi_history.json'
+ENVIRONMENTS_FILE = 'environments.json'
+SHADOW_REPORT = 'aapi_shadow.jsonl'
+PINNED_FILE = 'aapi_pinned.json'
+CASE_STORE = 'aapi_cases.store'
 
 
 class PositionalArg(argparse.Action):
@@ -122,7 +156,85 @@ def start_cli(args):
         return 1
 
 
-def case(to, d, n, ex):
+def _check_templates(d, tag, files=None):
+    """
+    展开用例之前校验全部模板，输出全部错误
+    :param d: 模板文件夹
+    :param tag: 日志标签
+    :param files: 只校验指定的模板文件
+    :return: 模板是否全部有效
+    """
+    errors = TemplateLinter(d).lint(files)
+    for error in errors:
+        logging.error('%s-%s', tag, error)
+    return not errors
+
+
+def _load_store_header(store, d, s, tag):
+    """
+    读取用例集合文件的文件头，未指定 -d 时使用展开时的模板文件夹，-s 必须与展开时的随机种子一致
+    :param store: 用例集合文件
+    :param d: -d 的值
+    :param s: -s 的值
+    :param tag: 日志标签
+    :return: (模板文件夹, 随机种子)，出错时返回 None
+    """
+    try:
+        header = CaseStore.read_header(store)
+    except (OSError, ValueError) as e:
+        logging.error('%s-%s', tag, "can't read case store {}: {}".format(store, e))
+        return None
+    if s is not None and s.lstrip('-').isdigit() and int(s) != header['seed']:
+        logging.error('%s-%s', tag, '-s value {} conflicts with seed {} of case store {}'.format(
+            s, header['seed'], store))
+        return None
+    return (header['dir_url'] if d is None else d), header['seed']
+
+
+def _make_selector(select, tags):
+    """
+    根据 --select 与 --tags 创建模板筛选条件，都未指定时返回 None。
+    不带值的参数解析为 None，视为错误，否则会静默执行全部模板
+    :param select: 逗号分隔的路径通配符
+    :param tags: 逗号分隔的标签
+    :return:
+    """
+    patterns = [p for p in (select or '').split(',') if p]
+    tag_names = [t for t in (tags or '').split(',') if t]
+    if select is None or (select != '' and not patterns):
+        raise ValueError('--select value must be comma separated template path globs')
+    if tags is None or (tags != '' and not tag_names):
+        raise ValueError('--tags value must be comma separated tags')
+    if not patterns and not tag_names:
+        return None
+    return TemplateSelector(patterns, tag_names)
+
+
+def _load_groups(host, d, seed, store, selector, files, pin):
+    """
+    载入 run 与 compare 执行的用例：用例集合或者按列展开的模板，再按固定用例列表过滤
+    :param host: 用例的 host 变量
+    :param d: 模板文件夹
+    :param seed: 参数组合的随机种子
+    :param store: 用例集合文件
+    :param selector: 模板筛选条件
+    :param files: 通过模板索引筛选出的模板文件
+    :param pin: 固定用例列表文件
+    :return:
+    """
+    # 按列存储展开的用例，执行时才构建单个用例
+    if store is not None:
+        case_store = CaseStore.load(store, host=host)
+        groups = (case_store.filter(selector) if selector is not None else case_store).groups
+    else:
+        groups = CaseStore.expand(ApiParser(host=host, dir_url=d, seed=seed), files=files).groups
+    # 与工作进程使用相同的随机种子校验固定用例列表
+    pinned = load_pinned(pin, seed) if pin is not None else None
+    return pinned.apply(groups) if pinned is not None else groups
+
+
+def case(to, d, n, ex, s, m, ix, watch='', z='', hoist='', env='', envfile='', pin='', store='', select='',
+         tags=''):
     """Convert json file to postman or eolinker request case
 
     Args:
@@ -130,12 +242,37 @@ def case(to, d, n, ex):
         d: json template files directory path
         n: group name
         ex: {openapi}
+        s: random seed of params combination, default 0
+        m: {write, update} output mode, update only rewrites changed groups
+        ix: template index file used by --select/--tags, default .aapi_index in the template directory
+        watch: watch template directory and regenerate changed templates only
+        z: {gz, bz2, xz} compress output collection
+        hoist: {headers, all} hoist repeated headers (and query) of a group into its pre-request script
+        env: comma separated environments such as dev,staging,eu, one collection per environment
+        envfile: environments json file, default environments.json
+        pin: only generate cases of the pinned case list written by minimize, default aapi_pinned.json
+        store: generate cases of the case store written by expand instead of expanding templates, default aapi_cases.store
+        select: comma separated template path globs such as /erp/sc/**, only generate matched templates
+        tags: comma separated tags, only generate templates with any of the tags
     """
     if to is None or to not in ['postman', 'eolinker']:
         logging.error('%s-%s', 'Convert Case', '-to option must be used and value choice from {postman, eolinker}')
         return 2
 
-    if not os.path.exists(d):
+    # 使用用例集合时模板文件夹与随机种子以展开时为准
+    store = (store or CASE_STORE) if store != '' else None
+    seed = None
+    if store is not None:
+        if watch != '' or m == 'update' or not os.path.exists(store):
+            logging.error('%s-%s', 'Convert Case', 'case store: {} was not exists, or used with --watch or '
+                                                   '-m update'.format(store))
+            return 12
+        header = _load_store_header(store, d, s, 'Convert Case')
+        if header is None:
+            return 12
+        d, seed = header
+
+    if d is None or not os.path.exists(d):
         logging.error('%s-%s', 'Convert Case', '-d value json templates file dir not exists')
         return 3
 
@@ -143,39 +280,504 @@ def case(to, d, n, ex):
         logging.error('%s-%s', 'Convert Case', '-d this path not directory')
         return 4
 
+    if s is not None and not s.lstrip('-').isdigit():
+        logging.error('%s-%s', 'Convert Case', '-s value must be an integer')
+        return 5
+
+    if m is not None and m not in ['write', 'update']:
+        logging.error('%s-%s', 'Convert Case', '-m value choice from {write, update}')
+        return 6
+
+    if z not in ['', 'gz', 'bz2', 'xz']:
+        logging.error('%s-%s', 'Convert Case', '-z value choice from {gz, bz2, xz}')
+        return 7
+
+    if hoist not in ['', PostmanCreator.HOIST_HEADERS, PostmanCreator.HOIST_ALL]:
+        logging.error('%s-%s', 'Convert Case', '--hoist value choice from {headers, all}')
+        return 8
+
+    # 不带值的 --env 解析为 None，不能当作未指定
+    if env is None or (env != '' and not [e for e in env.split(',') if e]):
+        logging.error('%s-%s', 'Convert Case', '--env value must be comma separated environment names')
+        return 9
+
+    environments = None
+    if env != '' or envfile != '':
+        envfile = envfile or ENVIRONMENTS_FILE
+        if not os.path.exists(envfile):
+            logging.error('%s-%s', 'Convert Case', 'environments file: {} was not exists'.format(envfile))
+            return 9
+        if watch != '' or m == 'update':
+            logging.error('%s-%s', 'Convert Case', '--env can not be used with --watch or -m update')
+            return 9
+        try:
+            environments = load_environments(envfile, [e for e in env.split(',') if e] if env else None)
+        except KeyError as e:
+            logging.error('%s-%s', 'Convert Case', e)
+            return 9
+
+    if pin != '' and watch != '':
+        logging.error('%s-%s', 'Convert Case', '--pin can not be used with --watch')
+        return 11
+
+    try:
+        selector = _make_selector(select, tags)
+    except ValueError as e:
+        logging.error('%s-%s', 'Convert Case', e)
+        return 13
+    if selector is not None and (watch != '' or m == 'update'):
+        logging.error('%s-%s', 'Convert Case', '--select and --tags can not be used with --watch or -m update')
+        return 13
+
+    # 通过模板索引筛选，只读取匹配的模板文件
+    files = TemplateIndex(d, ix).select(selector) if selector is not None and store is None else None
+    if store is None and not _check_templates(d, 'Convert Case', files):
+        return 10
+
     group_name = os.path.basename(os.path.abspath(d)) if n is None else n
+    if seed is None:
+        seed = 0 if s is None else int(s)
+    pinned = load_pinned(pin or PINNED_FILE, seed) if pin != '' else None
     if to == 'postman':
-        parser = ApiParser(host='{{' + group_name + '}}', dir_url=d)
-        creator = PostmanCreator(name=group_name, output_url='.')
-        creator.create_apis(parser.create_request_cases())
-        creator.create_apis(parser.create_request_cases())
+        parser = ApiParser(host='{{' + group_name + '}}', dir_url=d, seed=seed)
+        output_url = '{name}.json.{z}'.format(name=group_name, z=z) if z else '.'
+        creator = PostmanCreator(name=group_name, output_url=output_url, hoist=hoist or None)
+
+        def create_cases(**kwargs):
+            if store is not None:
+                case_store = CaseStore.load(store, host=parser.host)
+                groups = (case_store.filter(selector) if selector is not None else case_store).groups
+            else:
+                groups = parser.create_request_cases(files=files, **kwargs)
+            return pinned.apply(groups) if pinned is not None else groups
+
+        if environments is not None:
+            # 只解析与展开一次，按环境替换变量后分别输出
+            creator.create_env_apis(create_cases(), environments)
+        elif watch != '':
+            IncrementalPostmanBuilder(parser, creator).watch(create_watcher(d))
+        elif m == 'update':
+            creator.update_apis(create_cases(known_groups=creator.load_group_names()))
+        else:
+            creator.create_apis(create_cases())
 
 
-def har(to, f):
-    """Convert har file to postman or template json
+def har(to, f, x, host):
+    """Convert har file to postman or template json, or replay it
 
     Args:
-        to: {postman, template} choice convert type
+        to: {postman, template, replay, report} choice convert type
         f: har file
+        x: replay speed multiplier such as 1, 10 or max, default 1
+        host: replay target such as http://127.0.0.1:8080, default recorded host
     """
-    if to is None or to not in ['postman', 'template']:
-        logging.error('%s-%s', '.har to json', '-to option must be used and value choice from {postman, template}')
+    if to is None or to not in ['postman', 'template', 'replay', 'report']:
+        logging.error('%s-%s', '.har to json', '-to option must be used and value choice from '
+                                               '{postman, template, replay, report}')
         return 2
 
     if not os.path.exists(f):
         logging.error('%s-%s', '.har to json', 'har file: {} was not exists'.format(f))
         return 4
 
-    dir_name = f.replace('.har', '') if f.endswith('.har') else f
+    # 压缩的 .har 文件生成的集合文件使用相同的压缩格式
+    base_name, compression = split_compression(f)
+    dir_name = base_name.replace('.har', '') if base_name.endswith('.har') else base_name
 
     if to == 'template':
         if not os.path.isdir(dir_name):
             os.makedirs(dir_name)
-        parser = Har2Template(dir_path=dir_name, file_path=f)
+        parser = Har2Template(dir_path=dir_name, file_path=f, sink=DirectoryTemplateSink(dir_name, compression))
         parser.create_json()
     elif to == 'postman':
-        parser = Har2Postman(dir_path=dir_name, file_path=f, group_name=dir_name)
+        sink = FileSink('{}.json{}'.format(dir_name, compression)) if compression else None
+        parser = Har2Postman(dir_path=dir_name, file_path=f, group_name=dir_name, sink=sink)
         parser.create_json()
+    elif to == 'replay':
+        speed = 1.0
+        if x == HarReplayer.SPEED_MAX:
+            speed = None
+        elif x is not None:
+            try:
+                speed = float(x)
+            except ValueError:
+                speed = 0
+            if speed <= 0:
+                logging.error('%s-%s', 'Replay', '-x value must be a positive number or max')
+                return 5
+        return str(HarReplayer(file_path=f, speed=speed, target=host).replay())
+    elif to == 'report':
+        report = HarAnalyzer(file_path=f).analyze()
+        report.save('{}_report.json{}'.format(dir_name, compression))
+        return str(report)
+
+
+def eolinker(to, f):
+    """Convert eolinker exported json file to postman or template json
+
+    Args:
+        to: {postman, template} choice convert type
+        f: eolinker exported json file
+    """
+    if to is None or to not in ['postman', 'template']:
+        logging.error('%s-%s', 'eolinker file .json to json', '-to option must be used and value choice from '
+                                                              '{postman, template}')
+        return 2
+
+    if f is None or not os.path.exists(f):
+        logging.error('%s-%s', 'eolinker file .json to json', 'eolinker file: {} was not exists'.format(f))
+        return 4
+
+    # 导出文件按接口流式读取，非启用状态的接口直接跳过
+    base_name, compression = split_compression(f)
+    dir_name = base_name[:-len('.json')] if base_name.endswith('.json') else base_name
+
+    if to == 'template':
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+        Json2Template(dir_path=dir_name, file_path=f,
+                      sink=DirectoryTemplateSink(dir_name, compression)).create_json()
+    elif to == 'postman':
+        sink = FileSink('{}_eolinker_to_postman.json{}'.format(dir_name, compression)) if compression else None
+        Json2Postman(dir_path=dir_name, file_path=f, group_name=dir_name, sink=sink).create_json()
+
+
+def run(d, e, n, s, c, db, t, rt, cb, w, hf, ix, trace='', pin='', store='', select='', tags=''):
+    """Run json template cases natively and save results
+
+    Args:
+        d: json template files directory path
+        e: environment json file, postman environment or plain object with hooks
+        n: group name, host variable of cases
+        s: random seed of params combination, default 0 or the seed of --store
+        c: concurrency, default 10
+        db: sqlite results database, default aapi_results.db
+        t: connect/read/total timeout seconds of a request, default 5/10/30
+        rt: retries of idempotent requests, default 2
+        cb: consecutive errors to open the circuit of a group, default 5
+        w: worker processes, each with its own event loop, default 1
+        hf: history file used to run recently failing and fast groups first, default aapi_history.json
+        ix: template index file used by --select/--tags, default .aapi_index in the template directory
+        trace: break down dns/connect/ttfb/transfer time per group and report connection reuse
+        pin: only run cases of the pinned case list written by minimize, default aapi_pinned.json
+        store: run cases of the case store written by expand instead of expanding templates, default aapi_cases.store
+        select: comma separated template path globs such as /erp/sc/**, only run matched templates
+        tags: comma separated tags, only run templates with any of the tags
+    """
+    if s is not None and not s.lstrip('-').isdigit():
+        logging.error('%s-%s', 'Run Case', '-s value must be an integer')
+        return 5
+
+    # 使用用例集合时模板文件夹与随机种子以展开时为准
+    store = (store or CASE_STORE) if store != '' else None
+    seed = 0 if s is None else int(s)
+    if store is not None:
+        if not os.path.exists(store):
+            logging.error('%s-%s', 'Run Case', 'case store: {} was not exists'.format(store))
+            return 8
+        header = _load_store_header(store, d, s, 'Run Case')
+        if header is None:
+            return 8
+        d, seed = header
+
+    if d is None or not os.path.isdir(d):
+        logging.error('%s-%s', 'Run Case', '-d value json templates file dir not exists')
+        return 3
+
+    if e is not None and not os.path.exists(e):
+        logging.error('%s-%s', 'Run Case', 'environment file: {} was not exists'.format(e))
+        return 4
+
+    for flag, value in [('-c', c), ('-rt', rt), ('-cb', cb), ('-w', w)]:
+        if value is not None and not value.isdigit():
+            logging.error('%s-%s', 'Run Case', '{} value must be an integer'.format(flag))
+            return 5
+
+    timeout = CaseRunner.TIMEOUT
+    if t is not None:
+        try:
+            connect, sock_read, total = [float(v) if v else None for v in t.split('/')]
+        except ValueError:
+            logging.error('%s-%s', 'Run Case', '-t value format must be connect/read/total')
+            return 6
+        timeout = aiohttp.ClientTimeout(total=total, connect=connect, sock_read=sock_read)
+
+    try:
+        selector = _make_selector(select, tags)
+    except ValueError as e:
+        logging.error('%s-%s', 'Run Case', e)
+        return 9
+    files = TemplateIndex(d, ix).select(selector) if selector is not None and store is None else None
+    if store is None and not _check_templates(d, 'Run Case', files):
+        return 7
+
+    group_name = os.path.basename(os.path.abspath(d)) if n is None else n
+    concurrency = CaseRunner.CONCURRENCY if c is None else int(c)
+    retry = RetryPolicy() if rt is None else RetryPolicy(retries=int(rt))
+    breaker = CircuitBreaker() if cb is None else CircuitBreaker(threshold=int(cb))
+    db = RESULT_DB if db is None else db
+    hf = HISTORY_FILE if hf is None else hf
+    pin = (pin or PINNED_FILE) if pin != '' else None
+    if w is not None and int(w) > 1:
+        runner = DistributedRunner(host='{{' + group_name + '}}', dir_url=d, workers=int(w), seed=seed,
+                                   env_path=e, db_path=db, concurrency=concurrency, timeout=timeout, retry=retry,
+                                   breaker=breaker, history_path=hf, trace=trace != '', pinned_path=pin,
+                                   store_path=store, selector=selector, index_path=ix)
+        return str(runner.run(label=group_name))
+
+    runner = CaseRunner(engine=VariableEngine.load(e),
+                        sink=SqliteResultStore(db),
+                        concurrency=concurrency,
+                        timeout=timeout,
+                        retry=retry,
+                        breaker=breaker,
+                        tracer=RequestTracer() if trace != '' else None)
+    groups = _load_groups('{{' + group_name + '}}', d, seed, store, selector, files, pin)
+    # 最近失败以及耗时短的分组先执行
+    history = RunHistory(hf)
+    summary = runner.run(history.order(groups), label=group_name)
+    history.update(summary)
+    history.save()
+    return str(summary)
+
+
+def expand(d, n, s, o):
+    """Expand json templates once into a columnar case store shared by case and run
+
+    Args:
+        d: json template files directory path
+        n: group name, host variable of cases
+        s: random seed of params combination, default 0
+        o: case store file, default aapi_cases.store
+    """
+    if d is None or not os.path.isdir(d):
+        logging.error('%s-%s', 'Expand', '-d value json templates file dir not exists')
+        return 2
+
+    if s is not None and not s.lstrip('-').isdigit():
+        logging.error('%s-%s', 'Expand', '-s value must be an integer')
+        return 3
+
+    if not _check_templates(d, 'Expand'):
+        return 4
+
+    group_name = os.path.basename(os.path.abspath(d)) if n is None else n
+    parser = ApiParser(host='{{' + group_name + '}}', dir_url=d, seed=0 if s is None else int(s))
+    case_store = CaseStore.expand(parser)
+    output_path = CASE_STORE if o is None else o
+    case_store.save(output_path)
+    return '{cases} cases of {groups} templates saved to {path}'.format(
+        cases=len(case_store), groups=len(case_store.group_keys), path=output_path)
+
+
+def lint(d, w):
+    """Validate all json templates and report every error with file and json path
+
+    Args:
+        d: json template files directory path
+        w: worker processes, default cpu count
+    """
+    if d is None or not os.path.isdir(d):
+        logging.error('%s-%s', 'Lint', '-d value json templates file dir not exists')
+        return 2
+
+    if w is not None and not w.isdigit():
+        logging.error('%s-%s', 'Lint', '-w value must be an integer')
+        return 3
+
+    errors = TemplateLinter(d, workers=None if w is None else int(w)).lint()
+    lines = [str(error) for error in errors]
+    lines.append('{} errors'.format(len(errors)))
+    return '\n'.join(lines)
+
+
+def compare(d, e, n, a, b, i, o, c, s, ix, pin='', store='', select='', tags=''):
+    """Send every case to old and new deployments concurrently and diff the responses
+
+    Args:
+        d: json template files directory path
+        e: environment json file, postman environment or plain object with hooks
+        n: group name, host variable of cases
+        a: old deployment such as http://10.0.0.1:8080
+        b: new deployment such as http://10.0.0.2:8080
+        i: comma separated json paths of volatile fields to ignore such as $.data.timestamp
+        o: json lines report of differences, default aapi_shadow.jsonl
+        c: concurrency of compared cases, default 10
+        s: random seed of params combination, default 0 or the seed of --store
+        ix: template index file used by --select/--tags, default .aapi_index in the template directory
+        pin: only compare cases of the pinned case list written by minimize, default aapi_pinned.json
+        store: compare cases of the case store written by expand instead of expanding templates, default aapi_cases.store
+        select: comma separated template path globs such as /erp/sc/**, only compare matched templates
+        tags: comma separated tags, only compare templates with any of the tags
+    """
+    if s is not None and not s.lstrip('-').isdigit():
+        logging.error('%s-%s', 'Compare', '-s value must be an integer')
+        return 5
+
+    # 与 run 命令相同的方式载入用例
+    store = (store or CASE_STORE) if store != '' else None
+    seed = 0 if s is None else int(s)
+    if store is not None:
+        if not os.path.exists(store):
+            logging.error('%s-%s', 'Compare', 'case store: {} was not exists'.format(store))
+            return 8
+        header = _load_store_header(store, d, s, 'Compare')
+        if header is None:
+            return 8
+        d, seed = header
+
+    if d is None or not os.path.isdir(d):
+        logging.error('%s-%s', 'Compare', '-d value json templates file dir not exists')
+        return 2
+
+    if a is None or b is None:
+        logging.error('%s-%s', 'Compare', '-a and -b option must be used')
+        return 3
+
+    if e is not None and not os.path.exists(e):
+        logging.error('%s-%s', 'Compare', 'environment file: {} was not exists'.format(e))
+        return 4
+
+    if c is not None and not c.isdigit():
+        logging.error('%s-%s', 'Compare', '-c value must be an integer')
+        return 5
+
+    group_name = os.path.basename(os.path.abspath(d)) if n is None else n
+    ignore = [p.strip() for p in i.split(',') if p.strip()] if i is not None else []
+    try:
+        comparer = ShadowComparer(old_host=a, new_host=b, host_variable=group_name,
+                                  engine=VariableEngine.load(e), ignore=ignore,
+                                  concurrency=CaseRunner.CONCURRENCY if c is None else int(c))
+    except ValueError as error:
+        logging.error('%s-%s', 'Compare', '-i value: {}'.format(error))
+        return 6
+
+    try:
+        selector = _make_selector(select, tags)
+    except ValueError as error:
+        logging.error('%s-%s', 'Compare', error)
+        return 9
+    files = TemplateIndex(d, ix).select(selector) if selector is not None and store is None else None
+    if store is None and not _check_templates(d, 'Compare', files):
+        return 7
+
+    pin = (pin or PINNED_FILE) if pin != '' else None
+    groups = _load_groups('{{' + group_name + '}}', d, seed, store, selector, files, pin)
+    return str(comparer.run(groups, report_path=SHADOW_REPORT if o is None else o))
+
+
+def minimize(db, r, s, o):
+    """Keep one case per response signature of each group and write a pinned case list
+
+    Args:
+        db: sqlite results database, default aapi_results.db
+        r: run id, default latest run
+        s: random seed of params combination the run used, default 0
+        o: pinned case list file honored by case/run --pin, default aapi_pinned.json
+    """
+    db = RESULT_DB if db is None else db
+    if not os.path.exists(db):
+        logging.error('%s-%s', 'Minimize', 'results database: {} was not exists'.format(db))
+        return 2
+
+    if r is not None and not r.isdigit():
+        logging.error('%s-%s', 'Minimize', '-r value must be an integer')
+        return 3
+
+    if s is not None and not s.lstrip('-').isdigit():
+        logging.error('%s-%s', 'Minimize', '-s value must be an integer')
+        return 5
+
+    store = SqliteResultStore(db)
+    run_id = store.latest_run() if r is None else int(r)
+    if run_id is None:
+        logging.error('%s-%s', 'Minimize', 'no run saved in: {}'.format(db))
+        return 4
+
+    pinned = PinnedCases.from_run(store, run_id, seed=0 if s is None else int(s))
+    pinned.save(PINNED_FILE if o is None else o)
+    return str(pinned)
+
+
+def mock(f, p, l, host):
+    """Serve recorded responses of har file as a local mock server
+
+    Args:
+        f: har file
+        p: port, default 8080
+        l: injected latency ms, or har to use recorded server wait time
+        host: listen host, default 127.0.0.1
+    """
+    if f is None or not os.path.exists(f):
+        logging.error('%s-%s', 'Mock', 'har file: {} was not exists'.format(f))
+        return 2
+
+    if p is not None and not p.isdigit():
+        logging.error('%s-%s', 'Mock', '-p value must be an integer')
+        return 3
+
+    if l is not None and l != HarMockServer.LATENCY_HAR:
+        try:
+            float(l)
+        except ValueError:
+            logging.error('%s-%s', 'Mock', '-l value must be a number or har')
+            return 4
+
+    server = HarMockServer(file_path=f, latency=0 if l is None else l)
+    server.serve(host='127.0.0.1' if host is None else host, port=8080 if p is None else int(p))
+
+
+def _format_rows(rows):
+    if not rows:
+        return 'no records\n'
+    columns = list(rows[0].keys())
+    lines = ['\t'.join(columns)]
+    for row in rows:
+        lines.append('\t'.join(['{:.1f}'.format(row[c]) if isinstance(row[c], float) else str(row[c])
+                                for c in columns]))
+    return '\n'.join(lines) + '\n'
+
+
+def report(db, q, r, b):
+    """Query saved run results
+
+    Args:
+        db: sqlite results database, default aapi_results.db
+        q: {runs, failures, slowest, delta} query type
+        r: run id, default latest run
+        b: base run id of delta, default the run before -r
+    """
+    db = RESULT_DB if db is None else db
+    if not os.path.exists(db):
+        logging.error('%s-%s', 'Report', 'results database: {} was not exists'.format(db))
+        return 2
+
+    if q is None or q not in ['runs', 'failures', 'slowest', 'delta']:
+        logging.error('%s-%s', 'Report', '-q option must be used and value choice from '
+                                         '{runs, failures, slowest, delta}')
+        return 3
+
+    for flag, value in [('-r', r), ('-b', b)]:
+        if value is not None and not value.isdigit():
+            logging.error('%s-%s', 'Report', '{} value must be an integer'.format(flag))
+            return 5
+
+    store = SqliteResultStore(db)
+    if q == 'runs':
+        return _format_rows(store.runs())
+
+    run_id = store.latest_run() if r is None else int(r)
+    if run_id is None:
+        logging.error('%s-%s', 'Report', 'no run saved in: {}'.format(db))
+        return 4
+
+    if q == 'failures':
+        return _format_rows(store.failures(run_id))
+    if q == 'slowest':
+        return _format_rows(store.slowest(run_id))
+
+    base_run_id = int(b) if b is not None else store.latest_run(offset=1) if r is None else run_id - 1
+    return _format_rows(store.delta(run_id, base_run_id))
 
 
 def main():
@@ -190,6 +792,14 @@ def main():
 
     make_subparser(subparsers, parents, case)
     make_subparser(subparsers, parents, har)
+    make_subparser(subparsers, parents, eolinker)
+    make_subparser(subparsers, parents, lint)
+    make_subparser(subparsers, parents, expand)
+    make_subparser(subparsers, parents, run)
+    make_subparser(subparsers, parents, compare)
+    make_subparser(subparsers, parents, report)
+    make_subparser(subparsers, parents, minimize)
+    make_subparser(subparsers, parents, mock)
 
     if len(sys.argv) == 1:
         parser.print_help()
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import time
+from typing import (
+    Dict,
+    Optional,
+    Tuple,
+    Any
+)
+
+from aapi.runner import RunSummary
+
+
+def group_path(group_key: str) -> str:
+    """
+    分组标识 path@md5 中的路径部分
+    :param group_key:
+    :return:
+    """
+    return group_key.rsplit('@', 1)[0]
+
+
+class RunHistory(object):
+    """
+    本地执行历史，按分组标识（path@md5）记录耗时与失败率的指数加权平均，
+    用于将最近失败以及耗时短的分组排在前面，使失败尽早暴露。
+    模板变化后分组标识改变，此时沿用同一路径的历史记录
+    """
+    ALPHA = 0.3
+    # 失败率衰减到该值以下后不再视为最近失败
+    FAILING = 0.01
+
+    def __init__(self, file_path: str, alpha: float = ALPHA):
+        """
+        :param file_path: 历史文件，不存在时视为没有历史记录
+        :param alpha: 最近一次执行的权重
+        """
+        self._file_path = file_path
+        self._alpha = alpha
+        self._groups = {}
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, encoding='utf-8') as f:
+                    self._groups = json.load(f).get('groups', {})
+            except (ValueError, AttributeError) as e:
+                logging.info('%s-%s', 'History', 'ignore broken history file {}: {}'.format(file_path, e))
+        self._paths = {group_path(key): key for key in self._groups}
+
+    @property
+    def groups(self) -> Dict[str, Dict[str, Any]]:
+        return self._groups
+
+    def lookup(self, group_key: str) -> Optional[Dict[str, Any]]:
+        record = self._groups.get(group_key)
+        if record is None:
+            key = self._paths.get(group_path(group_key))
+            record = self._groups.get(key) if key is not None else None
+        return record
+
+    def score(self, group_key: str) -> Tuple[int, float, float]:
+        """
+        排序依据，依次为类别、失败率（降序）、平均耗时（升序），
+        类别按最近失败、没有历史记录（新增的模板）、最近通过排列
+        :param group_key:
+        :return:
+        """
+        record = self.lookup(group_key)
+        if record is None:
+            return 1, 0.0, 0.0
+        failure = record['failure']
+        return 0 if failure >= self.FAILING else 2, -failure, record['duration']
+
+    def order(self, groups: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按历史记录对分组重新排序，prerequest 分组保持在最前，得分相同的分组保持原有顺序
+        :param groups: ApiParser.create_request_cases 的返回值
+        :return:
+        """
+        keys = [k for k in groups if k != 'prerequest']
+        ordered = {'prerequest': groups['prerequest']} if 'prerequest' in groups else {}
+        for key in sorted(keys, key=self.score):
+            ordered[key] = groups[key]
+        return ordered
+
+    def update(self, summary: RunSummary):
+        """
+        根据一次执行的分组统计更新历史
+        :param summary:
+        :return:
+        """
+        now = int(time.time())
+        for key, (total, failed, latency) in summary.groups.items():
+            if not total:
+                continue
+            duration = latency
+            failure = failed / total
+            record = self.lookup(key)
+            if record is not None:
+                duration = self._alpha * duration + (1 - self._alpha) * record['duration']
+                failure = self._alpha * failure + (1 - self._alpha) * record['failure']
+            # 同一路径只保留最新模板的记录
+            old_key = self._paths.get(group_path(key))
+            if old_key is not None and old_key != key:
+                del self._groups[old_key]
+            self._groups[key] = {
+                'duration': round(duration, 3),
+                'failure': round(failure, 6),
+                'runs': (record['runs'] if record is not None else 0) + 1,
+                'updated': now,
+            }
+            self._paths[group_path(key)] = key
+
+    def save(self):
+        # 先写临时文件再替换，避免中断时损坏历史文件
+        temp_path = '{}.tmp'.format(self._file_path)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'groups': self._groups}, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(temp_path, self._file_path)
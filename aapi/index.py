@@ -0,0 +1,275 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import (
+    List,
+    Dict,
+    Optional,
+    Any
+)
+
+from aapi.pipeline import open_file
+
+INDEX_FILE = '.aapi_index'
+GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+def compile_glob(pattern: str) -> Any:
+    """
+    将路径通配符编译为正则，** 匹配任意层级，* 与 ? 不跨越 /
+    :param pattern: 例如 /erp/sc/**、/api/*/list
+    :return:
+    """
+    if not pattern.startswith('/'):
+        pattern = '/' + pattern
+    parts = []
+    position = 0
+    while position < len(pattern):
+        if pattern.startswith('**', position):
+            parts.append('.*')
+            position += 2
+        elif pattern[position] == '*':
+            parts.append('[^/]*')
+            position += 1
+        elif pattern[position] == '?':
+            parts.append('[^/]')
+            position += 1
+        else:
+            parts.append(re.escape(pattern[position]))
+            position += 1
+    return re.compile(''.join(parts) + r'\Z')
+
+
+def glob_prefix(pattern: str) -> str:
+    """
+    通配符之前的目录部分，只有该目录下的模板可能匹配
+    :param pattern:
+    :return:
+    """
+    if not pattern.startswith('/'):
+        pattern = '/' + pattern
+    match = GLOB_CHARS.search(pattern)
+    if match is None:
+        return pattern.rsplit('/', 1)[0]
+    return pattern[:match.start()].rsplit('/', 1)[0]
+
+
+class TemplateSelector(object):
+    """
+    模板筛选条件，路径通配符之间为或，标签之间为或，两类条件同时指定时需要同时满足
+    """
+
+    def __init__(self, patterns: List[str] = None, tags: List[str] = None):
+        self._patterns = list(patterns or [])
+        self._regexes = [compile_glob(p) for p in self._patterns]
+        self._tags = set(tags or [])
+
+    @property
+    def prefixes(self) -> Optional[List[str]]:
+        """
+        需要扫描的目录，没有路径条件时为 None（全部目录）
+        :return:
+        """
+        if not self._patterns:
+            return None
+        return [glob_prefix(p) for p in self._patterns]
+
+    @property
+    def has_tags(self) -> bool:
+        return bool(self._tags)
+
+    def match_path(self, path: str) -> bool:
+        return not self._regexes or any(r.match(path) for r in self._regexes)
+
+    def match_tags(self, tags: List[str]) -> bool:
+        return not self._tags or bool(self._tags.intersection(tags or []))
+
+    def match(self, path: str, template: Dict) -> bool:
+        """
+        模板是否满足筛选条件
+        :param path: 请求路径，即模板相对于模板文件夹的路径（不含 .json）
+        :param template: 模板数据
+        :return:
+        """
+        return self.match_path(path) and self.match_tags(template.get('tags') if isinstance(template, dict) else None)
+
+
+class TemplateIndex(object):
+    """
+    模板索引，默认保存在模板文件夹下的 .aapi_index 文件中，模板文件夹只读或者纳入版本管理时可以指定其他位置，
+    记录每个目录的修改时间以及每个模板的路径、大小、修改时间、标签与内容摘要。
+    筛选时只重新列出修改时间变化且可能匹配的目录，只读取变化的模板，
+    不满足路径条件的目录与模板文件不会被访问
+    """
+
+    def __init__(self, dir_url: str, index_path: str = None):
+        """
+        :param dir_url: 模板文件夹
+        :param index_path: 索引文件，默认为模板文件夹下的 .aapi_index
+        """
+        self._dir_url = dir_url
+        self._index_path = os.path.join(dir_url, INDEX_FILE) if index_path is None else index_path
+        self._dirs = {}
+        self._templates = {}
+        self._changed = False
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, encoding='utf-8') as f:
+                    data = json.load(f)
+                self._dirs = data['dirs']
+                self._templates = data['templates']
+            except (ValueError, KeyError, TypeError) as e:
+                logging.info('%s-%s', 'Template Index', 'rebuild broken index {}: {}'.format(self._index_path, e))
+
+    @property
+    def templates(self) -> Dict[str, Dict[str, Any]]:
+        """
+        模板文件相对路径 -> 索引记录
+        :return:
+        """
+        return self._templates
+
+    @staticmethod
+    def template_path(file_name: str) -> str:
+        # 与 ApiParser.template_path 相同，a/b.json.gz 对应请求路径 /a/b
+        path = '/' + file_name
+        for suffix in ['.gz', '.bz2', '.xz']:
+            if path.endswith(suffix):
+                path = path[:-len(suffix)]
+                break
+        return path.replace('.json', '')
+
+    @staticmethod
+    def _relevant(directory: str, prefixes: Optional[List[str]]) -> bool:
+        """
+        目录中是否可能存在匹配的模板，即目录与某个前缀互为祖先
+        :param directory: 以 / 开头的相对目录，根目录为空字符串
+        :param prefixes:
+        :return:
+        """
+        if prefixes is None:
+            return True
+        for prefix in prefixes:
+            if (directory + '/').startswith(prefix + '/') or (prefix + '/').startswith(directory + '/'):
+                return True
+        return False
+
+    def _list_dir(self, directory: str) -> Dict[str, Any]:
+        """
+        重新列出目录，返回子目录与模板文件，同时更新目录的修改时间
+        :param directory:
+        :return:
+        """
+        path = self._dir_url + directory
+        entries = {'dirs': [], 'files': []}
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            name = '{}/{}'.format(directory, entry.name)
+            if entry.is_dir():
+                entries['dirs'].append(name)
+            elif '.json' in entry.name:
+                entries['files'].append(name[1:])
+        self._dirs[directory] = {'mtime': os.stat(path).st_mtime_ns, **entries}
+        self._changed = True
+        return entries
+
+    def _walk(self, directory: str, prefixes: Optional[List[str]], files: List[str], seen: set):
+        record = self._dirs.get(directory)
+        path = self._dir_url + directory
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        seen.add(directory)
+        if record is None or record['mtime'] != mtime:
+            record = self._list_dir(directory)
+        files.extend(record['files'])
+        for sub_dir in record['dirs']:
+            if self._relevant(sub_dir, prefixes):
+                self._walk(sub_dir, prefixes, files, seen)
+
+    def _entry(self, file_name: str) -> Optional[Dict[str, Any]]:
+        """
+        模板的索引记录，文件大小或修改时间变化时重新读取
+        :param file_name:
+        :return:
+        """
+        file_path = os.path.join(self._dir_url, file_name)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        entry = self._templates.get(file_name)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry
+
+        tags = []
+        with open_file(file_path, 'rb') as f:
+            content = f.read()
+        try:
+            data = json.loads(content.decode('utf-8'))
+            if isinstance(data, dict) and isinstance(data.get('tags'), list):
+                tags = [str(t) for t in data['tags']]
+        except (UnicodeDecodeError, ValueError):
+            # 无效的模板仍然加入索引，由 lint 报告错误
+            pass
+        entry = self._templates[file_name] = {
+            'path': self.template_path(file_name),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'tags': tags,
+            'digest': hashlib.md5(content).hexdigest(),
+        }
+        self._changed = True
+        return entry
+
+    def select(self, selector: TemplateSelector) -> List[str]:
+        """
+        返回满足条件的模板文件路径，最外层的前置脚本文件总是包含在内
+        :param selector:
+        :return: 与 ApiParser.get_all_files 格式相同的文件路径
+        """
+        prefixes = selector.prefixes
+        files = []
+        seen = set()
+        # 前置脚本位于根目录，根目录总是需要列出
+        self._walk('', prefixes, files, seen)
+
+        selected = []
+        for file_name in sorted(files):
+            path = self.template_path(file_name)
+            if path != '/prerequest':
+                if not selector.match_path(path):
+                    continue
+                if selector.has_tags:
+                    entry = self._entry(file_name)
+                    if entry is None or not selector.match_tags(entry['tags']):
+                        continue
+            selected.append(os.path.join(self._dir_url, file_name))
+        if prefixes is None:
+            # 全量扫描时清理已删除的目录与模板
+            removed = set(self._dirs) - seen
+            stale = set(self._templates) - set(files)
+            for directory in removed:
+                del self._dirs[directory]
+            for file_name in stale:
+                del self._templates[file_name]
+            self._changed = self._changed or bool(removed or stale)
+        self.save()
+        return selected
+
+    def save(self):
+        if not self._changed:
+            return
+        temp_path = '{}.tmp'.format(self._index_path)
+        try:
+            index_dir = os.path.dirname(self._index_path)
+            if index_dir:
+                os.makedirs(index_dir, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'dirs': self._dirs, 'templates': self._templates}, f, ensure_ascii=False)
+            os.replace(temp_path, self._index_path)
+            self._changed = False
+        except OSError as e:
+            logging.info('%s-%s', 'Template Index', "can't save index {}: {}".format(self._index_path, e))
@@ -0,0 +1,252 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    List,
+    Dict,
+    Any
+)
+
+from aiohttp import hdrs
+
+from aapi.assertion import (
+    JsonSchema,
+    compile_assertions
+)
+from aapi.parser import (
+    ApiParser,
+    RequestType
+)
+from aapi.pipeline import open_file
+from aapi.plan import (
+    FLAGS,
+    is_slot
+)
+from aapi.pool import (
+    is_pool_ref,
+    resolve_pool_path
+)
+
+SCRIPT_SCHEMA = {
+    'type': 'object',
+    'required': ['type', 'exec'],
+    'properties': {
+        'type': {'type': 'string'},
+        'exec': {'type': 'array', 'items': {'type': 'string'}},
+    },
+}
+
+PREREQUEST_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'prerequest': SCRIPT_SCHEMA,
+        'test': SCRIPT_SCHEMA,
+    },
+    'additionalProperties': False,
+}
+
+# GET 模板忽略 body，只在 POST 模板中校验
+BODY_SCHEMA = {
+    'type': 'object',
+    'required': ['mode', 'data'],
+    'properties': {
+        'mode': {'enum': [t.value for t in RequestType if t != RequestType.NONE]},
+        'data': {'type': 'object'},
+    },
+}
+
+TEMPLATE_SCHEMA = {
+    'type': 'object',
+    'required': ['method'],
+    'properties': {
+        'name': {'type': 'string'},
+        'uri': {'type': 'string'},
+        'tags': {'type': 'array', 'items': {'type': 'string'}},
+        'method': {'type': 'string'},
+        'headers': {'type': 'object'},
+        'query': {'type': 'object'},
+        'params': {'type': 'object'},
+        'body': {'type': 'object'},
+        'event': {'type': 'object'},
+        'assert': {
+            'type': 'object',
+            'properties': {flag: {'type': 'object'} for flag in FLAGS},
+            'additionalProperties': False,
+        },
+    },
+}
+
+
+class TemplateError(object):
+    """
+    模板错误，location 为错误在模板中的 json path
+    """
+
+    def __init__(self, file_path: str, location: str, message: str):
+        self.file_path = file_path
+        self.location = location
+        self.message = message
+
+    def __str__(self):
+        return '{file}: {location}: {message}'.format(file=self.file_path, location=self.location,
+                                                       message=self.message)
+
+
+class TemplateLinter(object):
+    """
+    模板校验，在展开用例之前一次性找出全部模板的错误。
+    schema 只编译一次，模板较多时按文件分片在多个进程中并行校验
+    """
+    # 模板数量少于该值时不启动子进程
+    PARALLEL_MIN = 64
+
+    def __init__(self, dir_url: str, workers: int = None):
+        """
+        :param dir_url: 模板文件夹
+        :param workers: 并行校验的进程数，默认为 cpu 数
+        """
+        self._dir_url = dir_url
+        self._workers = workers or os.cpu_count() or 1
+        self._parser = ApiParser(host='', dir_url=dir_url)
+        self._template = JsonSchema(TEMPLATE_SCHEMA)
+        self._prerequest = JsonSchema(PREREQUEST_SCHEMA)
+        self._body = JsonSchema(BODY_SCHEMA)
+
+    @staticmethod
+    def _schema_errors(schema: JsonSchema, file_path: str, data: Any, path: str = '$') -> List[TemplateError]:
+        errors = []
+        for error in schema.validate(data, path):
+            location, _, message = error.partition(': ')
+            errors.append(TemplateError(file_path, location, message))
+        return errors
+
+    def _check_slots(self, file_path: str, value: Any, location: str, errors: List[TemplateError]):
+        """
+        检查参数中的取值槽，只包含 true/false 但取值不是列表或取值池引用的字典会被当作固定值，视为错误
+        :param file_path:
+        :param value:
+        :param location:
+        :param errors:
+        :return:
+        """
+        if isinstance(value, dict):
+            if value and set(value) <= set(FLAGS):
+                if not is_slot(value):
+                    for flag, values in value.items():
+                        if not isinstance(values, list) and not is_pool_ref(values):
+                            errors.append(TemplateError(file_path, '{}.{}'.format(location, flag),
+                                                        'slot values must be list or pool reference'))
+                    return
+                for flag, values in value.items():
+                    if is_pool_ref(values):
+                        self._check_pool(file_path, values, '{}.{}'.format(location, flag), errors)
+                return
+            for k, v in value.items():
+                self._check_slots(file_path, v, '{}.{}'.format(location, k), errors)
+        elif isinstance(value, list):
+            for index, v in enumerate(value):
+                self._check_slots(file_path, v, '{}[{}]'.format(location, index), errors)
+
+    def _check_pool(self, file_path: str, ref: Dict, location: str, errors: List[TemplateError]):
+        path = resolve_pool_path(ref, self._dir_url)
+        if not os.path.isfile(path):
+            errors.append(TemplateError(file_path, '{}.pool'.format(location), 'pool file {} not exists'.format(path)))
+            return
+        if not str(ref.get('sample', 1)).isdigit():
+            errors.append(TemplateError(file_path, '{}.sample'.format(location), 'sample must be an integer'))
+        column = ref.get('column')
+        if column is not None:
+            with open(path, encoding='utf-8', newline='') as f:
+                header = next(csv.reader(f, delimiter=ref.get('delimiter', ',')), [])
+            if column not in header:
+                errors.append(TemplateError(file_path, '{}.column'.format(location),
+                                            'column {} not in pool header'.format(column)))
+
+    def check_template(self, file_path: str, data: Any) -> List[TemplateError]:
+        """
+        校验单个模板的数据
+        :param file_path: 模板文件路径，用于定位错误
+        :param data: 模板数据
+        :return:
+        """
+        if self._parser.is_prerequest(file_path):
+            errors = self._schema_errors(self._prerequest, file_path, data)
+            if isinstance(data, dict) and 'prerequest' not in data and 'test' not in data:
+                errors.append(TemplateError(file_path, '$', 'missing required prerequest or test'))
+            return errors
+
+        errors = self._schema_errors(self._template, file_path, data)
+        if not isinstance(data, dict):
+            return errors
+
+        method = data.get('method')
+        if isinstance(method, str):
+            method = method.upper()
+            if method not in [hdrs.METH_GET, hdrs.METH_POST]:
+                errors.append(TemplateError(file_path, '$.method',
+                                            'unsupported method {}, choice from {{get, post}}'.format(data['method'])))
+            elif method == hdrs.METH_GET and 'params' not in data:
+                errors.append(TemplateError(file_path, '$', 'missing required params of GET'))
+            elif method == hdrs.METH_POST and 'body' not in data:
+                errors.append(TemplateError(file_path, '$', 'missing required body of POST'))
+            elif method == hdrs.METH_POST:
+                errors.extend(self._schema_errors(self._body, file_path, data['body'], '$.body'))
+
+        if method == hdrs.METH_GET and isinstance(data.get('params'), dict):
+            self._check_slots(file_path, data['params'], '$.params', errors)
+        body = data.get('body')
+        if method == hdrs.METH_POST and isinstance(body, dict) and isinstance(body.get('data'), dict):
+            self._check_slots(file_path, body['data'], '$.body.data', errors)
+
+        declare = data.get('assert')
+        if isinstance(declare, dict):
+            for flag in FLAGS:
+                if not isinstance(declare.get(flag), dict):
+                    continue
+                try:
+                    compile_assertions(data, flag)
+                except (ValueError, TypeError, KeyError) as e:
+                    errors.append(TemplateError(file_path, '$.assert.{}'.format(flag), str(e)))
+        return errors
+
+    def check_file(self, file_path: str) -> List[TemplateError]:
+        try:
+            with open_file(file_path) as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            return [TemplateError(file_path, '$', 'invalid json at line {line} column {column}: {msg}'.format(
+                line=e.lineno, column=e.colno, msg=e.msg))]
+        except (OSError, UnicodeDecodeError) as e:
+            return [TemplateError(file_path, '$', str(e))]
+        return self.check_template(file_path, data)
+
+    def check_files(self, files: List[str]) -> List[TemplateError]:
+        errors = []
+        for file_path in files:
+            errors.extend(self.check_file(file_path))
+        return errors
+
+    def lint(self, files: List[str] = None) -> List[TemplateError]:
+        """
+        校验模板文件，返回全部错误，按文件顺序排列
+        :param files: 只校验指定的模板文件，默认为目录下的全部文件
+        :return:
+        """
+        files = self._parser.get_all_files() if files is None else files
+        workers = min(self._workers, len(files))
+        if workers <= 1 or len(files) < self.PARALLEL_MIN:
+            return self.check_files(files)
+
+        # 连续分片，合并后保持文件顺序
+        size = (len(files) + workers - 1) // workers
+        parts = [files[i:i + size] for i in range(0, len(files), size)]
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part_errors in pool.map(_lint_files, [self._dir_url] * len(parts), parts):
+                errors.extend(part_errors)
+        return errors
+
+
+def _lint_files(dir_url: str, files: List[str]) -> List[TemplateError]:
+    return TemplateLinter(dir_url, workers=1).check_files(files)
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+
+from aapi.store import SqliteResultStore
+
+
+def result_signature(result: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    用例执行结果的行为签名，签名相同的用例视为覆盖了服务端相同的处理分支。
+    包含状态码、是否通过、响应结构签名，请求异常时为异常类型
+    :param result: SqliteResultStore.results 返回的一行
+    :return:
+    """
+    error = result.get('error')
+    error_type = error.split(':', 1)[0] if error and result.get('status') is None else None
+    return result.get('status'), bool(result.get('passed')), result.get('shape'), error_type
+
+
+def minimize_results(results: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    按分组对用例的行为签名聚类，每个签名只保留一个耗时最短的用例，
+    得到覆盖全部行为签名的最小用例集合
+    :param results: SqliteResultStore.results 的返回值
+    :return: 分组标识 -> 保留的用例名称
+    """
+    chosen = {}
+    for result in results:
+        key = (result['group_key'], result_signature(result))
+        current = chosen.get(key)
+        if current is None or (result['latency'], result['name']) < (current['latency'], current['name']):
+            chosen[key] = result
+
+    groups = {}
+    for (group_key, _), result in chosen.items():
+        groups.setdefault(group_key, []).append(result['name'])
+    return {group_key: sorted(names) for group_key, names in sorted(groups.items())}
+
+
+class PinnedCases(object):
+    """
+    固定的用例列表，按分组标识（path@md5）记录保留的用例名称。
+    模板变化后分组标识改变，该分组不再受固定列表约束，重新展开全部用例
+    """
+
+    def __init__(self, groups: Dict[str, List[str]] = None, run_id: int = None, seed: int = 0):
+        """
+        :param groups: 分组标识 -> 保留的用例名称
+        :param run_id: 生成该列表的执行编号
+        :param seed: 用例名称对应的参数组合随机种子
+        """
+        self._groups = {k: set(v) for k, v in (groups or {}).items()}
+        self._run_id = run_id
+        self._seed = seed
+
+    @property
+    def groups(self) -> Dict[str, List[str]]:
+        return {k: sorted(v) for k, v in self._groups.items()}
+
+    @property
+    def run_id(self) -> Optional[int]:
+        return self._run_id
+
+    @property
+    def seed(self) -> int:
+        return self._seed
+
+    @classmethod
+    def from_run(cls, store: SqliteResultStore, run_id: int, seed: int = 0) -> 'PinnedCases':
+        """
+        根据一次执行的结果生成最小用例集合
+        :param store:
+        :param run_id:
+        :param seed: 该次执行使用的随机种子
+        :return:
+        """
+        return cls(minimize_results(store.results(run_id)), run_id=run_id, seed=seed)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'PinnedCases':
+        with open(file_path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('groups', {}), run_id=data.get('run_id'), seed=data.get('seed', 0))
+
+    def save(self, file_path: str):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'run_id': self._run_id, 'seed': self._seed, 'groups': self.groups}, f,
+                      ensure_ascii=False, indent=2)
+            f.write('\n')
+
+    def apply(self, groups: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按固定列表过滤用例，不在固定列表中的分组保持不变
+        :param groups: ApiParser.create_request_cases 的返回值
+        :return:
+        """
+        pinned = {}
+        total = kept = 0
+        for group_key, cases in groups.items():
+            names = self._groups.get(group_key)
+            if names is None or group_key == 'prerequest' or cases is None:
+                pinned[group_key] = cases
+                continue
+            total += len(cases)
+            pinned[group_key] = [case for case in cases if case.name in names]
+            kept += len(pinned[group_key])
+        logging.info('%s-%s', 'Pinned Cases', 'keep {kept} of {total} pinned cases'.format(kept=kept, total=total))
+        return pinned
+
+    def __str__(self):
+        return '{groups} groups, {cases} cases pinned from run {run_id}'.format(
+            groups=len(self._groups), cases=sum(len(v) for v in self._groups.values()), run_id=self._run_id)
+
+
+def load_pinned(file_path: str, seed: int = 0) -> Optional[PinnedCases]:
+    """
+    载入固定的用例列表，文件不存在或者随机种子不一致（用例名称对应的参数不同）时返回 None
+    :param file_path:
+    :param seed:
+    :return:
+    """
+    if not os.path.exists(file_path):
+        logging.info('%s-%s', 'Pinned Cases', 'pinned file {} not exists, run all cases'.format(file_path))
+        return None
+    pinned = PinnedCases.load(file_path)
+    if pinned.seed != seed:
+        logging.info('%s-%s', 'Pinned Cases', 'seed {} differs from pinned seed {}, run all cases'.format(
+            seed, pinned.seed))
+        return None
+    return pinned
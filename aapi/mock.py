@@ -0,0 +1,149 @@
+import asyncio
+import base64
+import json
+import logging
+from typing import (
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+from urllib.parse import (
+    urlparse,
+    parse_qsl
+)
+
+from aiohttp import (
+    hdrs,
+    web
+)
+
+from aapi.pipeline import open_file
+
+# 由 aiohttp 重新计算或者不适用于回放内容的响应头
+SKIP_HEADERS = {
+    hdrs.CONTENT_LENGTH.lower(),
+    hdrs.CONTENT_ENCODING.lower(),
+    hdrs.TRANSFER_ENCODING.lower(),
+    hdrs.CONNECTION.lower(),
+    hdrs.KEEP_ALIVE.lower(),
+}
+
+
+class MockResponse(object):
+    """
+    预先构建好的回放响应
+    """
+
+    def __init__(self, status: int, headers: List[Tuple[str, str]], body: bytes, wait: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.wait = wait
+
+
+class HarMockServer(object):
+    """
+    根据 .har 文件中录制的响应启动本地服务，
+    请求按 method、规范化后的 path 以及 query 匹配，匹配索引在启动前构建
+    """
+    LATENCY_HAR = 'har'
+
+    def __init__(self, file_path: str, latency: Any = 0):
+        """
+        :param file_path: .har 文件
+        :param latency: 注入的延迟，单位毫秒，为 har 时使用录制时的服务端等待时间
+        """
+        self._file_path = file_path
+        self._latency = latency
+        self._index = {}
+        self._path_index = {}
+        self._cursor = {}
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        return '/' + '/'.join([p for p in path.split('/') if p])
+
+    @staticmethod
+    def normalize_query(query: List[Tuple[str, str]]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted(query))
+
+    @staticmethod
+    def make_response(entry: Dict) -> MockResponse:
+        response = entry['response']
+        content = response.get('content', {})
+        text = content.get('text', '')
+        if content.get('encoding') == 'base64':
+            body = base64.b64decode(text)
+        else:
+            body = text.encode('utf-8')
+        headers = [(h['name'], h['value']) for h in response.get('headers', [])
+                   if h['name'].lower() not in SKIP_HEADERS and not h['name'].startswith(':')]
+        wait = entry.get('timings', {}).get('wait', entry.get('time', 0))
+        return MockResponse(status=response['status'], headers=headers, body=body, wait=max(wait or 0, 0))
+
+    def build_index(self) -> int:
+        """
+        构建匹配索引，返回索引的响应数量
+        :return:
+        """
+        with open_file(self._file_path) as har_file:
+            entries = json.load(har_file)['log']['entries']
+
+        for entry in entries:
+            request = entry['request']
+            if entry.get('response', {}).get('status', 0) <= 0:
+                continue
+            url_parse = urlparse(request['url'])
+            path = self.normalize_path(url_parse.path)
+            key = (request['method'].upper(), path, self.normalize_query(parse_qsl(url_parse.query,
+                                                                                 keep_blank_values=True)))
+            response = self.make_response(entry)
+            self._index.setdefault(key, []).append(response)
+            self._path_index.setdefault(key[:2], []).append(response)
+        return len(entries)
+
+    def match(self, method: str, path: str, query: List[Tuple[str, str]]) -> Optional[MockResponse]:
+        """
+        优先完全匹配，query 不一致时退化为 method 与 path 匹配，
+        同一个请求录制了多个响应时依次轮流返回
+        :param method:
+        :param path:
+        :param query:
+        :return:
+        """
+        key = (method.upper(), self.normalize_path(path), self.normalize_query(query))
+        responses = self._index.get(key)
+        if responses is None:
+            key = key[:2]
+            responses = self._path_index.get(key)
+        if not responses:
+            return None
+        cursor = self._cursor.get(key, 0)
+        self._cursor[key] = cursor + 1
+        return responses[cursor % len(responses)]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        response = self.match(request.method, request.path, list(request.query.items()))
+        if response is None:
+            logging.info('%s-%s', 'Mock', 'not matched: {} {}'.format(request.method, request.path_qs))
+            return web.Response(status=404, text='no recorded response')
+
+        wait = response.wait if self._latency == self.LATENCY_HAR else float(self._latency or 0)
+        if wait > 0:
+            await asyncio.sleep(wait / 1000)
+        return web.Response(status=response.status, headers=response.headers, body=response.body)
+
+    def create_app(self) -> web.Application:
+        if not self._index:
+            self.build_index()
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+        return app
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8080):
+        app = self.create_app()
+        logging.info('%s-%s', 'Mock', 'serve {} responses on http://{}:{}'.format(
+            sum(len(r) for r in self._index.values()), host, port))
+        web.run_app(app, host=host, port=port, print=None)
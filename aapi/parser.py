@@ -1,5 +1,5 @@
-import datetime
 import hashlib
+import io
 import logging
 import json
 import os
@@ -8,14 +8,36 @@ import random
 from abc import abstractmethod
 from enum import Enum
 from typing import (
+    Iterator,
     List,
     Dict,
+    Sequence,
+    Set,
+    Tuple,
+    Optional,
     Any
 )
 from urllib.parse import urlparse
 
 from aiohttp import hdrs
 
+from aapi.assertion import (
+    CaseAssertion,
+    compile_assertions
+)
+from aapi.pipeline import (
+    TemplateSource,
+    TemplateSink,
+    DirectoryTemplateSink,
+    as_sink,
+    load_json,
+    open_file,
+    split_compression
+)
+from aapi.plan import GenerationPlan
+from aapi.pool import pool_signature
+from aapi.stream import iter_json_array
+
 
 class RequestType(Enum):
     """
@@ -96,6 +118,14 @@ class RequestBody(object):
         """
         return self._mode
 
+    @property
+    def data(self) -> Dict:
+        """
+        请求体原始参数
+        :return:
+        """
+        return self._data
+
     @abstractmethod
     def content(self) -> Any:
         """
@@ -148,16 +178,19 @@ class RequestCase(object):
 
     def __init__(self, name: str, host: str, uri: str, method: str,
                  headers: Dict, query: Dict = None, params: Dict = None,
-                 body: RequestBody = None, expect_result: bool = True):
+                 body: RequestBody = None, expect_result: bool = True,
+                 assertion: CaseAssertion = None):
         self._name = name
         self._host = host
         self._uri = uri
         self._method = method
-        self._headers = headers
+        # headers 在模板中是可选的，缺省时与空字典一致
+        self._headers = headers if headers is not None else {}
         self._query = query
         self._params = params
         self._body = body
         self._expect_result = expect_result
+        self._assertion = assertion
 
     @property
     def name(self) -> str:
@@ -195,9 +228,62 @@ class RequestCase(object):
     def expect_result(self) -> bool:
         return self._expect_result
 
+    @property
+    def assertion(self) -> CaseAssertion:
+        """
+        响应断言，未设置时按照 expect_result 使用默认断言
+        :return:
+        """
+        if self._assertion is None:
+            self._assertion = compile_assertions({}, 'true' if self._expect_result else 'false')
+        return self._assertion
+
 
 class ResponseCase(object):
-    pass
+    """
+    响应对象，将请求结果进行抽象
+    """
+
+    def __init__(self, status: int, headers: Dict, content: bytes, latency: float):
+        self._status = status
+        self._headers = headers
+        self._content = content
+        self._latency = latency
+        self._json = None
+        self._json_loaded = False
+
+    @property
+    def status(self) -> int:
+        return self._status
+
+    @property
+    def headers(self) -> Dict:
+        return self._headers
+
+    @property
+    def content(self) -> bytes:
+        return self._content
+
+    @property
+    def latency(self) -> float:
+        """
+        请求耗时，单位毫秒
+        :return:
+        """
+        return self._latency
+
+    def json(self) -> Any:
+        """
+        解析后的响应体，只解析一次，非 json 响应返回 None
+        :return:
+        """
+        if not self._json_loaded:
+            self._json_loaded = True
+            try:
+                self._json = json.loads(self._content)
+            except ValueError:
+                self._json = None
+        return self._json
 
 
 class ApiParser(object):
@@ -205,15 +291,30 @@ class ApiParser(object):
     解析器，用于将自定义的 json 文件转换为请求对象
     """
 
-    def __init__(self, host: str, dir_url: str):
+    def __init__(self, host: str, dir_url: str, seed: int = 0):
         self._host = host
         self._dir_url = dir_url
+        self._seed = seed
+        self._random = random.Random(seed)
+
+    @property
+    def host(self) -> str:
+        return self._host
+
+    @property
+    def dir_url(self) -> str:
+        return self._dir_url
+
+    @property
+    def seed(self) -> int:
+        return self._seed
 
     def get_all_files(self):
         file_paths = []
 
         def loop_file(url):
-            for f_url in os.listdir(url):
+            # 排序保证每次生成的分组顺序一致
+            for f_url in sorted(os.listdir(url)):
                 file_path = os.path.join(url, f_url)
                 if os.path.isdir(file_path):
                     loop_file(file_path)
@@ -223,90 +324,99 @@ class ApiParser(object):
         loop_file(self._dir_url)
         return file_paths
 
-    def _parse_get_json_data(self, name: str, uri: str, data: Dict) -> List[RequestCase]:
+    @staticmethod
+    def case_name(name: str, data: Dict, flag: str, index: int) -> str:
         """
-        解析操作为 get 的 json 数据
+        生成稳定的用例名称，同一模板多次生成的名称保持一致
         :param name:
-        :param uri:
         :param data:
+        :param flag:
+        :param index: 用例在同类参数组合中的序号
         :return:
         """
-        params = data.get('params')
-        if params is None:
-            raise ValueError("GET case can't found params data")
-
-        if not params:
-            data_name = data.get('name')
-            data_uri = data.get('uri')
-            return [RequestCase(
-                name='{name}_true_{date}'.format(name=name if data_name is None else data_name,
-                                                 date=datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')),
-                host=self._host,
-                uri=uri if data_uri is None else data_uri,
-                method=hdrs.METH_GET,
-                headers=data.get('headers'),
-                params={},
-                query=data.get('query'),
-                expect_result=True
-            )]
-
-        cases = []
-        for flag in ['true', 'false']:
-            for pa in self.create_params(params, flag):
-                data_name = data.get('name')
-                data_uri = data.get('uri')
-                cases.append(RequestCase(
-                    name='{name}_{flag}_{date}'.format(name=name if data_name is None else data_name,
-                                                       flag=flag,
-                                                       date=datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')),
-                    host=self._host,
-                    uri=uri if data_uri is None else data_uri,
-                    method=hdrs.METH_GET,
-                    headers=data.get('headers'),
-                    params=pa,
-                    query=data.get('query'),
-                    expect_result=True if flag == 'true' else False
-                ))
-        return cases
+        data_name = data.get('name')
+        return '{name}_{flag}_{index}'.format(name=name if data_name is None else data_name,
+                                              flag=flag,
+                                              index=index)
 
-    def _parse_post_json_data(self, name: str, uri: str, data: Dict) -> List[RequestCase]:
+    @staticmethod
+    def create_body(mode: str, data: Dict) -> RequestBody:
         """
-        解析操作为 post 的 json 数据
+        按模板中的 body.mode 创建请求体，未知的 mode 返回 None
+        :param mode:
+        :param data:
+        :return:
+        """
+        if mode == RequestType.FORM_DATA.value:
+            return FormDataRequestBody(data)
+        if mode == RequestType.X_WWW_FORM_URLENCODED.value:
+            return UrlEncodedRequestBody(data)
+        if mode == RequestType.RAW.value:
+            return RawRequestBody(data)
+        return None
+
+    def create_case(self, name: str, uri: str, data: Dict, flag: str, index: int, params: Any,
+                    assertion: CaseAssertion) -> RequestCase:
+        """
+        根据一组参数构建用例，get 模板的参数作为 url 参数，post 模板的参数作为请求体
         :param name:
         :param uri:
-        :param data:
+        :param data: 模板数据
+        :param flag: true/false
+        :param index: 用例在同类参数组合中的序号
+        :param params: 参数组合
+        :param assertion:
         :return:
         """
+        data_uri = data.get('uri')
+        method = data['method'].upper()
+        return RequestCase(
+            name=self.case_name(name, data, flag, index),
+            host=self._host,
+            uri=uri if data_uri is None else data_uri,
+            method=method,
+            headers=data.get('headers'),
+            query=data.get('query'),
+            params=params if method == hdrs.METH_GET else None,
+            body=self.create_body(data['body']['mode'], params) if method == hdrs.METH_POST else None,
+            expect_result=True if flag == 'true' else False,
+            assertion=assertion
+        )
+
+    def create_plan(self, data: Dict) -> Optional[GenerationPlan]:
+        """
+        模板的参数生成计划，get 模板的 params 为空时没有参数组合，返回 None
+        :param data: 模板数据
+        :return:
+        """
+        if data['method'].upper() == hdrs.METH_GET:
+            params = data.get('params')
+            if params is None:
+                raise ValueError("GET case can't found params data")
+            return GenerationPlan(params, self._dir_url) if params else None
+
         body = data.get('body')
         if body is None:
             raise ValueError("POST case can't found body data")
+        return GenerationPlan(body['data'], self._dir_url)
+
+    def _parse_plan_data(self, name: str, uri: str, data: Dict) -> List[RequestCase]:
+        """
+        按生成计划展开 get/post 模板
+        :param name:
+        :param uri:
+        :param data:
+        :return:
+        """
+        plan = self.create_plan(data)
+        if plan is None:
+            return [self.create_case(name, uri, data, 'true', 0, {}, compile_assertions(data, 'true'))]
 
         cases = []
         for flag in ['true', 'false']:
-            for pa in self.create_params(body['data'], flag):
-                data_name = data.get('name')
-                data_uri = data.get('uri')
-                mode = body['mode']
-                body_obj = None
-                if mode == RequestType.FORM_DATA.value:
-                    body_obj = FormDataRequestBody(pa)
-                elif mode == RequestType.X_WWW_FORM_URLENCODED.value:
-                    body_obj = UrlEncodedRequestBody(pa)
-                elif mode == RequestType.RAW.value:
-                    body_obj = RawRequestBody(pa)
-                cases.append(RequestCase(
-                    name='{name}_{flag}_{date}'.format(name=name if data_name is None else data_name,
-                                                       flag=flag,
-                                                       date=datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')),
-                    host=self._host,
-                    uri=uri if data_uri is None else data_uri,
-                    method=hdrs.METH_POST,
-                    headers=data.get('headers'),
-                    query=data.get('query'),
-                    body=body_obj,
-                    expect_result=True if flag == 'true' else False
-                ))
-
+            assertion = compile_assertions(data, flag)
+            for index, pa in enumerate(plan.expand(flag, self._random)):
+                cases.append(self.create_case(name, uri, data, flag, index, pa, assertion))
         return cases
 
     def parse_json_data(self, name: str, uri: str, data: Dict) -> List[RequestCase]:
@@ -323,11 +433,8 @@ class ApiParser(object):
 
         method = method.upper()
 
-        if method == hdrs.METH_GET:
-            return self._parse_get_json_data(name, uri, data)
-
-        if method == hdrs.METH_POST:
-            return self._parse_post_json_data(name, uri, data)
+        if method in [hdrs.METH_GET, hdrs.METH_POST]:
+            return self._parse_plan_data(name, uri, data)
 
     @staticmethod
     def parse_event_data(uri: str, data: Dict) -> List[RequestPre]:
@@ -346,66 +453,115 @@ class ApiParser(object):
             )
         ) for k, v in data.items()]
 
-    def create_request_cases(self) -> Dict[str, List]:
+    def is_prerequest(self, case_path: str) -> bool:
         """
-        构建并返回请求对象并返回
+        是否为最外层的前置脚本文件
+        :param case_path:
         :return:
         """
-        groups = {}
-        for case_path in self.get_all_files():
-            with open(case_path, encoding='utf-8') as case_f:
-                json_data = json.load(case_f)
-                file_path = case_path.replace(self._dir_url, '').replace('.json', '')
-                if file_path == '/prerequest' or (platform.system().lower() == 'windows' and file_path == 'prerequest'):
-                    groups['prerequest'] = self.parse_event_data(file_path, json_data)
-                    continue
-
-                uri = file_path
-                if platform.system().lower() == 'windows':
-                    uri = '/{}'.format('/'.join(uri.split('\\')))
-                    uri = uri.replace('//', '/')
-
-                code = hashlib.md5(str(json_data).encode(encoding='utf-8')).hexdigest()
-                groups['{path}@{code}'.format(path=uri, code=code)] = self.parse_json_data(
-                    name=uri,
-                    uri=uri,
-                    data=json_data)
-        return groups
+        return self.is_prerequest_name(self.template_path(case_path))
+
+    def template_path(self, case_path: str) -> str:
+        # 模板文件可以是压缩文件，例如 a.json.gz
+        return split_compression(case_path)[0].replace(self._dir_url, '', 1).replace('.json', '')
 
     @staticmethod
-    def same_removal(data: List[Dict]):
-        temp = []
-        for d in data:
-            temp += [] if d in temp else [d]
-        return temp
+    def is_prerequest_name(file_path: str) -> bool:
+        return file_path == '/prerequest' or (platform.system().lower() == 'windows' and file_path == 'prerequest')
 
-    def create_params(self, params: Dict, flag: str) -> List[Dict]:
+    def parse_file(self, case_path: str, known_groups: Set[str] = None) -> Tuple[str, Any]:
         """
-        对参数进行解析
-        :param params:
-        :param flag:
+        解析单个模板文件
+        :param case_path: 模板文件路径
+        :param known_groups: 已存在的分组标识集合，命中的分组不再展开，值为 None
+        :return: 分组标识与用例列表，前置脚本文件的分组标识为 prerequest
+        """
+        with open_file(case_path) as case_f:
+            json_data = json.load(case_f)
+
+        return self.parse_template(self.template_path(case_path), json_data, known_groups)
+
+    def parse_template(self, file_path: str, json_data: Dict, known_groups: Set[str] = None) -> Tuple[str, Any]:
+        """
+        解析模板数据，不依赖模板文件
+        :param file_path: 模板相对于模板文件夹的路径（不含 .json），即请求路径
+        :param json_data: 模板数据
+        :param known_groups: 已存在的分组标识集合，命中的分组不再展开，值为 None
+        :return: 分组标识与用例列表，前置脚本文件的分组标识为 prerequest
+        """
+        if self.is_prerequest_name(file_path):
+            return 'prerequest', self.parse_event_data(file_path, json_data)
+
+        uri, group_key = self.template_key(file_path, json_data)
+        if known_groups is not None and group_key in known_groups:
+            return group_key, None
+
+        self.seed_group(group_key)
+        return group_key, self.parse_json_data(
+            name=uri,
+            uri=uri,
+            data=json_data)
+
+    def template_key(self, file_path: str, json_data: Dict) -> Tuple[str, str]:
+        """
+        模板的请求路径与分组标识（path@md5）
+        :param file_path: 模板相对于模板文件夹的路径（不含 .json）
+        :param json_data: 模板数据
         :return:
         """
-        items_flag = []
-        for k, v in {pk: pv[flag] for pk, pv in params.items()}.items():
-            for real_v in v:
-                json_params = {k: real_v}
-                for kk, vv in {s_pk: s_pv[flag] for s_pk, s_pv in params.items() if s_pk != k}.items():
-                    if not vv:
-                        json_params[kk] = ''
-                        continue
-                    json_params[kk] = random.choice(vv)
-                items_flag.append(json_params)
+        uri = file_path
+        if platform.system().lower() == 'windows':
+            uri = '/{}'.format('/'.join(uri.split('\\')))
+            uri = uri.replace('//', '/')
+
+        content = str(json_data)
+        # 引用了取值池的模板，取值池文件变化时分组标识随之变化
+        signature = pool_signature(json_data, self._dir_url)
+        if signature:
+            content = '{content}#{signature}'.format(content=content, signature=signature)
+        code = hashlib.md5(content.encode(encoding='utf-8')).hexdigest()
+        return uri, '{path}@{code}'.format(path=uri, code=code)
+
+    def seed_group(self, group_key: str) -> random.Random:
+        """
+        以分组标识作为随机种子，模板不变时生成的参数组合不变
+        :param group_key:
+        :return:
+        """
+        self._random.seed('{seed}@{key}'.format(seed=self._seed, key=group_key))
+        return self._random
 
-        new_items = self.same_removal(items_flag)
-        return new_items
+    def create_request_cases(self, known_groups: Set[str] = None, files: List[str] = None,
+                             source: TemplateSource = None) -> Dict[str, List]:
+        """
+        构建并返回请求对象并返回
+        :param known_groups: 已存在的分组标识集合，命中的分组不再展开，值为 None
+        :param files: 只解析指定的模板文件，默认为目录下的全部文件
+        :param source: 模板来源，例如内存中的模板，指定时不读取模板文件夹
+        :return:
+        """
+        groups = {}
+        if source is not None:
+            for file_path, json_data in source.iter_templates():
+                group_key, cases = self.parse_template(file_path, json_data, known_groups)
+                groups[group_key] = cases
+            return groups
+
+        for case_path in self.get_all_files() if files is None else files:
+            group_key, cases = self.parse_file(case_path, known_groups)
+            groups[group_key] = cases
+        return groups
 
 
 class FileParser(object):
     TYPE_RAW = 'text/plain;charset=UTF-8'
     TYPE_FORM_DATA = 'application/json;charset=UTF-8'
 
-    def __init__(self, dir_path: str, file_path: str):
+    def __init__(self, dir_path: str, file_path: Any):
+        """
+        :param dir_path: 输出文件夹
+        :param file_path: 输入文件路径，也可以是文件对象或已经解析好的数据
+        """
         self._file_path = file_path
         self._dir_path = dir_path
 
@@ -422,10 +578,29 @@ class FileParser(object):
 
     def _load_file(self):
         # 载入 .har 文件
-        with open(self._file_path, encoding='utf-8') as har_file:
-            har_data = json.load(har_file)
+        return load_json(self._file_path)
 
-        return har_data
+    def _iter_entries(self, path: Sequence[str] = ()) -> Iterator[Any]:
+        """
+        流式读取输入文件中 path 位置的数组，内存占用只与单个元素有关，已经解析好的数据直接遍历
+        :param path: 数组所在的键路径，为空时根节点即数组
+        :return:
+        """
+        source = self._file_path
+        if isinstance(source, (dict, list)):
+            for key in path:
+                source = source[key]
+            yield from source
+            return
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        if isinstance(source, str):
+            with open_file(source) as fp:
+                yield from iter_json_array(fp, path)
+            return
+        if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+            source = io.TextIOWrapper(source, encoding='utf-8')
+        yield from iter_json_array(source, path)
 
     @abstractmethod
     def create_json(self):
@@ -434,6 +609,18 @@ class FileParser(object):
 
 class TemplateParser(FileParser):
 
+    def __init__(self, dir_path: str, file_path: Any, sink: TemplateSink = None):
+        """
+        :param dir_path:
+        :param file_path:
+        :param sink: 模板输出目标，默认写入 dir_path 文件夹
+        """
+        super().__init__(dir_path, file_path)
+        self._sink = sink if sink is not None else DirectoryTemplateSink(dir_path)
+
+    def _flush(self):
+        self._sink.flush()
+
     @abstractmethod
     def create_json(self):
         pass
@@ -441,10 +628,38 @@ class TemplateParser(FileParser):
 
 class PostmanParser(FileParser):
 
-    def __init__(self, dir_path: str, file_path: str, group_name: str):
+    def __init__(self, dir_path: str, file_path: Any, group_name: str, sink: Any = None):
+        """
+        :param dir_path:
+        :param file_path:
+        :param group_name:
+        :param sink: 集合输出目标，可以是 OutputSink、文件对象或回调函数，默认写入当前文件夹
+        """
         super().__init__(dir_path, file_path)
         self._group_name = group_name
         self._output_url = '.'
+        self._sink = as_sink(sink) if sink is not None else None
+
+    def _write_items(self, items: Iterator[Dict], output_path: str, tag: str):
+        """
+        逐个序列化用例并写入集合文件，结果与 json.dump 整个集合相同
+        :param items:
+        :param output_path:
+        :param tag:
+        :return:
+        """
+        sink = self._sink if self._sink is not None else as_sink(output_path)
+        with sink:
+            logging.info('%s-%s', tag, 'output:{}'.format(sink.name))
+            sink.write('{"info": ')
+            sink.write(json.dumps(self.create_info()))
+            sink.write(', "item": [')
+            for index, item in enumerate(items):
+                sink.write(', ' if index else '')
+                sink.write(json.dumps(item))
+            sink.write('], "event": ')
+            sink.write(json.dumps(self.create_events()))
+            sink.write('}')
 
     def create_info(self) -> Dict:
         return {
@@ -534,27 +749,10 @@ class Har2Template(TemplateParser):
         return template_data
 
     def _create_template_json(self, uri: str, template_data: Dict):
-        # 分割地址
-        url_paths = uri.split('/')
-        file_name = url_paths.pop(-1)
-        file_path = '/'.join(url_paths)
-        file_absolute_path = self._dir_path + file_path
-
-        # 创建文件夹
-        if not os.path.exists(file_absolute_path):
-            os.makedirs(file_absolute_path)
-
-        # 根据模板数据创建 .json 模板文件
-        create_file_path = os.path.join(file_absolute_path, '{}.json'.format(file_name))
-        if not os.path.exists(create_file_path):
-            with open(create_file_path, 'w') as json_file:
-                logging.info('%s-%s', '.har to json', 'output:{}'.format(create_file_path))
-                json.dump(template_data, json_file)
+        self._sink.write_template(uri, template_data)
 
     def create_json(self):
-        har_data = self._load_file()
-        entries_data = har_data['log']['entries']
-        for d in entries_data:
+        for d in self._iter_entries(('log', 'entries')):
             request_data = d['request']
             url_parse = urlparse(request_data['url'])
             logging.info('%s-%s', '.har to json', 'parse request url: {}'.format(request_data['url']))
@@ -565,6 +763,7 @@ class Har2Template(TemplateParser):
                 continue
 
             self._create_template_json(url_parse.path, self._make_template_data(request_data))
+        self._flush()
 
 
 class Har2Postman(PostmanParser):
@@ -610,19 +809,12 @@ class Har2Postman(PostmanParser):
         return postman_data
 
     def create_json(self):
-        har_data = self._load_file()
-        entries_data = har_data['log']['entries']
-
-        json_data = {
-            'info': self.create_info(),
-            'item': [{
-                'name': case['request']['url'],
-                'event': self.create_case_events(),
-                'request': self.create_request(case),
-                'response': []
-            } for case in entries_data if not self._url_check(case)],
-            'event': self.create_events()
-        }
+        items = ({
+            'name': case['request']['url'],
+            'event': self.create_case_events(),
+            'request': self.create_request(case),
+            'response': []
+        } for case in self._iter_entries(('log', 'entries')) if not self._url_check(case))
 
         # 将结果文件输出到指定路径
         output_path = self._output_url
@@ -631,9 +823,7 @@ class Har2Postman(PostmanParser):
         if '.json' not in output_path:
             output_path = '{}.json'.format(output_path)
 
-        with open(output_path, 'w') as f:
-            logging.info('%s-%s', '.har to json', 'output:{}'.format(output_path))
-            json.dump(json_data, f)
+        self._write_items(items, output_path, '.har to json')
 
 
 class Json2Template(TemplateParser):
@@ -684,26 +874,16 @@ class Json2Template(TemplateParser):
             uri = uri.split('}}')[-1]
         if not uri.startswith('/'):
             uri = '/' + uri
-        url_paths = uri.split('/')
-        file_name = url_paths.pop(-1)
-        file_path = '/'.join(url_paths)
-        file_absolute_path = self._dir_path + file_path
-
-        # 创建文件夹
-        if not os.path.exists(file_absolute_path):
-            os.makedirs(file_absolute_path)
-
-        # 根据模板数据创建 .json 模板文件
-        create_file_path = os.path.join(file_absolute_path, '{}.json'.format(file_name))
-        if not os.path.exists(create_file_path):
-            with open(create_file_path, 'w') as json_file:
-                logging.info('%s-%s', '.har to json', 'output:{}'.format(create_file_path))
-                json.dump(template_data, json_file)
+        self._sink.write_template(uri, template_data)
+
+    @staticmethod
+    def is_active(request_data: Dict) -> bool:
+        # 只转换启用状态的接口
+        return request_data['baseInfo']['apiStatus'] == 0
 
     def create_json(self):
-        entries_data = self._load_file()
-        for request_data in entries_data:
-            if request_data['baseInfo']['apiStatus'] != 0:
+        for request_data in self._iter_entries():
+            if not self.is_active(request_data):
                 continue
             request_url = request_data['baseInfo']['apiURI']
             url_parse = urlparse(request_url)
@@ -711,6 +891,7 @@ class Json2Template(TemplateParser):
             logging.info('%s-%s', '.har to json', 'path: {}'.format(url_parse.path))
 
             self._create_template_json(url_parse.path, self._make_template_data(request_data))
+        self._flush()
 
 
 class Json2Postman(PostmanParser):
@@ -754,28 +935,22 @@ class Json2Postman(PostmanParser):
         return postman_data
 
     def create_json(self):
-        entries_data = self._load_file()
-
-        json_data = {
-            'info': self.create_info(),
-            'item': [{
-                'name': case['baseInfo']['apiURI'],
-                'event': self.create_case_events(),
-                'request': self.create_request(case),
-                'response': []
-            } for case in entries_data],
-            'event': self.create_events()
-        }
+        items = ({
+            'name': case['baseInfo']['apiURI'],
+            'event': self.create_case_events(),
+            'request': self.create_request(case),
+            'response': []
+        } for case in self._iter_entries() if Json2Template.is_active(case))
 
         # 将结果文件输出到指定路径
         output_path = self._output_url
         if os.path.exists(self._output_url) and os.path.isdir(self._output_url):
             output_path = os.path.join(self._output_url, self._group_name)
+        output_path, compression = split_compression(output_path)
         if '.json' not in output_path:
-            output_path = '{}_eolinker_to_postman.json.json'.format(output_path)
+            output_path = '{}_eolinker_to_postman.json'.format(output_path)
         else:
             output_path = '{}_eolinker_to_postman.json'.format(output_path.replace('.json', ''))
+        output_path += compression
 
-        with open(output_path, 'w') as f:
-            logging.info('%s-%s', 'eolinker file .json to json', 'output:{}'.format(output_path))
-            json.dump(json_data, f)
+        self._write_items(items, output_path, 'eolinker file .json to json')
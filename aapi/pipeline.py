@@ -0,0 +1,340 @@
+import bz2
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+from abc import abstractmethod
+from typing import (
+    IO,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Dict,
+    Set,
+    Tuple,
+    Union,
+    Any
+)
+
+# 按扩展名选择压缩格式
+COMPRESSIONS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def split_compression(path: str) -> Tuple[str, str]:
+    """
+    拆分压缩扩展名，例如 a.json.gz 返回 (a.json, .gz)，未压缩的文件扩展名为空字符串
+    :param path:
+    :return:
+    """
+    base, ext = os.path.splitext(path)
+    if ext.lower() in COMPRESSIONS:
+        return base, ext
+    return path, ''
+
+
+def open_file(path: str, mode: str = 'r', encoding: str = 'utf-8') -> IO:
+    """
+    打开文件，.gz/.bz2/.xz 文件按扩展名透明地流式压缩或解压
+    :param path:
+    :param mode: r/w/a，带 b 时为二进制模式
+    :param encoding: 文本模式的编码
+    :return:
+    """
+    _, ext = split_compression(path)
+    binary = 'b' in mode
+    if ext:
+        mode = mode if binary or 't' in mode else mode + 't'
+        return COMPRESSIONS[ext.lower()](path, mode, encoding=None if binary else encoding)
+    return open(path, mode, encoding=None if binary else encoding)
+
+
+def load_json(source: Any) -> Any:
+    """
+    载入 json 数据，source 可以是文件路径、文件对象（文本或二进制）、json 文本，或者已经解析好的 dict/list
+    :param source:
+    :return:
+    """
+    if isinstance(source, (dict, list)):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return json.loads(source.decode('utf-8'))
+    if isinstance(source, str):
+        with open_file(source) as f:
+            return json.load(f)
+    if hasattr(source, 'read'):
+        return json.load(source)
+    raise TypeError("unsupported json source: {}".format(type(source).__name__))
+
+
+def template_name(path: str) -> str:
+    """
+    统一模板名称为以 / 开头、不带 .json 后缀（以及压缩扩展名）的路径，与模板文件相对于模板文件夹的路径一致
+    :param path:
+    :return:
+    """
+    path = split_compression(path.replace('\\', '/'))[0]
+    if path.endswith('.json'):
+        path = path[:-len('.json')]
+    return path if path.startswith('/') else '/' + path
+
+
+class TemplateSource(object):
+    """
+    模板来源，按顺序返回模板名称与模板数据，名称格式见 template_name
+    """
+
+    @abstractmethod
+    def iter_templates(self) -> Iterator[Tuple[str, Any]]:
+        pass
+
+
+class DirectoryTemplateSource(TemplateSource):
+    """
+    模板文件夹，遍历顺序与 ApiParser.get_all_files 一致
+    """
+
+    def __init__(self, dir_url: str):
+        self._dir_url = dir_url
+
+    def _iter_files(self, dir_url: str) -> Iterator[str]:
+        for name in sorted(os.listdir(dir_url)):
+            path = os.path.join(dir_url, name)
+            if os.path.isdir(path):
+                yield from self._iter_files(path)
+            elif '.json' in path:
+                yield path
+
+    def iter_templates(self) -> Iterator[Tuple[str, Any]]:
+        for path in self._iter_files(self._dir_url):
+            yield template_name(path.replace(self._dir_url, '', 1)), load_json(path)
+
+
+class MemoryTemplateSource(TemplateSource):
+    """
+    内存中的模板，templates 为 {名称: 模板} 字典或者 (名称, 模板) 的可迭代对象，
+    模板可以是 dict、json 文本或文件对象
+    """
+
+    def __init__(self, templates: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]]):
+        self._templates = templates
+
+    def iter_templates(self) -> Iterator[Tuple[str, Any]]:
+        items = self._templates.items() if isinstance(self._templates, Mapping) else self._templates
+        for name, data in items:
+            # 字符串形式的模板视为 json 文本而不是文件路径
+            if isinstance(data, str):
+                data = json.loads(data)
+            yield template_name(name), load_json(data)
+
+
+class OutputSink(object):
+    """
+    输出目标，以 with 语句打开后按文本分块写入，
+    json.dump 等接收文件对象的函数可以直接写入
+    """
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def write(self, text: str):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FileSink(OutputSink):
+
+    def __init__(self, file_path: str):
+        self._file_path = file_path
+        self._file = None
+
+    @property
+    def name(self) -> str:
+        return self._file_path
+
+    def open(self):
+        self._file = open_file(self._file_path, 'w')
+
+    def write(self, text: str):
+        self._file.write(text)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StreamSink(OutputSink):
+    """
+    写入调用方提供的文件对象，二进制文件对象写入 utf-8 编码后的内容，不负责关闭
+    """
+
+    def __init__(self, fp: IO):
+        self._fp = fp
+        self._binary = isinstance(fp, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(fp, 'mode', '')
+
+    @property
+    def name(self) -> str:
+        return getattr(self._fp, 'name', None) or super().name
+
+    def write(self, text: str):
+        self._fp.write(text.encode('utf-8') if self._binary else text)
+
+
+class BytesSink(OutputSink):
+    """
+    写入内存，每次打开时清空，通过 getvalue 获取 utf-8 编码的内容
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def open(self):
+        self._chunks = []
+
+    def write(self, text: str):
+        self._chunks.append(text)
+
+    def getvalue(self) -> bytes:
+        return ''.join(self._chunks).encode('utf-8')
+
+
+class CallbackSink(OutputSink):
+    """
+    每个写入的文本块交给回调函数处理，binary 为 True 时传入 utf-8 编码后的内容
+    """
+
+    def __init__(self, callback: Callable[[Any], Any], binary: bool = False):
+        self._callback = callback
+        self._binary = binary
+
+    def write(self, text: str):
+        self._callback(text.encode('utf-8') if self._binary else text)
+
+
+def as_sink(target: Any) -> OutputSink:
+    """
+    将文件路径、文件对象或回调函数转换为输出目标
+    :param target:
+    :return:
+    """
+    if isinstance(target, OutputSink):
+        return target
+    if isinstance(target, str):
+        return FileSink(target)
+    if hasattr(target, 'write'):
+        return StreamSink(target)
+    if callable(target):
+        return CallbackSink(target)
+    raise TypeError("unsupported output sink: {}".format(type(target).__name__))
+
+
+class TemplateSink(object):
+    """
+    模板输出目标，接收模板名称（请求路径）与模板数据
+    """
+
+    @abstractmethod
+    def write_template(self, uri: str, template_data: Dict):
+        pass
+
+    def flush(self):
+        pass
+
+
+class DirectoryTemplateSink(TemplateSink):
+    """
+    按请求路径在文件夹中创建 .json 模板文件，已存在的模板文件不覆盖，
+    compression 为 .gz/.bz2/.xz 时创建压缩的模板文件。
+    模板序列化后暂存，每 batch_size 个批量创建文件夹并写入，写入结束后需要调用 flush
+    """
+    BATCH_SIZE = 256
+
+    def __init__(self, dir_path: str, compression: str = '', batch_size: int = BATCH_SIZE):
+        self._dir_path = dir_path
+        self._compression = compression
+        self._batch_size = batch_size
+        self._pending = []
+        # 文件夹 -> 已存在或待写入的文件名，每个文件夹只列一次目录
+        self._listed = {}
+        self._created = set()
+
+    def _file_names(self, dir_path: str) -> Set[str]:
+        names = self._listed.get(dir_path)
+        if names is None:
+            names = set(os.listdir(dir_path)) if os.path.isdir(dir_path) else set()
+            self._listed[dir_path] = names
+        return names
+
+    def write_template(self, uri: str, template_data: Dict):
+        # 分割地址
+        url_paths = uri.split('/')
+        file_name = '{}.json{}'.format(url_paths.pop(-1), self._compression)
+        file_absolute_path = self._dir_path + '/'.join(url_paths)
+
+        names = self._file_names(file_absolute_path)
+        if file_name in names:
+            return
+        names.add(file_name)
+        self._pending.append((file_absolute_path, file_name, json.dumps(template_data)))
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        for dir_path, file_name, text in pending:
+            # 创建文件夹
+            if dir_path not in self._created:
+                os.makedirs(dir_path, exist_ok=True)
+                self._created.add(dir_path)
+            with open_file(os.path.join(dir_path, file_name), 'w') as json_file:
+                json_file.write(text)
+        if pending:
+            logging.info('%s-%s', 'Template', 'output: {count} templates to {dir}'.format(
+                count=len(pending), dir=self._dir_path))
+
+
+class MemoryTemplateSink(TemplateSink):
+    """
+    模板保存在内存中，与 DirectoryTemplateSink 一样不覆盖已有的模板，
+    templates 可以直接作为 MemoryTemplateSource 的输入
+    """
+
+    def __init__(self):
+        self._templates = {}
+
+    @property
+    def templates(self) -> Dict[str, Dict]:
+        return self._templates
+
+    def write_template(self, uri: str, template_data: Dict):
+        self._templates.setdefault(template_name(uri), template_data)
+
+
+class CallbackTemplateSink(TemplateSink):
+
+    def __init__(self, callback: Callable[[str, Dict], Any]):
+        self._callback = callback
+
+    def write_template(self, uri: str, template_data: Dict):
+        self._callback(uri, template_data)
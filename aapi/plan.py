@@ -0,0 +1,162 @@
+import json
+import random
+from typing import (
+    Callable,
+    Iterable,
+    List,
+    Dict,
+    Tuple,
+    Any
+)
+
+from aapi.pool import is_pool_ref, load_pool
+
+FLAGS = ('true', 'false')
+EMPTY_INDEX = -1
+# 空槽取值为空字符串，去重时与空字符串取值视为相同
+EMPTY_KEY = json.dumps('')
+
+
+def is_slot(value: Any) -> bool:
+    """
+    是否为参数化的取值槽，即只包含 true/false 两个取值列表（或取值池引用）的字典
+    :param value:
+    :return:
+    """
+    return (isinstance(value, dict) and value and set(value) <= set(FLAGS)
+            and all(isinstance(v, list) or is_pool_ref(v) for v in value.values()))
+
+
+class ParamSlot(object):
+    """
+    参数化取值槽，path 为其在参数结构中的位置，
+    取值为列表或外部取值池，取值池按需读取单个取值，不整体载入
+    """
+
+    def __init__(self, path: Tuple[Any, ...], values: Dict[str, Any], base_dir: str = None):
+        self._path = path
+        self._values = {}
+        self._keys = {}
+        # 取值池作为主值时抽取的取值数量
+        self._samples = {}
+        for flag in FLAGS:
+            value = values.get(flag, [])
+            if is_pool_ref(value):
+                self._values[flag] = load_pool(value, base_dir)
+                self._samples[flag] = int(value.get('sample', 1))
+            else:
+                self._values[flag] = value
+                # 用于去重的取值标识，与取值一一对应
+                self._keys[flag] = [json.dumps(v, sort_keys=True, ensure_ascii=False) for v in value]
+
+    @property
+    def path(self) -> Tuple[Any, ...]:
+        return self._path
+
+    def values(self, flag: str) -> Any:
+        return self._values[flag]
+
+    def size(self, flag: str) -> int:
+        return len(self._values[flag])
+
+    def key(self, flag: str, index: int) -> str:
+        if index == EMPTY_INDEX:
+            return EMPTY_KEY
+        keys = self._keys.get(flag)
+        if keys is None:
+            return json.dumps(self._values[flag][index], ensure_ascii=False)
+        return keys[index]
+
+    def primary_indices(self, flag: str, rand: random.Random) -> Iterable[int]:
+        """
+        作为主值时依次使用的取值下标，列表使用全部取值，取值池随机抽取 sample 个
+        :param flag:
+        :param rand:
+        :return:
+        """
+        size = self.size(flag)
+        if flag not in self._samples:
+            return range(size)
+        return sorted(rand.sample(range(size), min(self._samples[flag], size)))
+
+
+class GenerationPlan(object):
+    """
+    参数生成计划，模板的 params 或 body.data 编译一次后按 true/false 展开，
+    任意层级的 true/false 字典都是取值槽，其余值原样保留。
+    展开时依次以每个槽的每个取值为主值，其余槽随机取值，
+    每个组合只记录各槽的取值下标，最后再构建参数字典
+    """
+
+    def __init__(self, params: Dict, base_dir: str = None):
+        """
+        :param params:
+        :param base_dir: 取值池相对路径的根目录
+        """
+        self._base_dir = base_dir
+        self._slots = []
+        self._builder = self._compile(params, ())
+
+    @property
+    def slots(self) -> List[ParamSlot]:
+        return self._slots
+
+    def _compile(self, value: Any, path: Tuple[Any, ...]) -> Callable[[str, Tuple[int, ...]], Any]:
+        if is_slot(value):
+            slot = ParamSlot(path, value, self._base_dir)
+            position = len(self._slots)
+            self._slots.append(slot)
+
+            def build_slot(flag, indices):
+                index = indices[position]
+                return '' if index == EMPTY_INDEX else slot.values(flag)[index]
+
+            return build_slot
+
+        count = len(self._slots)
+        if isinstance(value, dict):
+            items = [(k, self._compile(v, path + (k,))) for k, v in value.items()]
+            if len(self._slots) > count or not path:
+                return lambda flag, indices: {k: build(flag, indices) for k, build in items}
+
+        if isinstance(value, list):
+            items = [self._compile(v, path + (i,)) for i, v in enumerate(value)]
+            if len(self._slots) > count:
+                return lambda flag, indices: [build(flag, indices) for build in items]
+
+        # 不含取值槽的部分原样返回
+        return lambda flag, indices: value
+
+    def expand_indices(self, flag: str, rand: random.Random) -> List[Tuple[int, ...]]:
+        """
+        展开取值下标组合，重复的取值组合只保留第一次出现
+        :param flag: true/false
+        :param rand: 随机数生成器
+        :return:
+        """
+        sizes = [slot.size(flag) for slot in self._slots]
+        combinations = []
+        seen = set()
+        for position, slot in enumerate(self._slots):
+            for index in slot.primary_indices(flag, rand):
+                # 一次性为其余所有槽抽取下标
+                indices = tuple([index if p == position else EMPTY_INDEX if not s else rand.randrange(s)
+                                 for p, s in enumerate(sizes)])
+                identity = tuple([self._slots[p].key(flag, i) for p, i in enumerate(indices)])
+                if identity in seen:
+                    continue
+                seen.add(identity)
+                combinations.append(indices)
+        return combinations
+
+    def build(self, flag: str, indices: Tuple[int, ...]) -> Any:
+        """
+        根据取值下标构建参数
+        :param flag:
+        :param indices:
+        :return:
+        """
+        return self._builder(flag, indices)
+
+    def expand(self, flag: str, rand: random.Random) -> List[Any]:
+        return [self.build(flag, indices) for indices in self.expand_indices(flag, rand)]
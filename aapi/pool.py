@@ -0,0 +1,196 @@
+import array
+import csv
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from typing import (
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+
+# 索引文件头：魔数之后为源文件大小、修改时间、行数以及内容的 md5
+INDEX_MAGIC = b'AAPIPX2\n'
+INDEX_HEADER = struct.Struct('<QqQ16s')
+INDEX_SUFFIX = '.idx'
+
+
+class ValuePool(object):
+    """
+    外部取值池，按行（或 csv 的某一列）提供取值，
+    文件只扫描一次建立行偏移索引并保存为 .idx 文件，之后通过 mmap 按偏移读取单个取值
+    """
+
+    def __init__(self, file_path: str, column: str = None, delimiter: str = ','):
+        """
+        :param file_path: 按行分隔的文本文件，或者带表头的 csv 文件
+        :param column: csv 文件中使用的列名，为空时整行作为取值
+        :param delimiter: csv 分隔符
+        """
+        self._file_path = file_path
+        self._delimiter = delimiter
+        self._column_index = None
+        stat = os.stat(file_path)
+        self._signature = (stat.st_size, stat.st_mtime_ns)
+        self._digest = None
+
+        self._file = open(file_path, 'rb')
+        # 空文件不能 mmap
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self._offsets = self._load_index()
+
+        if column is not None:
+            header = next(csv.reader([self._line(0)], delimiter=delimiter))
+            if column not in header:
+                raise ValueError("column {column} not found in pool: {path}".format(column=column, path=file_path))
+            self._column_index = header.index(column)
+
+    @property
+    def signature(self) -> Tuple[int, int]:
+        """
+        源文件大小与修改时间，用于判断取值池是否变化
+        :return:
+        """
+        return self._signature
+
+    @property
+    def digest(self) -> str:
+        """
+        源文件内容的 md5，与文件位置、修改时间无关，随索引一起保存
+        :return:
+        """
+        return self._digest
+
+    def _index_path(self) -> str:
+        return self._file_path + INDEX_SUFFIX
+
+    def _build_index(self) -> array.array:
+        offsets = array.array('Q')
+        data = self._data
+        start = 0
+        end = len(data)
+        while start < end:
+            stop = data.find(b'\n', start)
+            if stop < 0:
+                stop = end
+            if data[start:stop].strip():
+                offsets.append(start)
+            start = stop + 1
+        return offsets
+
+    def _load_index(self) -> Any:
+        index_path = self._index_path()
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                # 旧格式的索引没有魔数，重新建立
+                header = f.read(len(INDEX_MAGIC) + INDEX_HEADER.size)
+                if len(header) == len(INDEX_MAGIC) + INDEX_HEADER.size and header.startswith(INDEX_MAGIC):
+                    size, mtime, count, digest = INDEX_HEADER.unpack(header[len(INDEX_MAGIC):])
+                    if (size, mtime) == self._signature:
+                        offsets = array.array('Q')
+                        offsets.fromfile(f, count)
+                        self._digest = digest.hex()
+                        return offsets
+
+        offsets = self._build_index()
+        digest = hashlib.md5(self._data).digest()
+        self._digest = digest.hex()
+        try:
+            with open(index_path, 'wb') as f:
+                f.write(INDEX_MAGIC)
+                f.write(INDEX_HEADER.pack(self._signature[0], self._signature[1], len(offsets), digest))
+                offsets.tofile(f)
+        except OSError as e:
+            logging.info('%s-%s', 'Value Pool', "can't save index {}: {}".format(index_path, e))
+        return offsets
+
+    def _line(self, position: int) -> str:
+        start = self._offsets[position]
+        stop = self._data.find(b'\n', start)
+        if stop < 0:
+            stop = len(self._data)
+        return self._data[start:stop].decode('utf-8').rstrip('\r')
+
+    def __len__(self) -> int:
+        # csv 表头不作为取值
+        return len(self._offsets) - (1 if self._column_index is not None else 0)
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('pool index out of range: {}'.format(index))
+        if self._column_index is None:
+            return self._line(index)
+        row = next(csv.reader([self._line(index + 1)], delimiter=self._delimiter))
+        return row[self._column_index] if self._column_index < len(row) else ''
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+_POOLS = {}
+
+
+def is_pool_ref(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get('pool'), str)
+
+
+def resolve_pool_path(ref: Dict, base_dir: Optional[str]) -> str:
+    path = ref['pool']
+    if base_dir is not None and not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return os.path.abspath(path)
+
+
+def load_pool(ref: Dict, base_dir: str = None) -> ValuePool:
+    """
+    载入模板中引用的取值池，同一文件同一列在进程内只打开一次
+    :param ref: 形如 {"pool": "pools/sku.txt", "column": "sku", "sample": 10}
+    :param base_dir: 相对路径的根目录，一般为模板文件夹
+    :return:
+    """
+    path = resolve_pool_path(ref, base_dir)
+    key = (path, ref.get('column'), ref.get('delimiter', ','))
+    pool = _POOLS.get(key)
+    stat = os.stat(path)
+    if pool is None or pool.signature != (stat.st_size, stat.st_mtime_ns):
+        if pool is not None:
+            pool.close()
+        pool = ValuePool(path, column=ref.get('column'), delimiter=ref.get('delimiter', ','))
+        _POOLS[key] = pool
+    return pool
+
+
+def pool_signature(data: Any, base_dir: str = None) -> str:
+    """
+    模板中引用的取值池的签名，由相对于 base_dir 的路径与文件内容的 md5 组成，
+    取值池内容变化时模板的分组标识随之变化，换机器、换目录或者只修改时间时保持不变
+    :param data: 模板数据
+    :param base_dir:
+    :return:
+    """
+    signatures = []
+
+    def walk(value):
+        if is_pool_ref(value):
+            path = resolve_pool_path(value, base_dir)
+            # 整行取值池与按列读取共用同一个索引文件
+            digest = load_pool({'pool': path}).digest
+            if base_dir is not None:
+                path = os.path.relpath(path, os.path.abspath(base_dir))
+            signatures.append('{}:{}'.format(path.replace(os.sep, '/'), digest))
+        elif isinstance(value, dict):
+            for v in value.values():
+                walk(v)
+        elif isinstance(value, list):
+            for v in value:
+                walk(v)
+
+    walk(data)
+    return '|'.join(signatures)
@@ -0,0 +1,157 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import (
+    Dict,
+    Optional
+)
+from urllib.parse import urlparse
+
+import aiohttp
+from aiohttp import hdrs
+
+from aapi.parser import FileParser
+from aapi.pipeline import open_file
+from aapi.runner import LatencyHistogram
+from aapi.stream import iter_har_entries
+
+# 由客户端重新生成的请求头
+SKIP_HEADERS = {
+    hdrs.HOST.lower(),
+    hdrs.CONTENT_LENGTH.lower(),
+    hdrs.CONNECTION.lower(),
+    hdrs.KEEP_ALIVE.lower(),
+    hdrs.TRANSFER_ENCODING.lower(),
+}
+
+
+def parse_started_time(value: str) -> float:
+    """
+    解析 har 中的 startedDateTime，返回时间戳
+    :param value:
+    :return:
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+class ReplayReport(object):
+    """
+    回放结果，lag 为实际发出时间落后于计划时间的程度
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+        self.statuses = {}
+        self.latency = LatencyHistogram()
+        self.lag = LatencyHistogram()
+        self.har_duration = 0.0
+        self.elapsed = 0.0
+
+    def __str__(self):
+        lines = [
+            'sent: {sent}, errors: {errors}, status: {statuses}'.format(
+                sent=self.sent, errors=self.errors,
+                statuses=', '.join(['{}={}'.format(k, v) for k, v in sorted(self.statuses.items())]) or '-'),
+            'har duration: {har:.2f}s, replay elapsed: {elapsed:.2f}s'.format(
+                har=self.har_duration, elapsed=self.elapsed),
+            'latency p50: {p50:.1f}ms, p99: {p99:.1f}ms, max: {max:.1f}ms'.format(
+                p50=self.latency.percentile(50), p99=self.latency.percentile(99), max=self.latency.percentile(100)),
+            'schedule lag p50: {p50:.1f}ms, p99: {p99:.1f}ms, max: {max:.1f}ms'.format(
+                p50=self.lag.percentile(50), p99=self.lag.percentile(99), max=self.lag.percentile(100)),
+        ]
+        return '\n'.join(lines)
+
+
+class HarReplayer(object):
+    """
+    按 .har 文件中记录的请求开始时间回放请求，保留请求之间的间隔与并发，
+    间隔按倍速缩放，文件按条目流式读取
+    """
+    SPEED_MAX = 'max'
+    CONCURRENCY = 100
+
+    def __init__(self, file_path: str, speed: Optional[float] = 1.0, target: str = None,
+                 concurrency: int = CONCURRENCY, timeout: aiohttp.ClientTimeout = None):
+        """
+        :param file_path: .har 文件
+        :param speed: 倍速，None 表示不等待，尽可能快地发送
+        :param target: 替换请求的 scheme 与 host，例如 http://127.0.0.1:8080
+        :param concurrency: 同时进行中的请求上限，达到上限时计入 lag
+        :param timeout:
+        """
+        self._file_path = file_path
+        self._speed = speed
+        self._target = target.rstrip('/') if target else None
+        self._concurrency = concurrency
+        self._timeout = timeout if timeout is not None else aiohttp.ClientTimeout(total=30)
+
+    def make_url(self, url: str) -> str:
+        if self._target is None:
+            return url
+        url_parse = urlparse(url)
+        return self._target + url[len('{}://{}'.format(url_parse.scheme, url_parse.netloc)):]
+
+    async def _send(self, session: aiohttp.ClientSession, request: Dict, report: ReplayReport):
+        headers = [(h['name'], h['value']) for h in request.get('headers', [])
+                   if not h['name'].startswith(':') and h['name'].lower() not in SKIP_HEADERS]
+        post_data = request.get('postData')
+        started = time.perf_counter()
+        try:
+            async with session.request(request['method'], self.make_url(request['url']), headers=headers,
+                                       data=post_data.get('text') if post_data else None,
+                                       timeout=self._timeout) as response:
+                await response.read()
+                report.statuses[response.status] = report.statuses.get(response.status, 0) + 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            report.errors += 1
+            logging.info('%s-%s', 'Replay', '{} {}: {}'.format(request['method'], request['url'], e))
+        report.latency.record((time.perf_counter() - started) * 1000)
+
+    async def replay_async(self) -> ReplayReport:
+        report = ReplayReport()
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks = set()
+        har_start = None
+        started = time.monotonic()
+
+        def done(task):
+            tasks.discard(task)
+            semaphore.release()
+
+        connector = aiohttp.TCPConnector(limit=self._concurrency)
+        async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
+            with open_file(self._file_path) as har_file:
+                for entry in iter_har_entries(har_file):
+                    request = entry['request']
+                    if FileParser.stop_with(urlparse(request['url']).path):
+                        continue
+
+                    entry_start = parse_started_time(entry['startedDateTime'])
+                    if har_start is None:
+                        har_start = entry_start
+                    report.har_duration = max(report.har_duration, entry_start - har_start)
+
+                    due = time.monotonic()
+                    if self._speed is not None:
+                        due = started + (entry_start - har_start) / self._speed
+                        if due > time.monotonic():
+                            await asyncio.sleep(due - time.monotonic())
+
+                    await semaphore.acquire()
+                    report.lag.record(max(time.monotonic() - due, 0) * 1000)
+                    report.sent += 1
+                    task = asyncio.ensure_future(self._send(session, request, report))
+                    tasks.add(task)
+                    task.add_done_callback(done)
+
+            if tasks:
+                await asyncio.gather(*list(tasks))
+        report.elapsed = time.monotonic() - started
+        return report
+
+    def replay(self) -> ReplayReport:
+        return asyncio.run(self.replay_async())
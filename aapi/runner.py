@@ -0,0 +1,528 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+from typing import (
+    TYPE_CHECKING,
+    Iterator,
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+
+import aiohttp
+from aiohttp import hdrs
+
+from aapi.parser import (
+    RequestCase,
+    ResponseCase
+)
+from aapi.store import ResultSink
+from aapi.variable import (
+    CompiledRequest,
+    VariableEngine
+)
+
+if TYPE_CHECKING:
+    from aapi.tracing import RequestTracer
+
+
+# 参与响应结构签名的顶层字段值，一般为业务错误码
+SHAPE_FIELDS = ('code', 'errcode', 'error_code')
+
+
+def response_shape(data: Any) -> Optional[str]:
+    """
+    响应结构签名，相同的签名表示服务端走了相同的处理分支。
+    只保留字段名与值的类型，数组只取第一个元素的结构，顶层的错误码字段保留取值
+    :param data: 解析后的 json 响应，非 json 响应为 None
+    :return:
+    """
+    if data is None:
+        return None
+
+    def skeleton(value):
+        if isinstance(value, dict):
+            return {k: skeleton(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [skeleton(value[0])] if value else []
+        return type(value).__name__
+
+    shape = skeleton(data)
+    if isinstance(data, dict):
+        for field in SHAPE_FIELDS:
+            if field in data and not isinstance(data[field], (dict, list)):
+                shape[field] = data[field]
+    return hashlib.md5(json.dumps(shape, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CaseResult(object):
+    """
+    单个用例的执行结果
+    """
+
+    def __init__(self, name: str, group: str, status: Optional[int], passed: bool, latency: float,
+                 digest: str = None, failures: List[str] = None, error: str = None, shape: str = None):
+        self._name = name
+        self._group = group
+        self._status = status
+        self._passed = passed
+        self._latency = latency
+        self._digest = digest
+        self._failures = failures or []
+        self._error = error
+        self._shape = shape
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def group(self) -> str:
+        """
+        用例所属分组，格式为 path@md5
+        :return:
+        """
+        return self._group
+
+    @property
+    def status(self) -> Optional[int]:
+        """
+        响应状态码，请求未完成时为 None
+        :return:
+        """
+        return self._status
+
+    @property
+    def passed(self) -> bool:
+        return self._passed
+
+    @property
+    def latency(self) -> float:
+        """
+        请求耗时，单位毫秒
+        :return:
+        """
+        return self._latency
+
+    @property
+    def digest(self) -> Optional[str]:
+        """
+        响应体摘要
+        :return:
+        """
+        return self._digest
+
+    @property
+    def shape(self) -> Optional[str]:
+        """
+        响应结构签名，见 response_shape
+        :return:
+        """
+        return self._shape
+
+    @property
+    def failures(self) -> List[str]:
+        return self._failures
+
+    @property
+    def error(self) -> Optional[str]:
+        """
+        失败原因，断言失败时为断言信息，请求异常时为异常信息
+        :return:
+        """
+        if self._error is None and self._failures:
+            return '; '.join(self._failures)
+        return self._error
+
+
+class LatencyHistogram(object):
+    """
+    耗时直方图，按对数分桶，误差约 2%，可以在多个进程之间合并
+    """
+    BASE = 1.02
+    MIN_LATENCY = 0.1
+
+    def __init__(self):
+        self._buckets = {}
+        self._count = 0
+        self._max = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def record(self, latency: float):
+        bucket = int(math.log(max(latency, self.MIN_LATENCY) / self.MIN_LATENCY, self.BASE))
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self._count += 1
+        self._max = max(self._max, latency)
+
+    def merge(self, other: 'LatencyHistogram'):
+        for bucket, count in other._buckets.items():
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+        self._count += other._count
+        self._max = max(self._max, other._max)
+
+    def percentile(self, percent: float) -> float:
+        """
+        :param percent: 0 - 100
+        :return: 耗时，单位毫秒
+        """
+        if not self._count:
+            return 0.0
+        if percent >= 100:
+            return self._max
+        rank = math.ceil(self._count * percent / 100)
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self.MIN_LATENCY * self.BASE ** (bucket + 1), self._max)
+        return self._max
+
+
+class RunSummary(object):
+    """
+    一次执行的汇总，包含计数、耗时直方图、分组统计以及部分失败用例，
+    多进程执行时各进程的汇总通过 merge 合并
+    """
+    MAX_FAILURES = 100
+    SLOWEST_GROUPS = 5
+
+    def __init__(self):
+        self.total = 0
+        self.passed = 0
+        self.failed = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        self.histogram = LatencyHistogram()
+        # 分组标识 -> [总数, 失败数, 耗时总和(ms)]
+        self.groups = {}
+        self.failures = []
+        # 分组标识 -> PhaseStats，开启请求阶段追踪时才有数据
+        self.phases = {}
+
+    def add(self, result: CaseResult):
+        self.total += 1
+        if result.passed:
+            self.passed += 1
+        elif result.status is None:
+            self.errors += 1
+        else:
+            self.failed += 1
+        self.histogram.record(result.latency)
+
+        counter = self.groups.setdefault(result.group, [0, 0, 0.0])
+        counter[0] += 1
+        counter[2] += result.latency
+        if not result.passed:
+            counter[1] += 1
+            if len(self.failures) < self.MAX_FAILURES:
+                self.failures.append((result.name, result.group, result.error))
+
+    def merge(self, other: 'RunSummary'):
+        self.total += other.total
+        self.passed += other.passed
+        self.failed += other.failed
+        self.errors += other.errors
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.histogram.merge(other.histogram)
+        for group, (total, failed, latency) in other.groups.items():
+            counter = self.groups.setdefault(group, [0, 0, 0.0])
+            counter[0] += total
+            counter[1] += failed
+            counter[2] += latency
+        self.failures.extend(other.failures[:self.MAX_FAILURES - len(self.failures)])
+        for group, stats in other.phases.items():
+            if group in self.phases:
+                self.phases[group].merge(stats)
+            else:
+                self.phases[group] = stats
+
+    def _phase_lines(self) -> List[str]:
+        total = None
+        for stats in self.phases.values():
+            if total is None:
+                total = type(stats)()
+            total.merge(stats)
+        if total is None or not total.requests:
+            return []
+
+        lines = [
+            'phases p50/p99: {}'.format(', '.join(['{phase} {p50:.1f}/{p99:.1f}ms'.format(
+                phase=phase, p50=total.histograms[phase].percentile(50), p99=total.histograms[phase].percentile(99))
+                for phase in total.PHASES])),
+            'connection reuse: {rate:.1%} ({reused} reused, {created} created)'.format(
+                rate=total.reuse_rate, reused=total.reused, created=total.created),
+        ]
+        # 平均耗时最长的分组及其各阶段的平均耗时
+        slowest = sorted(self.phases.items(), key=lambda i: -sum([i[1].mean(p) for p in i[1].PHASES]))
+        for group, stats in slowest[:self.SLOWEST_GROUPS]:
+            lines.append('  {group}: {phases}, reuse {rate:.0%}'.format(
+                group=group, rate=stats.reuse_rate,
+                phases=', '.join(['{} {:.1f}ms'.format(p, stats.mean(p)) for p in stats.PHASES])))
+        return lines
+
+    def __str__(self):
+        lines = [
+            'total: {total}, passed: {passed}, failed: {failed}, errors: {errors}, elapsed: {elapsed:.2f}s'.format(
+                total=self.total, passed=self.passed, failed=self.failed, errors=self.errors, elapsed=self.elapsed)
+        ]
+        if self.total:
+            lines.append('rps: {rps:.1f}, latency p50: {p50:.1f}ms, p90: {p90:.1f}ms, p99: {p99:.1f}ms, '
+                         'max: {max:.1f}ms'.format(rps=self.total / self.elapsed if self.elapsed else 0.0,
+                                                   p50=self.histogram.percentile(50),
+                                                   p90=self.histogram.percentile(90),
+                                                   p99=self.histogram.percentile(99),
+                                                   max=self.histogram.percentile(100)))
+        lines.extend(self._phase_lines())
+        return '\n'.join(lines)
+
+
+class RetryPolicy(object):
+    """
+    重试策略，只对幂等请求在网络异常、超时以及网关类状态码时重试，
+    重试间隔为带随机抖动的指数退避
+    """
+    IDEMPOTENT_METHODS = {hdrs.METH_GET, hdrs.METH_HEAD, hdrs.METH_OPTIONS}
+    RETRY_STATUS = {502, 503, 504}
+
+    def __init__(self, retries: int = 2, backoff: float = 0.1, max_backoff: float = 2.0):
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+    @property
+    def retries(self) -> int:
+        return self._retries
+
+    def should_retry(self, method: str, attempt: int, status: Optional[int]) -> bool:
+        """
+        :param method:
+        :param attempt: 已经执行的次数
+        :param status: 响应状态码，请求异常时为 None
+        :return:
+        """
+        if attempt > self._retries or method.upper() not in self.IDEMPOTENT_METHODS:
+            return False
+        return status is None or status in self.RETRY_STATUS
+
+    def delay(self, attempt: int) -> float:
+        # full jitter，避免同一接口的重试同时到达
+        return random.uniform(0, min(self._max_backoff, self._backoff * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker(object):
+    """
+    按分组（path@md5）熔断，连续出错达到阈值后打开，
+    打开期间该分组剩余的用例直接失败，冷却结束后放行一个用例试探
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._errors = {}
+        self._opened = {}
+        self._probing = set()
+
+    def state(self, group: str) -> str:
+        opened = self._opened.get(group)
+        if opened is None:
+            return self.CLOSED
+        if time.monotonic() - opened >= self._cooldown:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self, group: str) -> bool:
+        """
+        分组当前是否允许发送请求，半开状态下同一时间只放行一个请求
+        :param group:
+        :return:
+        """
+        state = self.state(group)
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and group not in self._probing:
+            self._probing.add(group)
+            return True
+        return False
+
+    def record(self, group: str, error: bool):
+        """
+        记录一次请求结果，error 表示网络异常、超时或者 5xx 响应
+        :param group:
+        :param error:
+        :return:
+        """
+        self._probing.discard(group)
+        if not error:
+            self._errors.pop(group, None)
+            self._opened.pop(group, None)
+            return
+
+        errors = self._errors.get(group, 0) + 1
+        self._errors[group] = errors
+        if errors >= self._threshold or group in self._opened:
+            if group not in self._opened:
+                logging.info('%s-%s', 'Run Case', 'circuit open: {}'.format(group))
+            self._opened[group] = time.monotonic()
+
+
+class CaseRunner(object):
+    """
+    用例执行器，使用 aiohttp 并发发送请求，执行模板中声明的断言，
+    结果写入 ResultSink
+    """
+    CONCURRENCY = 10
+    TIMEOUT = aiohttp.ClientTimeout(total=30, connect=5, sock_read=10)
+
+    def __init__(self, engine: VariableEngine = None, sink: ResultSink = None, concurrency: int = CONCURRENCY,
+                 timeout: aiohttp.ClientTimeout = TIMEOUT, retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None, tracer: 'RequestTracer' = None):
+        """
+        :param engine: 变量引擎
+        :param sink: 执行结果输出
+        :param concurrency: 并发数，同时也是连接池大小
+        :param timeout: 单次请求的连接、读取以及总超时
+        :param retry: 重试策略，默认 GET 请求重试 2 次
+        :param breaker: 分组熔断器，默认连续 5 次出错后熔断
+        :param tracer: 请求阶段追踪，按分组统计 dns、连接、首字节以及传输耗时
+        """
+        self._engine = engine if engine is not None else VariableEngine()
+        self._sink = sink
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._retry = retry if retry is not None else RetryPolicy()
+        self._breaker = breaker if breaker is not None else CircuitBreaker()
+        self._tracer = tracer
+
+    @staticmethod
+    def iter_cases(groups: Dict[str, List[RequestCase]]) -> Iterator[Tuple[str, RequestCase]]:
+        """
+        按分组顺序遍历用例，跳过 prerequest 分组
+        :param groups:
+        :return:
+        """
+        for group, cases in groups.items():
+            if group == 'prerequest' or cases is None:
+                continue
+            for case in cases:
+                yield group, case
+
+    async def _send_once(self, session: aiohttp.ClientSession, group: str, request: CompiledRequest) -> CaseResult:
+        case = request.case
+        started = time.perf_counter()
+        try:
+            prepared = self._engine.resolve(request)
+        except Exception as e:
+            # 钩子是用户代码，任何异常都只记录为该用例的错误，由 send 计入熔断，不中断整个执行
+            logging.info('%s-%s', 'Run Case', 'hook failed {name}: {error}'.format(name=case.name, error=e))
+            return CaseResult(name=case.name, group=group, status=None, passed=False,
+                              latency=(time.perf_counter() - started) * 1000,
+                              error='{}: {}'.format(type(e).__name__, e))
+
+        trace_ctx = self._tracer.start(group) if self._tracer is not None else None
+        try:
+            async with session.request(prepared.method, prepared.url, headers=prepared.headers,
+                                       params=prepared.params, data=prepared.data,
+                                       timeout=self._timeout, trace_request_ctx=trace_ctx) as response:
+                content = await response.read()
+            if self._tracer is not None:
+                self._tracer.finish(trace_ctx)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return CaseResult(name=case.name, group=group, status=None, passed=False,
+                              latency=(time.perf_counter() - started) * 1000,
+                              error='{}: {}'.format(type(e).__name__, e))
+        except (TypeError, ValueError) as e:
+            # 请求无法构建（例如无法序列化的参数），只记录为该用例的错误，不中断整个执行
+            logging.info('%s-%s', 'Run Case', 'invalid request {name}: {error}'.format(name=case.name, error=e))
+            return CaseResult(name=case.name, group=group, status=None, passed=False,
+                              latency=(time.perf_counter() - started) * 1000,
+                              error='{}: {}'.format(type(e).__name__, e))
+
+        latency = (time.perf_counter() - started) * 1000
+        response_case = ResponseCase(response.status, dict(response.headers), content, latency)
+        failures = case.assertion.check(response_case)
+        return CaseResult(name=case.name, group=group, status=response.status, passed=not failures,
+                          latency=latency, digest=hashlib.md5(content).hexdigest(), failures=failures,
+                          shape=response_shape(response_case.json()))
+
+    async def send(self, session: aiohttp.ClientSession, group: str, request: CompiledRequest) -> CaseResult:
+        """
+        发送单个请求并执行断言，按重试策略重试，分组熔断时直接失败
+        :param session:
+        :param group:
+        :param request:
+        :return:
+        """
+        case = request.case
+        attempt = 0
+        result = None
+        while True:
+            if not self._breaker.allow(group):
+                # 重试过程中熔断时保留最后一次的真实结果
+                if result is not None:
+                    return result
+                return CaseResult(name=case.name, group=group, status=None, passed=False, latency=0.0,
+                                  error='CircuitOpen: {} keeps erroring'.format(group))
+
+            attempt += 1
+            result = await self._send_once(session, group, request)
+            error = result.status is None or result.status >= 500
+            self._breaker.record(group, error)
+            if not error or not self._retry.should_retry(case.method, attempt, result.status):
+                return result
+            await asyncio.sleep(self._retry.delay(attempt))
+
+    def _record(self, summary: RunSummary, result: CaseResult):
+        summary.add(result)
+        if self._sink is not None:
+            self._sink.write(result)
+        if not result.passed:
+            logging.info('%s-%s', 'Run Case', 'failed: {name} {error}'.format(name=result.name, error=result.error))
+
+    async def _worker(self, session: aiohttp.ClientSession, cases: Iterator[Tuple[str, RequestCase]],
+                      summary: RunSummary):
+        # 所有 worker 共享同一个迭代器，用例按需取出，不会一次性创建全部任务
+        for group, case in cases:
+            self._record(summary, await self.send(session, group, self._engine.compile(case)))
+
+    async def run_async(self, groups: Dict[str, List[RequestCase]]) -> RunSummary:
+        summary = RunSummary()
+        started = time.perf_counter()
+        cases = self.iter_cases(groups)
+        connector = aiohttp.TCPConnector(limit=self._concurrency)
+        trace_configs = [self._tracer.trace_config()] if self._tracer is not None else None
+        async with aiohttp.ClientSession(connector=connector, trace_configs=trace_configs) as session:
+            await asyncio.gather(*[self._worker(session, cases, summary) for _ in range(self._concurrency)])
+        summary.elapsed = time.perf_counter() - started
+        if self._tracer is not None:
+            summary.phases = self._tracer.groups
+        return summary
+
+    def run(self, groups: Dict[str, List[RequestCase]], label: str = None, run_id: int = None) -> RunSummary:
+        """
+        执行全部用例
+        :param groups: ApiParser.create_request_cases 的返回值
+        :param label: 本次执行的标签
+        :param run_id: 写入已经开始的执行，多进程执行时使用
+        :return:
+        """
+        if self._sink is not None and run_id is not None:
+            self._sink.join_run(run_id)
+        elif self._sink is not None:
+            self._sink.start_run(label)
+        try:
+            return asyncio.run(self.run_async(groups))
+        finally:
+            if self._sink is not None:
+                self._sink.close()
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import (
+    IO,
+    Iterator,
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+
+import aiohttp
+
+from aapi.assertion import JsonPath
+from aapi.parser import RequestCase
+from aapi.pipeline import open_file
+from aapi.runner import CaseRunner
+from aapi.variable import (
+    PreparedRequest,
+    VariableEngine
+)
+
+CHUNK_SIZE = 1 << 16
+
+
+class ShadowResponse(object):
+    """
+    对比用的响应，响应体边读取边计算摘要，只保留不超过 max_body 的内容用于逐字段对比
+    """
+
+    def __init__(self, status: Optional[int], digest: Optional[str], body: Optional[bytes], size: int,
+                 latency: float, error: str = None):
+        self.status = status
+        self.digest = digest
+        self.body = body
+        self.size = size
+        self.latency = latency
+        self.error = error
+
+    def json(self) -> Any:
+        if self.body is None:
+            return None
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            return None
+
+
+def diff_json(old: Any, new: Any, path: str = '$', limit: int = 20) -> List[Tuple[str, Any, Any]]:
+    """
+    逐字段对比两个 json 值，返回不同的 (json path, 旧值, 新值)，最多 limit 个
+    :param old:
+    :param new:
+    :param path:
+    :param limit:
+    :return:
+    """
+    diffs = []
+
+    def walk(a, b, p):
+        if len(diffs) >= limit:
+            return
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in list(a) + [k for k in b if k not in a]:
+                walk(a.get(key), b.get(key), '{}.{}'.format(p, key) if key.isidentifier() else
+                     '{}[{}]'.format(p, json.dumps(key, ensure_ascii=False)))
+        elif isinstance(a, list) and isinstance(b, list) and len(a) == len(b):
+            for index, (x, y) in enumerate(zip(a, b)):
+                walk(x, y, '{}[{}]'.format(p, index))
+        elif a != b or type(a) is not type(b):
+            diffs.append((p, a, b))
+
+    walk(old, new, path)
+    return diffs
+
+
+class ShadowReport(object):
+    """
+    对比结果汇总，不同的响应逐条写入报告文件（json lines）
+    """
+
+    def __init__(self, fp: IO[str] = None):
+        self._fp = fp
+        self.total = 0
+        self.same = 0
+        self.different = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        # 分组标识 -> 不同的用例数
+        self.groups = {}
+
+    def add(self, case: RequestCase, group: str, prepared: PreparedRequest, old: ShadowResponse,
+            new: ShadowResponse, diffs: List[Tuple[str, Any, Any]]):
+        self.total += 1
+        if old.error is not None or new.error is not None:
+            self.errors += 1
+        elif not diffs:
+            self.same += 1
+            return
+        else:
+            self.different += 1
+        self.groups[group] = self.groups.get(group, 0) + 1
+        if self._fp is None:
+            return
+        record = {
+            'name': case.name,
+            'group': group,
+            'method': prepared.method,
+            'url': prepared.url,
+            'status': [old.status, new.status],
+            'latency': [round(old.latency, 3), round(new.latency, 3)],
+            'error': [old.error, new.error],
+            'diffs': [{'path': p, 'old': a, 'new': b} for p, a, b in diffs],
+        }
+        self._fp.write(json.dumps(record, ensure_ascii=False, default=str))
+        self._fp.write('\n')
+
+    def __str__(self):
+        lines = ['total: {total}, same: {same}, different: {different}, errors: {errors}, elapsed: {elapsed:.2f}s'
+                 .format(total=self.total, same=self.same, different=self.different, errors=self.errors,
+                         elapsed=self.elapsed)]
+        for group, count in sorted(self.groups.items(), key=lambda i: -i[1])[:10]:
+            lines.append('  {group}: {count}'.format(group=group, count=count))
+        return '\n'.join(lines)
+
+
+class ShadowComparer(object):
+    """
+    将每个用例同时发送到新旧两个服务并对比响应，
+    两个请求共享同一个调度与连接池并发发出，总耗时约等于较慢的一方。
+    对比状态码与响应体，ignore 中的 json path 对应的易变字段不参与对比
+    """
+    MAX_BODY = 4 << 20
+
+    def __init__(self, old_host: str, new_host: str, host_variable: str, engine: VariableEngine = None,
+                 ignore: List[str] = None, concurrency: int = CaseRunner.CONCURRENCY,
+                 timeout: aiohttp.ClientTimeout = CaseRunner.TIMEOUT, max_body: int = MAX_BODY):
+        """
+        :param old_host: 旧服务地址，例如 http://10.0.0.1:8080
+        :param new_host: 新服务地址
+        :param host_variable: 用例 host 使用的变量名
+        :param engine: 变量引擎，钩子只执行一次，两个服务收到相同的请求
+        :param ignore: 忽略的 json path 列表，例如 $.data.timestamp
+        :param concurrency: 同时对比的用例数
+        :param timeout:
+        :param max_body: 超过该大小的响应体只对比摘要
+        """
+        self._old_host = old_host.rstrip('/')
+        self._new_host = new_host.rstrip('/')
+        self._host_variable = host_variable
+        self._engine = engine if engine is not None else VariableEngine()
+        self._ignore = [JsonPath(p) for p in ignore or []]
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._max_body = max_body
+
+    def _new_url(self, url: str) -> str:
+        if url.startswith(self._old_host):
+            return self._new_host + url[len(self._old_host):]
+        return url
+
+    async def _send(self, session: aiohttp.ClientSession, prepared: PreparedRequest, url: str) -> ShadowResponse:
+        started = time.perf_counter()
+        digest = hashlib.md5()
+        chunks = []
+        size = 0
+        try:
+            async with session.request(prepared.method, url, headers=prepared.headers, params=prepared.params,
+                                       data=prepared.data, timeout=self._timeout) as response:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if chunks is not None:
+                        chunks.append(chunk)
+                        # 超过上限后不再保留内容，只计算摘要
+                        if size > self._max_body:
+                            chunks = None
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, TypeError, ValueError) as e:
+            return ShadowResponse(None, None, None, size, (time.perf_counter() - started) * 1000,
+                                  error='{}: {}'.format(type(e).__name__, e))
+        return ShadowResponse(status, digest.hexdigest(), b''.join(chunks) if chunks is not None else None, size,
+                              (time.perf_counter() - started) * 1000)
+
+    def _normalize(self, data: Any) -> Any:
+        for path in self._ignore:
+            path.mask(data)
+        return data
+
+    def compare(self, old: ShadowResponse, new: ShadowResponse) -> List[Tuple[str, Any, Any]]:
+        """
+        对比两个响应，返回不同之处，内容完全相同时只比较摘要
+        :param old:
+        :param new:
+        :return:
+        """
+        diffs = []
+        if old.status != new.status:
+            diffs.append(('status', old.status, new.status))
+        if old.digest == new.digest:
+            return diffs
+
+        old_data = old.json()
+        new_data = new.json()
+        if old_data is None or new_data is None:
+            # 非 json 或者超过上限的响应体只能比较摘要
+            diffs.append(('digest', old.digest, new.digest))
+            return diffs
+        diffs.extend(diff_json(self._normalize(old_data), self._normalize(new_data)))
+        return diffs
+
+    async def _compare_case(self, session: aiohttp.ClientSession, group: str, case: RequestCase,
+                            report: ShadowReport):
+        try:
+            prepared = self._engine.resolve(self._engine.compile(case))
+        except Exception as e:
+            # 钩子是用户代码，解析失败时两侧都记录为该用例的错误，与 run 命令一致
+            logging.info('%s-%s', 'Compare', 'invalid request {name}: {error}'.format(name=case.name, error=e))
+            error = '{}: {}'.format(type(e).__name__, e)
+            prepared = PreparedRequest(case.method, '{}{}'.format(self._old_host, case.uri), {}, [])
+            report.add(case, group, prepared, ShadowResponse(None, None, None, 0, 0.0, error=error),
+                       ShadowResponse(None, None, None, 0, 0.0, error=error), [])
+            return
+        old, new = await asyncio.gather(self._send(session, prepared, prepared.url),
+                                        self._send(session, prepared, self._new_url(prepared.url)))
+        report.add(case, group, prepared, old, new, self.compare(old, new))
+
+    async def _worker(self, session: aiohttp.ClientSession, cases: Iterator[Tuple[str, RequestCase]],
+                      report: ShadowReport):
+        for group, case in cases:
+            await self._compare_case(session, group, case, report)
+
+    async def compare_async(self, groups: Dict[str, List[RequestCase]], report: ShadowReport) -> ShadowReport:
+        started = time.perf_counter()
+        self._engine.variables[self._host_variable] = self._old_host
+        cases = CaseRunner.iter_cases(groups)
+        # 每个用例同时占用新旧两个服务的连接
+        connector = aiohttp.TCPConnector(limit=self._concurrency * 2)
+        async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
+            await asyncio.gather(*[self._worker(session, cases, report) for _ in range(self._concurrency)])
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def run(self, groups: Dict[str, List[RequestCase]], report_path: str = None) -> ShadowReport:
+        """
+        对比全部用例
+        :param groups: ApiParser.create_request_cases 的返回值
+        :param report_path: 不同之处的报告文件（json lines），支持压缩扩展名
+        :return:
+        """
+        if report_path is None:
+            return asyncio.run(self.compare_async(groups, ShadowReport()))
+        with open_file(report_path, 'w') as fp:
+            report = asyncio.run(self.compare_async(groups, ShadowReport(fp)))
+        logging.info('%s-%s', 'Compare', 'report: {}'.format(report_path))
+        return report
@@ -0,0 +1,228 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from abc import abstractmethod
+from typing import (
+    TYPE_CHECKING,
+    List,
+    Dict,
+    Optional,
+    Any
+)
+
+if TYPE_CHECKING:
+    from aapi.runner import CaseResult
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        label TEXT,
+        started_at REAL NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS results (
+        run_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        group_key TEXT NOT NULL,
+        status INTEGER,
+        passed INTEGER NOT NULL,
+        latency REAL NOT NULL,
+        digest TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        shape TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS results_run ON results (run_id, name)',
+]
+# 旧版本数据库缺少的列
+MIGRATIONS = [
+    ('results', 'shape', 'ALTER TABLE results ADD COLUMN shape TEXT'),
+]
+
+
+class ResultSink(object):
+    """
+    执行结果输出抽象类，write 在执行过程中调用，不能阻塞执行
+    """
+
+    @abstractmethod
+    def start_run(self, label: str = None) -> int:
+        """
+        开始一次执行，返回本次执行的编号
+        :param label:
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def join_run(self, run_id: int):
+        """
+        写入已经开始的执行
+        :param run_id:
+        :return:
+        """
+        pass
+
+    @abstractmethod
+    def write(self, result: 'CaseResult'):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class SqliteResultStore(ResultSink):
+    """
+    基于 sqlite 的执行结果存储，结果先进入内存队列，
+    由后台线程按批次写入数据库，执行过程不等待磁盘写入
+    """
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, db_path: str, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self._db_path = db_path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._writer = None
+        self._run_id = None
+
+        connection = self._connect()
+        try:
+            with connection:
+                for sql in SCHEMA:
+                    connection.execute(sql)
+                for table, column, sql in MIGRATIONS:
+                    if column not in [row[1] for row in connection.execute('PRAGMA table_info({})'.format(table))]:
+                        connection.execute(sql)
+        finally:
+            connection.close()
+
+    @property
+    def run_id(self) -> Optional[int]:
+        return self._run_id
+
+    def _connect(self) -> sqlite3.Connection:
+        # 多个进程同时写入时等待写锁
+        connection = sqlite3.connect(self._db_path, timeout=60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def create_run(self, label: str = None) -> int:
+        """
+        只创建执行记录，不启动写入线程
+        :param label:
+        :return:
+        """
+        # with 只提交事务，不关闭连接
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute('INSERT INTO runs (label, started_at) VALUES (?, ?)',
+                                            (label, time.time()))
+            return cursor.lastrowid
+        finally:
+            connection.close()
+
+    def start_run(self, label: str = None) -> int:
+        self.join_run(self.create_run(label))
+        return self._run_id
+
+    def join_run(self, run_id: int):
+        """
+        写入已经开始的执行，多进程执行时每个进程使用各自的写入线程
+        :param run_id:
+        :return:
+        """
+        self._run_id = run_id
+        self._writer = threading.Thread(target=self._write_loop, name='aapi-result-writer', daemon=True)
+        self._writer.start()
+
+    def write(self, result: 'CaseResult'):
+        self._queue.put((self._run_id, result.name, result.group, result.status, int(result.passed),
+                         result.latency, result.digest, result.error, time.time(), result.shape))
+
+    def _write_loop(self):
+        connection = self._connect()
+        closed = False
+        while not closed:
+            batch = []
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                try:
+                    record = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if record is None:
+                    closed = True
+                    break
+                batch.append(record)
+            if batch:
+                with connection:
+                    connection.executemany('INSERT INTO results (run_id, name, group_key, status, passed, latency, '
+                                           'digest, error, created_at, shape) '
+                                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+        connection.close()
+
+    def close(self):
+        """
+        等待队列中的结果全部写入后关闭
+        :return:
+        """
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+        logging.info('%s-%s', 'Result Store', 'run {} saved to {}'.format(self._run_id, self._db_path))
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        connection = self._connect()
+        connection.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
+
+    def runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._query('SELECT id, label, started_at FROM runs ORDER BY id DESC LIMIT ?', (limit,))
+
+    def latest_run(self, offset: int = 0) -> Optional[int]:
+        rows = self._query('SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?', (offset,))
+        return rows[0]['id'] if rows else None
+
+    def results(self, run_id: int) -> List[Dict[str, Any]]:
+        return self._query('SELECT name, group_key, status, passed, latency, digest, error, shape '
+                           'FROM results WHERE run_id = ? ORDER BY group_key, name', (run_id,))
+
+    def failures(self, run_id: int) -> List[Dict[str, Any]]:
+        return self._query('SELECT name, group_key, status, latency, error FROM results '
+                           'WHERE run_id = ? AND passed = 0 ORDER BY group_key, name', (run_id,))
+
+    def slowest(self, run_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        按分组统计平均耗时与最大耗时，返回最慢的接口
+        :param run_id:
+        :param limit:
+        :return:
+        """
+        return self._query('SELECT group_key, COUNT(*) AS total, AVG(latency) AS avg_latency, '
+                           'MAX(latency) AS max_latency FROM results WHERE run_id = ? '
+                           'GROUP BY group_key ORDER BY avg_latency DESC LIMIT ?', (run_id, limit))
+
+    def delta(self, run_id: int, base_run_id: int) -> List[Dict[str, Any]]:
+        """
+        对比两次执行中同一分组同名用例的结果，返回通过状态、状态码或响应摘要发生变化的用例，
+        用例名称在不同分组（以及同一接口模板的不同版本）之间会重复，需要同时按分组标识关联
+        :param run_id:
+        :param base_run_id:
+        :return:
+        """
+        return self._query('SELECT c.name, c.group_key, b.passed AS base_passed, c.passed, '
+                           'b.status AS base_status, c.status, b.latency AS base_latency, c.latency '
+                           'FROM results c JOIN results b ON b.group_key = c.group_key AND b.name = c.name AND b.run_id = ? '
+                           'WHERE c.run_id = ? AND (b.passed != c.passed OR b.status IS NOT c.status '
+                           'OR b.digest IS NOT c.digest) ORDER BY c.group_key, c.name', (base_run_id, run_id))
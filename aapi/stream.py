@@ -0,0 +1,110 @@
+import json
+from typing import (
+    IO,
+    Iterator,
+    Sequence,
+    Any
+)
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonArrayReader(object):
+    """
+    流式读取 json 文件中的数组，按路径定位到数组后逐个返回元素，
+    内存占用只与单个元素的大小有关
+    """
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, fp: IO[str], chunk_size: int = CHUNK_SIZE):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: int = None) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fp.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        # 丢弃已经消费的内容
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError('unexpected end of json stream')
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError("expect '{expect}' but found '{found}' in json stream".format(expect=char, found=found))
+        self._pos += 1
+
+    def _decode(self) -> Any:
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # 数字等值位于缓冲区末尾时可能被截断，需要读取更多内容确认
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # 单个值跨越多个分块时成倍扩大读取量，避免反复解析
+            self._fill(size)
+            size *= 2
+
+    def _find_key(self, key: str):
+        self._expect('{')
+        while True:
+            if self._peek() == '}':
+                raise KeyError("can't found key {} in json stream".format(key))
+            name = self._decode()
+            self._expect(':')
+            if name == key:
+                return
+            self._decode()
+            if self._peek() == ',':
+                self._pos += 1
+
+    def iter_array(self, path: Sequence[str] = ()) -> Iterator[Any]:
+        """
+        :param path: 数组所在的键路径，例如 har 文件为 ('log', 'entries')，为空时根节点即数组
+        :return:
+        """
+        for key in path:
+            self._find_key(key)
+        self._expect('[')
+        while True:
+            if self._peek() == ']':
+                return
+            yield self._decode()
+            if self._peek() == ',':
+                self._pos += 1
+
+
+def iter_json_array(fp: IO[str], path: Sequence[str] = ()) -> Iterator[Any]:
+    return JsonArrayReader(fp).iter_array(path)
+
+
+def iter_har_entries(fp: IO[str]) -> Iterator[Any]:
+    """
+    流式读取 .har 文件中的 log.entries
+    :param fp:
+    :return:
+    """
+    return iter_json_array(fp, ('log', 'entries'))
@@ -0,0 +1,134 @@
+import time
+from types import SimpleNamespace
+from typing import (
+    Dict,
+    Optional
+)
+
+import aiohttp
+
+from aapi.runner import LatencyHistogram
+
+
+class PhaseStats(object):
+    """
+    分组内请求各阶段的耗时统计，单位毫秒，可以在多个进程之间合并。
+    queue 为等待连接池空闲连接，connect 包含 TCP 连接与 TLS 握手（不含 dns），
+    ttfb 为连接可用到收到响应头，transfer 为读取响应体
+    """
+    PHASES = ('queue', 'dns', 'connect', 'ttfb', 'transfer')
+
+    def __init__(self):
+        self.requests = 0
+        self.reused = 0
+        self.created = 0
+        self.totals = {phase: 0.0 for phase in self.PHASES}
+        self.histograms = {phase: LatencyHistogram() for phase in self.PHASES}
+
+    def record(self, phases: Dict[str, float], reused: bool):
+        self.requests += 1
+        if reused:
+            self.reused += 1
+        elif phases['connect'] or phases['dns']:
+            self.created += 1
+        for phase, value in phases.items():
+            self.totals[phase] += value
+            self.histograms[phase].record(value)
+
+    def merge(self, other: 'PhaseStats'):
+        self.requests += other.requests
+        self.reused += other.reused
+        self.created += other.created
+        for phase in self.PHASES:
+            self.totals[phase] += other.totals[phase]
+            self.histograms[phase].merge(other.histograms[phase])
+
+    def mean(self, phase: str) -> float:
+        return self.totals[phase] / self.requests if self.requests else 0.0
+
+    @property
+    def reuse_rate(self) -> float:
+        """
+        连接复用率，复用的连接占复用与新建连接总数的比例
+        :return:
+        """
+        connections = self.reused + self.created
+        return self.reused / connections if connections else 0.0
+
+
+class RequestTracer(object):
+    """
+    基于 aiohttp TraceConfig 记录每个请求的各阶段耗时，并按分组汇总。
+    每个请求通过 trace_request_ctx 传入一个记录时间点的上下文，回调中只记录时间点，
+    响应体读取完成后由 finish 计算各阶段耗时
+    """
+
+    def __init__(self):
+        self._groups = {}
+
+    @property
+    def groups(self) -> Dict[str, PhaseStats]:
+        return self._groups
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._mark('start', first=True))
+        trace_config.on_connection_queued_start.append(self._mark('queue_start'))
+        trace_config.on_connection_queued_end.append(self._mark('queue_end'))
+        trace_config.on_connection_create_start.append(self._mark('connect_start'))
+        trace_config.on_connection_create_end.append(self._mark('connect_end'))
+        trace_config.on_dns_resolvehost_start.append(self._mark('dns_start'))
+        trace_config.on_dns_resolvehost_end.append(self._mark('dns_end'))
+        trace_config.on_connection_reuseconn.append(self._mark('reused'))
+        trace_config.on_request_end.append(self._mark('headers'))
+        return trace_config
+
+    @staticmethod
+    def _mark(name: str, first: bool = False):
+        async def on_event(session, trace_config_ctx, params):
+            ctx = trace_config_ctx.trace_request_ctx
+            # 重定向时保留第一次请求的开始时间
+            if ctx is not None and not (first and name in ctx.times):
+                ctx.times[name] = time.perf_counter()
+
+        return on_event
+
+    @staticmethod
+    def start(group: str) -> SimpleNamespace:
+        return SimpleNamespace(group=group, times={})
+
+    def finish(self, ctx: Optional[SimpleNamespace]):
+        """
+        响应体读取完成后调用，计算并记录各阶段耗时
+        :param ctx: start 的返回值
+        :return:
+        """
+        if ctx is None:
+            return
+        times = ctx.times
+        ended = time.perf_counter()
+        start = times.get('start')
+        headers = times.get('headers')
+        if start is None or headers is None:
+            return
+
+        def span(begin: str, end: str) -> float:
+            if begin not in times or end not in times:
+                return 0.0
+            return max(times[end] - times[begin], 0.0) * 1000
+
+        dns = span('dns_start', 'dns_end')
+        phases = {
+            'queue': span('queue_start', 'queue_end'),
+            'dns': dns,
+            # 新建连接的过程包含 dns 解析
+            'connect': max(span('connect_start', 'connect_end') - dns, 0.0),
+        }
+        ready = max([times[k] for k in ('start', 'queue_end', 'connect_end') if k in times])
+        phases['ttfb'] = max(headers - ready, 0.0) * 1000
+        phases['transfer'] = max(ended - headers, 0.0) * 1000
+
+        stats = self._groups.get(ctx.group)
+        if stats is None:
+            stats = self._groups[ctx.group] = PhaseStats()
+        stats.record(phases, 'reused' in times)
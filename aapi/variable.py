@@ -0,0 +1,352 @@
+import hashlib
+import hmac
+import importlib
+import json
+import os
+import re
+import time
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    List,
+    Dict,
+    Tuple,
+    Optional,
+    Any
+)
+
+from aapi.pipeline import open_file
+
+if TYPE_CHECKING:
+    from aapi.parser import RequestCase
+
+VARIABLE_PATTERN = re.compile(r'{{\s*([\w.$-]+)\s*}}')
+
+
+class VariableTemplate(object):
+    """
+    包含 {{var}} 占位符的字符串模板，编译一次后重复渲染，
+    渲染时未定义的变量保留原占位符
+    """
+
+    def __init__(self, text: str):
+        self._text = text
+        self._parts = []
+        position = 0
+        for match in VARIABLE_PATTERN.finditer(text):
+            if match.start() > position:
+                self._parts.append((False, text[position:match.start()]))
+            self._parts.append((True, match.group(1)))
+            position = match.end()
+        if position < len(text):
+            self._parts.append((False, text[position:]))
+
+        # 整个字符串就是一个变量时，渲染结果保留变量值的原始类型
+        self._single = len(self._parts) == 1 and self._parts[0][0]
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def names(self) -> List[str]:
+        """
+        模板中引用的变量名
+        :return:
+        """
+        return [value for is_name, value in self._parts if is_name]
+
+    def render(self, variables: Dict[str, Any]) -> Any:
+        if self._single:
+            name = self._parts[0][1]
+            return variables[name] if name in variables else self._text
+        return ''.join([
+            (str(variables[value]) if value in variables else '{{%s}}' % value) if is_name else value
+            for is_name, value in self._parts])
+
+
+def compile_value(value: Any) -> Callable[[Dict[str, Any]], Any]:
+    """
+    将字符串、字典、列表等结构编译为渲染函数，不含变量的部分直接返回原值
+    :param value:
+    :return: 签名为 (variables) -> Any 的渲染函数
+    """
+    if isinstance(value, str):
+        if '{{' not in value:
+            return lambda variables: value
+        return VariableTemplate(value).render
+
+    if isinstance(value, dict):
+        items = [(compile_value(k), compile_value(v)) for k, v in value.items()]
+        return lambda variables: {k(variables): v(variables) for k, v in items}
+
+    if isinstance(value, list):
+        items = [compile_value(v) for v in value]
+        return lambda variables: [v(variables) for v in items]
+
+    return lambda variables: value
+
+
+class PreparedRequest(object):
+    """
+    变量解析完成、可以直接发送的请求
+    """
+
+    def __init__(self, method: str, url: str, headers: Dict, params: List[Tuple[str, str]], data: Any = None):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.params = params
+        self.data = data
+
+
+class CompiledRequest(object):
+    """
+    编译后的请求，url、请求头、query、参数以及请求体只编译一次，发送时直接渲染
+    """
+
+    def __init__(self, case: 'RequestCase'):
+        self._case = case
+        self._url = compile_value('{host}{api}'.format(host=case.host, api=case.uri))
+        self._headers = compile_value(case.headers or {})
+        self._query = compile_value(case.query or {})
+        self._params = compile_value(case.params or {})
+        self._body = compile_value(case.body.data) if case.body is not None else None
+
+    @property
+    def case(self) -> 'RequestCase':
+        return self._case
+
+    def render_url(self, variables: Dict[str, Any]) -> str:
+        return self._url(variables)
+
+    def render_headers(self, variables: Dict[str, Any]) -> Dict[str, str]:
+        """
+        渲染请求头，变量值（例如时间戳）转为字符串
+        :param variables:
+        :return:
+        """
+        return {str(k): v if isinstance(v, str) else str(v) for k, v in self._headers(variables).items()}
+
+    def render_params(self, variables: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """
+        渲染 query 与参数化的 params，合并为发送时的 url 参数
+        :param variables:
+        :return:
+        """
+        params = [(k, str(v)) for k, v in self._query(variables).items()]
+        params.extend([(k, v if isinstance(v, str) else json.dumps(v)) for k, v in self._params(variables).items()])
+        return params
+
+    def render_body(self, variables: Dict[str, Any]) -> Any:
+        """
+        渲染请求体，raw 类型返回 json 字符串，表单类型返回字典
+        :param variables:
+        :return:
+        """
+        if self._body is None:
+            return None
+        # 延迟导入，parser 模块依赖本模块
+        from aapi.parser import RequestType
+        data = self._body(variables)
+        if self._case.body.mode == RequestType.RAW:
+            return json.dumps(data)
+        return {k: v if isinstance(v, str) else json.dumps(v) for k, v in data.items()}
+
+    def prepare(self, variables: Dict[str, Any]) -> PreparedRequest:
+        return PreparedRequest(
+            method=self._case.method,
+            url=self.render_url(variables),
+            headers=self.render_headers(variables),
+            params=self.render_params(variables),
+            data=self.render_body(variables)
+        )
+
+
+def timestamp_hook(unit: str = 'ms') -> Callable[[Dict[str, Any], CompiledRequest], Any]:
+    """
+    时间戳变量
+    :param unit: {s, ms}
+    :return:
+    """
+    if unit not in ['s', 'ms']:
+        raise ValueError("timestamp unit choice from {s, ms}")
+    if unit == 's':
+        return lambda variables, request: int(time.time())
+    return lambda variables, request: int(time.time() * 1000)
+
+
+class HmacSignHook(object):
+    """
+    hmac 签名变量，按参数名排序后拼接为 k=v&k=v 进行签名，签名参数自身不参与签名
+    """
+
+    def __init__(self, secret: str, param: str = 'sign', algorithm: str = 'sha256',
+                 with_body: bool = False, upper: bool = True):
+        """
+        :param secret: 保存签名密钥的变量名
+        :param param: 签名所在的参数名
+        :param algorithm: hashlib 支持的摘要算法
+        :param with_body: raw 请求体是否追加到签名内容
+        :param upper: 签名是否转为大写
+        """
+        if algorithm not in hashlib.algorithms_available:
+            raise ValueError("unknown hmac algorithm: {}".format(algorithm))
+        self._secret = secret
+        self._param = param
+        self._algorithm = algorithm
+        self._with_body = with_body
+        self._upper = upper
+
+    def __call__(self, variables: Dict[str, Any], request: CompiledRequest) -> str:
+        secret = variables.get(self._secret)
+        if secret is None:
+            raise ValueError("sign secret variable {} not defined".format(self._secret))
+
+        params = sorted([(k, v) for k, v in request.render_params(variables) if k != self._param])
+        content = '&'.join(['{k}={v}'.format(k=k, v=v) for k, v in params])
+        if self._with_body:
+            body = request.render_body(variables)
+            if isinstance(body, str):
+                content += body
+        sign = hmac.new(str(secret).encode('utf-8'), content.encode('utf-8'), self._algorithm).hexdigest()
+        return sign.upper() if self._upper else sign
+
+
+def import_hook(path: str) -> Callable[[Dict[str, Any], CompiledRequest], Any]:
+    """
+    按 module:function 的格式载入 python 函数作为变量钩子
+    :param path:
+    :return:
+    """
+    module_name, _, function_name = path.partition(':')
+    if not function_name:
+        raise ValueError("hook function path must be module:function, got: {}".format(path))
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class VariableEngine(object):
+    """
+    变量引擎，变量值来源于环境文件以及 python 钩子函数，
+    钩子在发送前按注册顺序执行，可以替代 postman 的 prerequest 脚本
+    """
+
+    def __init__(self, variables: Dict[str, Any] = None):
+        self._variables = dict(variables or {})
+        self._hooks = []
+
+    @property
+    def variables(self) -> Dict[str, Any]:
+        return self._variables
+
+    @property
+    def hook_names(self) -> List[str]:
+        return [name for name, _ in self._hooks]
+
+    def register(self, name: str, hook: Callable[[Dict[str, Any], CompiledRequest], Any]):
+        """
+        注册钩子函数，钩子的返回值作为变量 name 的值
+        :param name:
+        :param hook: 签名为 (variables, request) -> Any，variables 中包含之前钩子的结果
+        :return:
+        """
+        self._hooks = [(n, h) for n, h in self._hooks if n != name]
+        self._hooks.append((name, hook))
+
+    def hook(self, name: str):
+        """
+        注册钩子的装饰器
+        :param name:
+        :return:
+        """
+        def decorator(func):
+            self.register(name, func)
+            return func
+
+        return decorator
+
+    def compile(self, case: 'RequestCase') -> CompiledRequest:
+        return CompiledRequest(case)
+
+    def resolve(self, request: CompiledRequest) -> PreparedRequest:
+        """
+        执行钩子并渲染请求
+        :param request:
+        :return:
+        """
+        if not self._hooks:
+            return request.prepare(self._variables)
+        variables = dict(self._variables)
+        for name, hook in self._hooks:
+            variables[name] = hook(variables, request)
+        return request.prepare(variables)
+
+    @staticmethod
+    def create_hook(name: str, config: Dict) -> Callable[[Dict[str, Any], CompiledRequest], Any]:
+        """
+        根据环境文件中的钩子配置创建钩子
+        :param name:
+        :param config:
+        :return:
+        """
+        hook_type = config.get('type')
+        if hook_type == 'timestamp':
+            return timestamp_hook(config.get('unit', 'ms'))
+        if hook_type == 'hmac':
+            return HmacSignHook(secret=config['secret'],
+                                param=config.get('param', name),
+                                algorithm=config.get('algorithm', 'sha256'),
+                                with_body=config.get('with_body', False),
+                                upper=config.get('upper', True))
+        if hook_type == 'python':
+            return import_hook(config['function'])
+        raise ValueError("unknown hook type {type} of variable {name}".format(type=hook_type, name=name))
+
+    @classmethod
+    def load(cls, file_path: Optional[str]) -> 'VariableEngine':
+        """
+        从环境文件创建变量引擎，支持 postman 导出的环境文件以及普通 json 对象，
+        普通 json 对象中的 hooks 字段用于配置钩子
+        :param file_path:
+        :return:
+        """
+        if file_path is None:
+            return cls()
+
+        with open_file(file_path) as f:
+            data = json.load(f)
+
+        if isinstance(data.get('values'), list):
+            return cls({v['key']: v['value'] for v in data['values'] if v.get('enabled', True)})
+
+        hooks = data.pop('hooks', {})
+        engine = cls(data)
+        for name, config in hooks.items():
+            engine.register(name, cls.create_hook(name, config))
+        return engine
+
+
+def load_environments(file_path: str, names: List[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    载入多环境文件，格式为 {环境名称: 变量}，变量可以是 json 对象，
+    也可以是相对于多环境文件的环境文件路径（格式同 VariableEngine.load），钩子不参与替换
+    :param file_path:
+    :param names: 只载入指定的环境，按给定的顺序返回
+    :return:
+    """
+    with open_file(file_path) as f:
+        data = json.load(f)
+
+    if names is None:
+        names = list(data)
+    missing = [name for name in names if name not in data]
+    if missing:
+        raise KeyError("environments {} not found in {}".format(', '.join(missing), file_path))
+
+    environments = {}
+    for name in names:
+        value = data[name]
+        if isinstance(value, str):
+            value = VariableEngine.load(os.path.join(os.path.dirname(file_path), value)).variables
+        environments[name] = {k: v for k, v in value.items() if k != 'hooks'}
+    return environments
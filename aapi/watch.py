@@ -0,0 +1,250 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from abc import abstractmethod
+from typing import (
+    List,
+    Dict,
+    Set,
+    Tuple
+)
+
+from aapi.creator import PostmanCreator
+from aapi.parser import ApiParser
+from aapi.pipeline import split_compression
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_template(path: str) -> bool:
+    return split_compression(path)[0].endswith('.json')
+
+
+class TemplateWatcher(object):
+    """
+    模板文件夹监听抽象类，wait 返回去抖后发生变化的模板文件
+    """
+
+    def __init__(self, dir_url: str, debounce: float = 0.2):
+        self._dir_url = dir_url
+        self._debounce = debounce
+
+    @abstractmethod
+    def wait(self) -> Set[str]:
+        pass
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(TemplateWatcher):
+    """
+    轮询文件的修改时间与大小，不支持 inotify 的平台使用
+    """
+
+    def __init__(self, dir_url: str, debounce: float = 0.2, interval: float = 0.5):
+        super().__init__(dir_url, debounce)
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for root, _, files in os.walk(self._dir_url):
+            for name in files:
+                path = os.path.join(root, name)
+                if not is_template(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _diff(self) -> Set[str]:
+        snapshot = self._scan()
+        changed = {p for p in set(snapshot) | set(self._snapshot) if snapshot.get(p) != self._snapshot.get(p)}
+        self._snapshot = snapshot
+        return changed
+
+    def wait(self) -> Set[str]:
+        changed = set()
+        while True:
+            time.sleep(self._interval if not changed else self._debounce)
+            found = self._diff()
+            if not found and changed:
+                return changed
+            changed |= found
+
+
+class InotifyWatcher(TemplateWatcher):
+    """
+    基于 linux inotify 的监听，递归监听所有子文件夹
+    """
+
+    def __init__(self, dir_url: str, debounce: float = 0.2):
+        super().__init__(dir_url, debounce)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = {}
+        for root, _, _ in os.walk(dir_url):
+            self._add_watch(root)
+
+    def _add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed: {}'.format(path))
+        self._watches[wd] = path
+
+    def _read_events(self) -> Set[str]:
+        changed = set()
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            parent = self._watches.get(wd)
+            if parent is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                del self._watches[wd]
+                continue
+
+            path = os.path.join(parent, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新建的文件夹需要补充监听，并且其中已有的模板视为变化
+                    for root, _, files in os.walk(path):
+                        self._add_watch(root)
+                        changed.update([os.path.join(root, f) for f in files if is_template(f)])
+                continue
+            if is_template(path):
+                changed.add(path)
+        return changed
+
+    def wait(self) -> Set[str]:
+        changed = set()
+        while True:
+            readable, _, _ = select.select([self._fd], [], [], self._debounce if changed else None)
+            if not readable and changed:
+                return changed
+            changed |= self._read_events()
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(dir_url: str, debounce: float = 0.2) -> TemplateWatcher:
+    """
+    优先使用 inotify，不可用时退化为轮询
+    :param dir_url:
+    :param debounce: 去抖时间，单位秒
+    :return:
+    """
+    try:
+        return InotifyWatcher(dir_url, debounce)
+    except (OSError, AttributeError, TypeError):
+        logging.info('%s-%s', 'Watch', 'inotify not available, fallback to polling')
+        return PollingWatcher(dir_url, debounce)
+
+
+class IncrementalPostmanBuilder(object):
+    """
+    增量生成 postman 集合，按模板文件缓存分组标识与序列化后的分组片段，
+    模板变化时只重新展开并序列化发生变化的文件，其余片段直接拼接
+    """
+
+    def __init__(self, parser: ApiParser, creator: PostmanCreator):
+        self._parser = parser
+        self._creator = creator
+        self._prerequest = None
+        # 模板文件 -> (分组标识, 分组片段)
+        self._fragments = {}
+
+    def _load(self, path: str) -> bool:
+        try:
+            group_key, cases = self._parser.parse_file(path)
+        except (ValueError, KeyError, TypeError) as e:
+            # 编辑过程中的模板可能暂时不完整，保留上一次的结果
+            logging.error('%s-%s', 'Watch', '{}: {}'.format(path, e))
+            return False
+
+        if group_key == 'prerequest':
+            self._prerequest = cases
+            return True
+        cached = self._fragments.get(path)
+        if cached is not None and cached[0] == group_key:
+            return False
+        self._fragments[path] = (group_key, self._creator.dump_group(group_key, cases))
+        return True
+
+    def build(self):
+        for path in self._parser.get_all_files():
+            self._load(path)
+        self._write()
+
+    def apply(self, paths: Set[str]) -> int:
+        """
+        应用发生变化的模板文件，返回实际变化的分组数量
+        :param paths:
+        :return:
+        """
+        changed = 0
+        for path in sorted(paths):
+            if os.path.exists(path):
+                changed += self._load(path)
+                continue
+            if self._parser.is_prerequest(path):
+                self._prerequest = None
+                changed += 1
+            elif self._fragments.pop(path, None) is not None:
+                changed += 1
+        if changed:
+            self._write()
+        return changed
+
+    def _sort_key(self, path: str) -> List[str]:
+        # 按路径层级排序，与 ApiParser.get_all_files 的遍历顺序一致
+        return os.path.relpath(path, self._parser.dir_url).split(os.sep)
+
+    def _write(self):
+        fragments = [self._fragments[path][1] for path in sorted(self._fragments, key=self._sort_key)]
+        self._creator.write_fragments(self._creator.create_events(self._prerequest), fragments)
+
+    def watch(self, watcher: TemplateWatcher):
+        self.build()
+        logging.info('%s-%s', 'Watch', 'watching templates, press ctrl+c to stop')
+        try:
+            while True:
+                paths = watcher.wait()
+                started = time.perf_counter()
+                changed = self.apply(paths)
+                logging.info('%s-%s', 'Watch', '{changed} groups regenerated in {elapsed:.3f}s'.format(
+                    changed=changed, elapsed=time.perf_counter() - started))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
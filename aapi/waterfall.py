@@ -0,0 +1,324 @@
+import bisect
+import json
+import logging
+import re
+from typing import (
+    List,
+    Dict,
+    Optional,
+    Any
+)
+from urllib.parse import urlparse
+
+from aapi.pipeline import open_file
+from aapi.replay import parse_started_time
+from aapi.runner import LatencyHistogram
+from aapi.stream import iter_har_entries
+
+# har 中 timings 的各阶段，connect 包含 ssl
+TIMING_PHASES = ('blocked', 'dns', 'connect', 'ssl', 'send', 'wait', 'receive')
+# 纯数字、uuid 以及较长的十六进制路径段视为资源编号
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}|[0-9a-fA-F]{16,})$')
+
+
+def endpoint_key(method: str, url: str) -> str:
+    """
+    接口标识，请求方法加上路径，路径中的资源编号替换为 {id}
+    :param method:
+    :param url:
+    :return:
+    """
+    url_parse = urlparse(url)
+    segments = ['{id}' if ID_SEGMENT.match(s) else s for s in url_parse.path.split('/') if s]
+    return '{method} {host}/{path}'.format(method=method.upper(), host=url_parse.netloc, path='/'.join(segments))
+
+
+class HarRequest(object):
+    """
+    瀑布图中的一个请求，只保留分析需要的字段，时间单位为毫秒
+    """
+    __slots__ = ('index', 'method', 'url', 'endpoint', 'status', 'start', 'duration', 'timings')
+
+    def __init__(self, index: int, method: str, url: str, status: Optional[int], start: float, duration: float,
+                 timings: Dict[str, float]):
+        self.index = index
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint_key(method, url)
+        self.status = status
+        self.start = start
+        self.duration = duration
+        # 各阶段耗时，只包含 har 中记录的阶段
+        self.timings = timings
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+    @classmethod
+    def from_entry(cls, index: int, entry: Dict) -> 'HarRequest':
+        timings = entry.get('timings') or {}
+        # -1 表示该阶段不适用，没有 timings 的请求各阶段为空
+        phases = {phase: max(float(timings[phase] or 0), 0.0) for phase in TIMING_PHASES if phase in timings}
+        duration = entry.get('time')
+        if duration is None or duration < 0:
+            duration = sum(v for k, v in phases.items() if k != 'ssl')
+        request = entry['request']
+        return cls(index=index, method=request['method'], url=request['url'],
+                   status=(entry.get('response') or {}).get('status'),
+                   start=parse_started_time(entry['startedDateTime']) * 1000,
+                   duration=float(duration), timings=phases)
+
+
+class WaterfallReport(object):
+    """
+    har 请求瀑布图分析结果，包括关键路径、按接口统计的耗时分位数以及可以并行的串行请求
+    """
+    # 终端摘要中显示的行数，完整内容在 json 报告中
+    SLOWEST_ENDPOINTS = 10
+    TOP_SERIALIZED = 5
+    CRITICAL_LINES = 20
+    CHAIN_ENDPOINTS = 5
+
+    def __init__(self, requests: List[HarRequest], critical_path: List[HarRequest],
+                 serialized: List[List[HarRequest]]):
+        """
+        :param requests: 按开始时间排序的请求
+        :param critical_path: 关键路径上的请求，按时间顺序
+        :param serialized: 串行发出的请求链
+        """
+        self._requests = requests
+        self._critical_path = critical_path
+        self._serialized = serialized
+        self._origin = requests[0].start if requests else 0.0
+        self._endpoints = {}
+        for request in requests:
+            stats = self._endpoints.get(request.endpoint)
+            if stats is None:
+                stats = self._endpoints[request.endpoint] = {'total': LatencyHistogram(),
+                                                             'wait': LatencyHistogram(), 'sum': 0.0}
+            stats['total'].record(request.duration)
+            if 'wait' in request.timings:
+                stats['wait'].record(request.timings['wait'])
+            stats['sum'] += request.duration
+
+    @property
+    def requests(self) -> List[HarRequest]:
+        return self._requests
+
+    @property
+    def critical_path(self) -> List[HarRequest]:
+        return self._critical_path
+
+    @property
+    def serialized(self) -> List[List[HarRequest]]:
+        return self._serialized
+
+    @property
+    def duration(self) -> float:
+        """
+        第一个请求开始到最后一个请求结束的时间
+        :return:
+        """
+        if not self._requests:
+            return 0.0
+        return max(r.end for r in self._requests) - self._origin
+
+    def endpoints(self) -> List[Dict[str, Any]]:
+        """
+        按接口统计的耗时分位数，按总耗时降序
+        :return:
+        """
+        rows = []
+        for endpoint, stats in sorted(self._endpoints.items(), key=lambda i: -i[1]['sum']):
+            total = stats['total']
+            rows.append({
+                'endpoint': endpoint,
+                'count': total.count,
+                'sum': round(stats['sum'], 3),
+                'p50': round(total.percentile(50), 3),
+                'p90': round(total.percentile(90), 3),
+                'p99': round(total.percentile(99), 3),
+                'max': round(total.percentile(100), 3),
+                'wait_p50': round(stats['wait'].percentile(50), 3),
+                'wait_p99': round(stats['wait'].percentile(99), 3),
+            })
+        return rows
+
+    @staticmethod
+    def chain_saving(chain: List[HarRequest]) -> float:
+        """
+        串行请求改为并行后节省的时间
+        :param chain:
+        :return:
+        """
+        return chain[-1].end - chain[0].start - max(r.duration for r in chain)
+
+    def _critical_segments(self) -> List[Dict[str, Any]]:
+        segments = []
+        previous = None
+        for request in self._critical_path:
+            segments.append({
+                'index': request.index,
+                'method': request.method,
+                'url': request.url,
+                'start': round(request.start - self._origin, 3),
+                'duration': round(request.duration, 3),
+                # 前一个请求结束到该请求开始之间的空闲，一般为客户端处理时间
+                'gap': round(request.start - previous.end, 3) if previous is not None else 0.0,
+            })
+            previous = request
+        return segments
+
+    def to_json(self) -> Dict[str, Any]:
+        path = self._critical_path
+        network = sum(r.duration for r in path)
+        span = path[-1].end - path[0].start if path else 0.0
+        return {
+            'entries': len(self._requests),
+            'duration': round(self.duration, 3),
+            'waterfall': [{
+                'index': r.index,
+                'method': r.method,
+                'url': r.url,
+                'status': r.status,
+                'start': round(r.start - self._origin, 3),
+                'duration': round(r.duration, 3),
+                'timings': {k: round(v, 3) for k, v in r.timings.items()},
+            } for r in self._requests],
+            'critical_path': {
+                'duration': round(span, 3),
+                'network': round(network, 3),
+                'idle': round(span - network, 3),
+                'requests': self._critical_segments(),
+            },
+            'endpoints': self.endpoints(),
+            'serialized': [{
+                'requests': [r.index for r in chain],
+                'urls': [r.url for r in chain],
+                'duration': round(chain[-1].end - chain[0].start, 3),
+                'saving': round(self.chain_saving(chain), 3),
+            } for chain in sorted(self._serialized, key=lambda c: -self.chain_saving(c))],
+        }
+
+    def save(self, file_path: str):
+        with open_file(file_path, 'w') as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+    def __str__(self):
+        path = self._critical_path
+        network = sum(r.duration for r in path)
+        span = path[-1].end - path[0].start if path else 0.0
+        lines = ['entries: {entries}, duration: {duration:.1f}ms'.format(
+            entries=len(self._requests), duration=self.duration)]
+        lines.append('critical path: {count} requests, {span:.1f}ms, network {network:.1f}ms, idle {idle:.1f}ms'
+                     .format(count=len(path), span=span, network=network, idle=span - network))
+        segments = self._critical_segments()
+        for segment in segments[:self.CRITICAL_LINES]:
+            lines.append('  +{start:.1f}ms {duration:.1f}ms (gap {gap:.1f}ms) {method} {url}'.format(**segment))
+        if len(segments) > self.CRITICAL_LINES:
+            lines.append('  ... {} more'.format(len(segments) - self.CRITICAL_LINES))
+        lines.append('slowest endpoints:')
+        for row in self.endpoints()[:self.SLOWEST_ENDPOINTS]:
+            lines.append('  {endpoint}: {count} requests, p50 {p50:.1f}ms, p90 {p90:.1f}ms, p99 {p99:.1f}ms, '
+                         'wait p50 {wait_p50:.1f}ms'.format(**row))
+        chains = sorted(self._serialized, key=lambda c: -self.chain_saving(c))
+        lines.append('serialized chains: {}'.format(len(chains)))
+        for chain in chains[:self.TOP_SERIALIZED]:
+            endpoints = [r.endpoint for r in chain[:self.CHAIN_ENDPOINTS]]
+            if len(chain) > self.CHAIN_ENDPOINTS:
+                endpoints.append('...')
+            lines.append('  {count} requests could save {saving:.1f}ms: {urls}'.format(
+                count=len(chain), saving=self.chain_saving(chain), urls=' -> '.join(endpoints)))
+        return '\n'.join(lines)
+
+
+class HarAnalyzer(object):
+    """
+    流式读取 .har 文件，还原请求瀑布图并分析。
+    关键路径从最后结束的请求开始，每次回溯到在其开始之前最后结束的请求，即最可能触发它的请求；
+    一个请求在前一个请求结束后 serial_gap 毫秒内开始、且开始时没有其他请求在进行，视为串行发出。
+    har 中没有请求之间的数据依赖，串行请求链只是可以并行的候选
+    """
+    SERIAL_GAP = 50.0
+
+    def __init__(self, file_path: str, serial_gap: float = SERIAL_GAP):
+        """
+        :param file_path: .har 文件，支持压缩文件
+        :param serial_gap: 判断串行请求的最大间隔，单位毫秒
+        """
+        self._file_path = file_path
+        self._serial_gap = serial_gap
+
+    def load(self) -> List[HarRequest]:
+        requests = []
+        with open_file(self._file_path) as har_file:
+            for index, entry in enumerate(iter_har_entries(har_file)):
+                try:
+                    requests.append(HarRequest.from_entry(index, entry))
+                except (KeyError, ValueError, TypeError) as e:
+                    logging.info('%s-%s', 'Har Report', 'skip entry {}: {}'.format(index, e))
+        requests.sort(key=lambda r: (r.start, r.index))
+        return requests
+
+    @staticmethod
+    def _predecessors(requests: List[HarRequest]) -> List[Optional[HarRequest]]:
+        """
+        每个请求开始之前最后结束的请求
+        :param requests: 按开始时间排序
+        :return:
+        """
+        by_end = sorted(requests, key=lambda r: r.end)
+        ends = [r.end for r in by_end]
+        predecessors = []
+        for request in requests:
+            position = bisect.bisect_right(ends, request.start) - 1
+            # 耗时为 0 的请求结束时间等于开始时间，不能作为自己的前驱
+            while position >= 0 and by_end[position] is request:
+                position -= 1
+            predecessors.append(by_end[position] if position >= 0 else None)
+        return predecessors
+
+    @staticmethod
+    def critical_path(requests: List[HarRequest], predecessors: List[Optional[HarRequest]]) -> List[HarRequest]:
+        if not requests:
+            return []
+        positions = {id(r): i for i, r in enumerate(requests)}
+        request = max(requests, key=lambda r: (r.end, -r.start))
+        path = []
+        while request is not None:
+            path.append(request)
+            request = predecessors[positions[id(request)]]
+        path.reverse()
+        return path
+
+    def serialized_chains(self, requests: List[HarRequest],
+                          predecessors: List[Optional[HarRequest]]) -> List[List[HarRequest]]:
+        starts = [r.start for r in requests]
+        ends = sorted(r.end for r in requests)
+        following = {}
+        for request, previous in zip(requests, predecessors):
+            if previous is None or not 0 <= request.start - previous.end <= self._serial_gap:
+                continue
+            # 开始时仍在进行的请求数，不包含自身
+            in_flight = bisect.bisect_left(starts, request.start) - bisect.bisect_right(ends, request.start)
+            if in_flight == 0 and id(previous) not in following:
+                following[id(previous)] = request
+
+        chained = {id(r) for r in following.values()}
+        chains = []
+        for request in requests:
+            if id(request) in chained or id(request) not in following:
+                continue
+            chain = [request]
+            while id(chain[-1]) in following:
+                chain.append(following[id(chain[-1])])
+            chains.append(chain)
+        return chains
+
+    def analyze(self) -> WaterfallReport:
+        requests = self.load()
+        predecessors = self._predecessors(requests)
+        return WaterfallReport(requests, self.critical_path(requests, predecessors),
+                               self.serialized_chains(requests, predecessors))